@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.dbs.unit_of_work import Record  # noqa
+from src.utils.amount import SCALE  # noqa
+from src.dbs.state_store import POOL_KINDS  # noqa
+
+BLOCK_HEIGHT = 800000
+DEPLOYER = "bc1pdeployer0000000000000000000000000000000000000000000000000"
+HOLDER = "bc1pholder00000000000000000000000000000000000000000000000000000"
+RECEIVER = "bc1preceiver000000000000000000000000000000000000000000000000000"
+TICK = "orcx"
+TICK_ID = "700000"
+TOKEN_ID = f"{TICK}-{TICK_ID}"
+POOL_SIZE = 1000
+
+
+# inscription contents as found on chain, is_orc20 gets the raw string
+CONTENTS = {
+    "standard": '{"p":"orc-20","op":"send","tick":"orcx","id":"700000","amt":"1000","n":"12"}',
+    "trailing_comma": '{\n  "p": "orc-20",\n  "op": "mint",\n  "tick": "orcx",\n  "id": "700000",\n  "amt": "1,000",\n}',
+    "multi_json": 'mint {"p":"brc-20","op":"mint","tick":"ordi","amt":"1000"} '
+                  '{"p":"orc20","op":"mint","tick":"orcx","id":"700000","amt":"1000"}',
+    "not_orc20": '{"p":"brc-20","op":"transfer","tick":"ordi","amt":"1000"}',
+    "text": "gm " * 200,
+    "large_invalid": json.dumps({"p": "orc-20", "data": ["x" * 64] * 500}),
+}
+
+DEPLOY_CONTENT = {"p": "orc-20", "op": "deploy", "tick": "orcy", "name": "orc y",
+                  "max": "21,000,000", "lim": "1000", "dec": "8", "ug": "true", "v": "1", "msg": "deploy"}
+MINT_CONTENT = {"p": "orc-20", "op": "mint", "tick": TICK, "id": TICK_ID, "amt": "999.25"}
+SEND_CONTENT = {"p": "orc-20", "op": "send", "tick": TICK, "id": TICK_ID, "amt": "25", "n": "5000"}
+REMAINING_CONTENT = {"p": "orc-20", "op": "send", "tick": TICK, "id": TICK_ID, "n": "5001"}
+CANCEL_CONTENT = {"p": "orc-20", "op": "cancel", "tick": TICK, "id": TICK_ID, "n": str(list(range(990, 1000)))}
+UPGRADE_CONTENT = {"p": "orc-20", "op": "upgrade", "tick": TICK, "id": TICK_ID,
+                   "max": "42000000", "lim": "2000", "v": "2", "msg": "upgrade"}
+
+
+def event(event_id, content, kind="inscribe", from_address=HOLDER, to_address=HOLDER,
+          inscription_id=None, block_height=BLOCK_HEIGHT):
+    return Record({
+        "id": event_id,
+        "inscription_id": inscription_id or f"{event_id:064x}i0",
+        "inscription_number": 70000000 + event_id,
+        "block_height": block_height,
+        "event": kind,
+        "from": from_address,
+        "to": to_address,
+        "time": "1690000000",
+        "value": 546,
+        "content": json.dumps(content),
+        "spent": False,
+    })
+
+
+def token_row():
+    return {
+        "id": TOKEN_ID, "tick": TICK, "tick_id": TICK_ID, "name": "orc x",
+        "max": 21000000 * SCALE, "lim": 1000 * SCALE, "dec": 18, "ug": True, "wp": True,
+        "v": "1", "msg": "", "inscription_id": "f" * 64 + "i0",
+        "inscription_number": int(TICK_ID), "deployer": DEPLOYER, "deploy_time": 1680000000,
+        "minted": 1000000 * SCALE, "start_number": 700001, "end_number": None,
+        "start_time": 1680000001, "end_time": None, "upgrade_time": None,
+        "upgrade_pending": [upgrade_pending(i) for i in range(10)],
+        "upgrade_history": [],
+    }
+
+
+def upgrade_pending(i):
+    return {
+        "inscription_index": 100 + i, "inscription_time": "1690000000",
+        "inscription_block_height": BLOCK_HEIGHT - 1,
+        "inscription_id": f"{100 + i:064x}i0", "inscription_number": 70000100 + i,
+        "content": {"dec": 18, "v": "2", "msg": "upgrade", "ug": True},
+    }
+
+
+def pool_send(i):
+    return {"transaction_id": i, "inscription_id": f"{i:064x}i0", "nonce": i, "amt": SCALE}
+
+
+def pool_mint(i):
+    return {"transaction_id": i, "inscription_id": f"{i:064x}i0", "amt": SCALE}
+
+
+def balance_row(address, pools):
+    # the balance with its pools, split_pools separates them
+    row = {
+        "id": f"{address}-{TOKEN_ID}", "address": address, "tick": TICK, "tick_id": TICK_ID,
+        "inscription_id": "f" * 64 + "i0", "inscription_number": int(TICK_ID),
+        "balance": 100000 * SCALE, "available_balance": 100000 * SCALE,
+        "pending_send_pool": [], "available_send_pool": [], "sent_send_pool": [],
+        "received_send_pool": [], "received_mint_pool": [],
+    }
+    row.update(pools)
+    return row
+
+
+def split_pools(balance):
+    # (balance row, pool rows) of a `balance_row`
+    balance = dict(balance)
+    rows = []
+    for kind in POOL_KINDS:
+        for item in balance.pop(kind):
+            rows.append(dict(item, balance_id=balance["id"], kind=kind, seq=len(rows) + 1))
+    return balance, rows
+
+
+def holder_balance():
+    # a busy holder: large pools everywhere, the item looked up is the last one
+    return balance_row(HOLDER, {
+        "pending_send_pool": [pool_send(i) for i in range(POOL_SIZE)],
+        "available_send_pool": [pool_send(i) for i in range(POOL_SIZE, 2 * POOL_SIZE)],
+        "received_send_pool": [pool_send(i) for i in range(2 * POOL_SIZE, 3 * POOL_SIZE)],
+        "received_mint_pool": [pool_mint(i) for i in range(3 * POOL_SIZE, 4 * POOL_SIZE)],
+    })
+
+
+def remaining_balance():
+    # 100 pending sends, half of them already transferred
+    pending = [pool_send(i) for i in range(100)]
+    return balance_row(HOLDER, {
+        "balance": 1000000 * SCALE,
+        "pending_send_pool": pending,
+        "sent_send_pool": [dict(item, transaction_id=10000 + i) for i, item in enumerate(pending[:50])],
+        "available_send_pool": [pool_send(i) for i in range(100, 110)],
+    })
+
+
+def remaining_transactions():
+    # the transactions of the pools of `remaining_balance`
+    transactions = []
+    for i in list(range(110)) + [10000 + i for i in range(50)]:
+        transactions.append({
+            "id": i, "block_height": BLOCK_HEIGHT - 1, "inscription_id": f"{i:064x}i0",
+            "inscription_number": 70000000 + i, "method": "inscribe-send", "token_id": TOKEN_ID,
+            "quantity": SCALE, "from": HOLDER, "to": RECEIVER if i >= 10000 else HOLDER,
+            "time": "1690000000", "valid": True, "invalid_reason": None,
+        })
+    return transactions
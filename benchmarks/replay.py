@@ -0,0 +1,239 @@
+"""
+Replay recorded event rows through `Indexer.handle_block` against the
+in-memory helpers, no postgres or redis involved.
+
+    python benchmarks/replay.py record -s 787606 -e 790000 -o events.jsonl.gz
+    python benchmarks/replay.py run events.jsonl.gz -o replay.json
+
+`run` reports blocks/s, events/s, the per-block latency and a hash of the
+final token, balance, pool and transaction tables. Two revisions producing the
+same hash produced the same rows, `--expect` exits with 1 otherwise.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from loguru import logger
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.dbs.memory_helper import MemoryPgsqlHelper, MemoryRedisHelper  # noqa
+from src.dbs.sqlite_helper import SqlitePgsqlHelper  # noqa
+from src.dbs.unit_of_work import Record  # noqa
+from src.prefetcher import group_by_height  # noqa
+from src.snapshot import load_snapshot  # noqa
+
+
+async def record(db_version, start_height, end_height, output, range_size=100):
+    # dump the event rows of [start_height, end_height] from postgres
+    from src.dbs.pgsql_helper import PgsqlHelper
+
+    pgsql = PgsqlHelper(logger, db_version)
+    await pgsql.init()
+    count = 0
+    try:
+        with gzip.open(output, "wt") as f:
+            for height in range(start_height, end_height + 1, range_size):
+                events = await pgsql.get_event_by_block_range(
+                    height, min(height + range_size - 1, end_height))
+                if events is None:
+                    return False
+                for event in events:
+                    f.write(json.dumps({key: event[key] for key in event.keys()}) + "\n")
+                count += len(events)
+    finally:
+        await pgsql.close()
+    logger.info(f"record blocks: {start_height}-{end_height}, events: {count}")
+    return True
+
+
+def read_events(path):
+    with gzip.open(path, "rt") as f:
+        return [Record(json.loads(line)) for line in f]
+
+
+def load_into(pgsql, snapshot):
+    # start from the state of a snapshot, return its height
+    header, tokens, balances, pools, transactions = load_snapshot(snapshot)
+    for token in tokens:
+        pgsql.insert_row(pgsql.token, token)
+    for balance in balances:
+        pgsql.insert_row(pgsql.balance, balance)
+    for item in pools:
+        pgsql.insert_pool_row(item)
+    for transaction in transactions:
+        pgsql.insert_row(pgsql.transaction, transaction)
+    pgsql.rows[pgsql.cursor.name][pgsql.cursor_id] = Record(
+        id=pgsql.cursor_id, block_height=header["block_height"], event_id=header.get("event_id"))
+    return header["block_height"]
+
+
+def table_hash(rows):
+    digest = hashlib.sha256()
+    for row_id in sorted(rows):
+        digest.update(json.dumps(rows[row_id], sort_keys=True,
+                                 separators=(",", ":"), default=str).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def state_hash(pgsql):
+    """
+    Hash every row of the token, balance, pool and transaction tables in key order,
+    return the hash of them all and the hash and row count of each table.
+    """
+    tables = {}
+    digest = hashlib.sha256()
+    for table in [pgsql.token, pgsql.balance, pgsql.pool, pgsql.transaction]:
+        rows = pgsql.table_rows(table)
+        tables[table.name] = {"rows": len(rows), "hash": table_hash(rows)}
+        digest.update(tables[table.name]["hash"].encode())
+    return digest.hexdigest(), tables
+
+
+def percentile(values, fraction):
+    # nearest rank
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+async def replay(events, start_height=None, end_height=None, group_blocks=1,
+                 concurrent=True, snapshot=None, db_version="A", sqlite=None):
+    from src.indexer import Indexer
+
+    if sqlite is None:
+        pgsql = MemoryPgsqlHelper(logger, db_version)
+    else:
+        # resume after the blocks already in the file
+        pgsql = SqlitePgsqlHelper(logger, db_version, sqlite)
+        await pgsql.init()
+        cursor = pgsql.rows[pgsql.cursor.name].get(pgsql.cursor_id)
+        if cursor is not None:
+            start_height = max(start_height or 0, cursor["block_height"] + 1)
+    if snapshot is not None:
+        snapshot_height = load_into(pgsql, snapshot)
+        start_height = max(start_height or 0, snapshot_height + 1)
+
+    if start_height is None:
+        start_height = min(event.block_height for event in events)
+    if end_height is None:
+        end_height = max(event.block_height for event in events)
+    events = [event for event in events if start_height <= event.block_height <= end_height]
+
+    indexer = Indexer(db_version, "poll", snapshot_interval=None,
+                      pgsql=pgsql, redis=MemoryRedisHelper(logger, db_version, end_height))
+    logger.remove()
+    indexer.scheduler.concurrent = concurrent
+    if await indexer.init() is False:
+        raise RuntimeError("init indexer failed")
+
+    latencies = []
+    event_count = orc20_count = 0
+    start = time.perf_counter()
+    for block_height, block_events in group_by_height(start_height, end_height, events).items():
+        block_start = time.perf_counter()
+
+        block = indexer.prefetcher.prepare(block_height, block_height, block_events)[0]
+        unit_of_work = pgsql.begin_unit_of_work()
+        if await indexer.handle_block(block) is False:
+            raise RuntimeError(f"handle block {block_height} failed")
+        unit_of_work.add_block(block_height, block.last_event_id,
+                               indexer.undo_log.finish_block(block_height, block.block_hash))
+        if unit_of_work.block_count >= group_blocks:
+            if await indexer.commit() is False or await indexer.wait_flush() is False:
+                raise RuntimeError(f"commit block {block_height} failed")
+
+        latencies.append(time.perf_counter() - block_start)
+        event_count += block.event_count
+        orc20_count += len(block.events)
+
+    if await indexer.commit() is False or await indexer.wait_flush() is False:
+        raise RuntimeError(f"commit block {end_height} failed")
+    elapsed = time.perf_counter() - start
+
+    digest, tables = state_hash(pgsql)
+    await pgsql.close()
+    return {
+        "start_height": start_height,
+        "end_height": end_height,
+        "blocks": len(latencies),
+        "events": event_count,
+        "orc20_events": orc20_count,
+        "seconds": elapsed,
+        "blocks_per_sec": len(latencies) / elapsed if elapsed else None,
+        "events_per_sec": event_count / elapsed if elapsed else None,
+        "p50_ms": percentile(latencies, 0.5) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        "max_ms": max(latencies) * 1000 if latencies else None,
+        "group_blocks": group_blocks,
+        "concurrent": concurrent,
+        "state_hash": digest,
+        "tables": tables,
+    }
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description='record events and replay them through the indexer')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help='dump event rows from postgres')
+    record_parser.add_argument('-d', '--db_version', type=str,
+                               choices=['A', 'B'], default='A', help='db version')
+    record_parser.add_argument('-s', '--start_height', type=int, required=True)
+    record_parser.add_argument('-e', '--end_height', type=int, required=True)
+    record_parser.add_argument('-o', '--output', type=str, required=True,
+                               help='gzipped json lines file')
+
+    run_parser = commands.add_parser('run', help='replay recorded events')
+    run_parser.add_argument('events', type=str, help='file written by record')
+    run_parser.add_argument('-d', '--db_version', type=str,
+                            choices=['A', 'B'], default='A', help='db version')
+    run_parser.add_argument('-s', '--start_height', type=int, default=None)
+    run_parser.add_argument('-e', '--end_height', type=int, default=None)
+    run_parser.add_argument('-r', '--snapshot', type=str, default=None,
+                            help='start from the state of this snapshot')
+    run_parser.add_argument('-g', '--group_blocks', type=int, default=1,
+                            help='commit every n blocks')
+    run_parser.add_argument('--serial', action='store_true',
+                            help='run the events of a block one after another')
+    run_parser.add_argument('--sqlite', type=str, default=None,
+                            help='keep the tables in this SQLite file, a run resumes after its cursor')
+    run_parser.add_argument('--expect', type=str, default=None,
+                            help='exit with 1 if the state hash differs')
+    run_parser.add_argument('-o', '--output', type=str, default=None,
+                            help='write the report to this json file, stdout by default')
+
+    return parser
+
+
+if __name__ == '__main__':
+
+    args = parser().parse_args()
+
+    if args.command == 'record':
+        success = asyncio.run(record(
+            args.db_version, args.start_height, args.end_height, args.output))
+        sys.exit(0 if success else 1)
+
+    report = asyncio.run(replay(
+        read_events(args.events), args.start_height, args.end_height, args.group_blocks,
+        not args.serial, args.snapshot, args.db_version, args.sqlite))
+
+    output = json.dumps(report, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+    if args.expect is not None and args.expect != report["state_hash"]:
+        print(f"state hash {report['state_hash']} != {args.expect}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,295 @@
+"""
+Microbenchmarks of the hot path: is_orc20, the content parsers and every
+processor, the processors against an in-memory PgsqlHelper.
+
+    python benchmarks/run.py -o bench.json
+    python benchmarks/run.py -c bench.json -t 0.1
+
+Results are written as json, `-c` compares with an earlier result and exits
+with 1 when a benchmark got slower by more than the threshold.
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import asyncio
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from loguru import logger
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from benchmarks.fixtures import *  # noqa
+from src.utils.orc20 import is_orc20  # noqa
+from src.parsers.operation_parser import (parse_deploy_content, parse_mint_content,
+                                          parse_send_content, parse_cancel_content,
+                                          parse_upgrade_tick, parse_upgrade_content)  # noqa
+from src.dbs.memory_helper import MemoryPgsqlHelper  # noqa
+from src.dbs.state_store import StateStore  # noqa
+from src.processors.inscribe_deploy_processor import handle_inscribe_deploy  # noqa
+from src.processors.inscribe_mint_processor import handle_inscribe_mint  # noqa
+from src.processors.inscribe_send_processor import handle_inscribe_send  # noqa
+from src.processors.inscribe_cancel_processor import handle_inscribe_cancel  # noqa
+from src.processors.inscribe_upgrade_processor import handle_inscribe_upgrade  # noqa
+from src.processors.transfer_mint_processor import handle_transfer_mint  # noqa
+from src.processors.transfer_send_processor import handle_transfer_send  # noqa
+from src.processors.transfer_upgrade_processor import handle_transfer_upgrade, UPGRADE_RECEIVER_ADDRESS  # noqa
+
+
+def parser_cases():
+    cases = [(f"is_orc20[{name}]", is_orc20, (content,))
+             for name, content in CONTENTS.items()]
+    cases.extend([
+        ("parse_deploy_content", parse_deploy_content, (DEPLOY_CONTENT, BLOCK_HEIGHT, 70000001)),
+        ("parse_mint_content", parse_mint_content, (MINT_CONTENT,)),
+        ("parse_send_content", parse_send_content, (SEND_CONTENT,)),
+        ("parse_send_content[remaining]", parse_send_content, (REMAINING_CONTENT,)),
+        ("parse_cancel_content", parse_cancel_content, (CANCEL_CONTENT,)),
+        ("parse_upgrade_tick", parse_upgrade_tick, (UPGRADE_CONTENT,)),
+        ("parse_upgrade_content", parse_upgrade_content, (UPGRADE_CONTENT, 18)),
+    ])
+    return cases
+
+
+def processor_cases():
+    holder = [holder_balance()]
+    remaining = ([remaining_balance()], remaining_transactions())
+    last_mint = pool_mint(4 * POOL_SIZE - 1)["inscription_id"]
+    last_available = pool_send(2 * POOL_SIZE - 1)["inscription_id"]
+    last_upgrade = upgrade_pending(9)["inscription_id"]
+
+    # name, handler, (balances, transactions), event
+    return [
+        ("handle_inscribe_deploy", handle_inscribe_deploy, (holder, ()),
+         event(900001, DEPLOY_CONTENT, to_address=DEPLOYER, from_address=DEPLOYER)),
+        ("handle_inscribe_mint", handle_inscribe_mint, (holder, ()),
+         event(900002, MINT_CONTENT)),
+        ("handle_inscribe_send", handle_inscribe_send, (holder, ()),
+         event(900003, SEND_CONTENT)),
+        ("handle_inscribe_send[remaining]", handle_inscribe_send, remaining,
+         event(900004, REMAINING_CONTENT)),
+        ("handle_inscribe_cancel", handle_inscribe_cancel, (holder, ()),
+         event(900005, CANCEL_CONTENT)),
+        ("handle_inscribe_upgrade", handle_inscribe_upgrade, (holder, ()),
+         event(900006, UPGRADE_CONTENT, to_address=DEPLOYER, from_address=DEPLOYER)),
+        ("handle_transfer_mint", handle_transfer_mint, (holder, ()),
+         event(900007, MINT_CONTENT, "transfer", to_address=RECEIVER, inscription_id=last_mint)),
+        ("handle_transfer_send", handle_transfer_send, (holder, ()),
+         event(900008, SEND_CONTENT, "transfer", to_address=RECEIVER, inscription_id=last_available)),
+        ("handle_transfer_upgrade", handle_transfer_upgrade, (holder, ()),
+         event(900009, UPGRADE_CONTENT, "transfer", from_address=DEPLOYER,
+               to_address=UPGRADE_RECEIVER_ADDRESS, inscription_id=last_upgrade)),
+    ]
+
+
+async def processor_setup(balances, transactions):
+    """
+    Load the token, `balances` and `transactions` once, return a function
+    giving a fresh (pgsql, state) for every run. Writes go to the unit of
+    work, so only the state must be copied between runs.
+    """
+    pgsql = MemoryPgsqlHelper(logger)
+    pgsql.insert_row(pgsql.token, token_row())
+    for balance in balances:
+        balance, pools = split_pools(balance)
+        pgsql.insert_row(pgsql.balance, balance)
+        for item in pools:
+            pgsql.insert_pool_row(item)
+    for transaction in transactions:
+        pgsql.insert_row(pgsql.transaction, transaction)
+
+    state = StateStore(pgsql.token, pgsql.balance, pgsql.pool)
+    await state.load(pgsql)
+    template = pickle.dumps((state.tokens, state.balances, state.pools))
+
+    async def setup():
+        state = StateStore(pgsql.token, pgsql.balance, pgsql.pool)
+        state.tokens, state.balances, state.pools = pickle.loads(template)
+        for token in state.tokens.values():
+            state.index_token(token)
+        pgsql.rollback_unit_of_work()
+        pgsql.begin_unit_of_work()
+        return pgsql, state
+
+    return setup
+
+
+async def run_processor(handler, pgsql, state, event, content):
+    tasks = await handler(pgsql, state, event, content)
+    return await asyncio.gather(*tasks)
+
+
+def measure(op, min_time):
+    # run `op` in batches, doubling them until a batch lasts `min_time` s
+    count = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(count):
+            op()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or count >= 1 << 24:
+            return count, elapsed
+        count *= 2
+
+
+async def measure_async(setup, op, min_time, max_count=1 << 16):
+    # the setup of every run is not timed
+    count = 0
+    elapsed = 0
+    while elapsed < min_time and count < max_count:
+        args = await setup()
+        start = time.perf_counter()
+        await op(*args)
+        elapsed += time.perf_counter() - start
+        count += 1
+    return count, elapsed
+
+
+def measure_allocations(op, runs=20):
+    """
+    The mean peak of memory allocated during one run and the mean memory
+    still allocated after it, in bytes.
+    """
+    peak = retained = 0
+    tracemalloc.start()
+    for _ in range(runs):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = op()
+        current, peak_size = tracemalloc.get_traced_memory()
+        peak += peak_size - before
+        retained += current - before
+        del result
+    tracemalloc.stop()
+    return peak // runs, retained // runs
+
+
+async def measure_allocations_async(setup, op, runs=20):
+    peak = retained = 0
+    tracemalloc.start()
+    for _ in range(runs):
+        args = await setup()
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = await op(*args)
+        current, peak_size = tracemalloc.get_traced_memory()
+        peak += peak_size - before
+        retained += current - before
+        del result, args
+    tracemalloc.stop()
+    return peak // runs, retained // runs
+
+
+def result_json(name, group, count, elapsed, allocations):
+    return {
+        "name": name,
+        "group": group,
+        "iterations": count,
+        "ops_per_sec": count / elapsed,
+        "mean_us": elapsed / count * 1e6,
+        "alloc_peak_bytes": allocations[0],
+        "alloc_retained_bytes": allocations[1],
+    }
+
+
+async def run_benchmarks(min_time, name_filter=None):
+    results = []
+    for name, func, args in parser_cases():
+        if name_filter and name_filter not in name:
+            continue
+        count, elapsed = measure(lambda: func(*args), min_time)
+        allocations = measure_allocations(lambda: func(*args))
+        results.append(result_json(name, "parser", count, elapsed, allocations))
+
+    for name, handler, rows, event in processor_cases():
+        if name_filter and name_filter not in name:
+            continue
+        content = is_orc20(event.content)
+        setup = await processor_setup(*rows)
+
+        async def op(pgsql, state):
+            return await run_processor(handler, pgsql, state, event, content)
+
+        count, elapsed = await measure_async(setup, op, min_time)
+        allocations = await measure_allocations_async(setup, op)
+        results.append(result_json(name, "processor", count, elapsed, allocations))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=src_path,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(baseline, results, threshold):
+    # print the change of every benchmark, return the names of the regressions
+    baseline = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = baseline.get(result["name"])
+        if old is None:
+            continue
+        change = result["ops_per_sec"] / old["ops_per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(result["name"])
+        print(f"{result['name']:<40} {old['ops_per_sec']:>14.1f} -> {result['ops_per_sec']:>14.1f} ops/s {change:+8.1%}{flag}",
+              file=sys.stderr)
+    return regressions
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description='benchmark the parsers and processors')
+
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='write the results to this json file, stdout by default')
+
+    parser.add_argument('-c', '--compare', type=str, default=None,
+                        help='compare with the results in this json file')
+
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='slowdown reported as regression when comparing')
+
+    parser.add_argument('-m', '--min_time', type=float, default=0.5,
+                        help='seconds spent on every benchmark')
+
+    parser.add_argument('-k', '--filter', type=str, default=None,
+                        help='only run the benchmarks whose name contains this')
+
+    return parser
+
+
+if __name__ == '__main__':
+
+    args = parser().parse_args()
+    logger.remove()
+
+    results = asyncio.run(run_benchmarks(args.min_time, args.filter))
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "time": int(time.time()),
+        "results": results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,88 @@
+"""
+The validators of validators.py against the parsers of operation_parser.py
+before them, kept as the reference in tests/test_validators.py, on the
+valid contents of every op and on random contents, mostly invalid.
+
+    python benchmarks/validators.py -m 0.5
+
+Prints the mean time of both per content and the speedup, as json.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from benchmarks.fixtures import *  # noqa
+from benchmarks.run import measure, git_revision  # noqa
+from tests.test_validators import (old_deploy, old_mint, old_send, old_cancel, old_upgrade_tick,
+                                   old_upgrade, random_content)  # noqa
+from src.parsers.validators import (validate_deploy, validate_mint, validate_send,
+                                    validate_cancel, validate_upgrade_tick,
+                                    validate_upgrade)  # noqa
+
+
+def cases():
+    # name, old parser, validator, arguments
+    return [
+        ("deploy", old_deploy, validate_deploy, (DEPLOY_CONTENT, BLOCK_HEIGHT, 70000001)),
+        ("mint", old_mint, validate_mint, (MINT_CONTENT,)),
+        ("send", old_send, validate_send, (SEND_CONTENT,)),
+        ("send[remaining]", old_send, validate_send, (REMAINING_CONTENT,)),
+        ("cancel", old_cancel, validate_cancel, (CANCEL_CONTENT,)),
+        ("upgrade_tick", old_upgrade_tick, validate_upgrade_tick, (UPGRADE_CONTENT,)),
+        ("upgrade", old_upgrade, validate_upgrade, (UPGRADE_CONTENT, 18)),
+    ]
+
+
+def random_cases(count=1000):
+    # the contents the parsers run on whatever their op, exceptions included
+    rand = random.Random(17)
+    contents = [random_content(rand) for _ in range(count)]
+    return [(f"{name}[random]", old, new, contents) for name, old, new in [
+        ("mint", old_mint, validate_mint), ("send", old_send, validate_send),
+        ("cancel", old_cancel, validate_cancel)]]
+
+
+def run_all(parse, contents):
+    for content in contents:
+        try:
+            parse(content)
+        except Exception:
+            pass
+
+
+def per_call_us(op, min_time, calls=1):
+    count, elapsed = measure(op, min_time)
+    return elapsed / count / calls * 1e6
+
+
+def run_benchmarks(min_time):
+    results = []
+    for name, old, new, args in cases():
+        results.append((name, per_call_us(lambda: old(*args), min_time),
+                        per_call_us(lambda: new(*args), min_time)))
+    for name, old, new, contents in random_cases():
+        results.append((name, per_call_us(lambda: run_all(old, contents), min_time, len(contents)),
+                        per_call_us(lambda: run_all(new, contents), min_time, len(contents))))
+    return [{"name": name, "old_us": old_us, "new_us": new_us, "speedup": old_us / new_us}
+            for name, old_us, new_us in results]
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description='benchmark the validators against the old parsers')
+
+    parser.add_argument('-m', '--min_time', type=float, default=0.5,
+                        help='seconds spent on every benchmark')
+
+    return parser
+
+
+if __name__ == '__main__':
+
+    args = parser().parse_args()
+    print(json.dumps({"revision": git_revision(), "results": run_benchmarks(args.min_time)}, indent=2))
@@ -0,0 +1,337 @@
+import os
+import sys
+import copy
+
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
+
+from src.dbs.pgsql_helper import PgsqlHelper  # noqa
+from src.dbs.unit_of_work import Record, coerce_value, complete_row, done  # noqa
+from src.dbs.migrations import MIGRATIONS  # noqa
+
+
+class MemoryPgsqlHelper(PgsqlHelper):
+    """
+    PgsqlHelper keeping the tables in dicts instead of postgres, for
+    benchmarks and replays. It has the same tables and the same unit of work
+    semantic, `events` are the rows of the event table, in id order.
+    """
+
+    def __init__(self, logger, db_version="A", events=None):
+        super().__init__(logger, db_version)
+        self.rows = {table.name: {} for table in [
+            self.token, self.balance, self.pool, self.transaction, self.cursor, self.undo]}
+        self.events = [Record(event) for event in events or []]
+
+    async def init(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def table_rows(self, table):
+        return self.rows[table.name]
+
+    def insert_row(self, table, value):
+        # same semantic as INSERT ... ON CONFLICT DO NOTHING
+        rows = self.rows[table.name]
+        if value["id"] not in rows:
+            rows[value["id"]] = complete_row(table.columns, copy.deepcopy(value))
+
+    def insert_pool_row(self, value):
+        # pool rows are keyed by (balance_id, kind, seq)
+        row = complete_row(self.pool.columns, copy.deepcopy(value))
+        self.rows[self.pool.name][(row.balance_id, row.kind, row.seq)] = row
+
+    def update_row(self, table, row_id, values):
+        row = self.rows[table.name].get(row_id)
+        if row is None:
+            return
+        for key, value in values.items():
+            row[key] = coerce_value(table.columns[key], copy.deepcopy(value))
+
+    def select_by_id(self, table, row_id):
+        row = self.rows[table.name].get(row_id)
+        return [Record(copy.deepcopy(row))] if row is not None else []
+
+    def select_rows(self, table, predicate):
+        return [Record(copy.deepcopy(row)) for row in self.rows[table.name].values()
+                if predicate(row)]
+
+    def select_page(self, table, after_id, limit):
+        rows = self.rows[table.name]
+        row_ids = sorted(row_id for row_id in rows
+                         if after_id is None or row_id > after_id)[:limit]
+        return [Record(copy.deepcopy(rows[row_id])) for row_id in row_ids]
+
+    async def create_token_table(self):
+        self.rows[self.token.name].clear()
+        return True
+
+    async def create_balance_table(self):
+        self.rows[self.balance.name].clear()
+        return True
+
+    async def create_pool_table(self):
+        self.rows[self.pool.name].clear()
+        return True
+
+    async def create_transaction_table(self):
+        self.rows[self.transaction.name].clear()
+        return True
+
+    async def create_cursor_table(self):
+        self.rows[self.cursor.name].clear()
+        return True
+
+    async def ensure_cursor_table(self):
+        return True
+
+    async def create_undo_table(self):
+        self.rows[self.undo.name].clear()
+        return True
+
+    async def ensure_undo_table(self):
+        return True
+
+    async def ensure_pool_columns(self):
+        return True
+
+    async def check_amount_columns(self):
+        return True
+
+    # dicts need no indexes, the schema is always up to date
+    async def ensure_schema_table(self):
+        return True
+
+    async def get_schema_versions(self):
+        return {migration.version for migration in MIGRATIONS}
+
+    async def save_schema_version(self, version, description):
+        return True
+
+    async def get_indexes(self, names):
+        return {name: True for name in names}
+
+    async def create_index(self, index):
+        return True
+
+    async def get_block_hashes(self, start_height):
+        return sorted([Record(block_height=row["block_height"], block_hash=row["block_hash"])
+                       for (cursor_id, block_height), row in self.rows[self.undo.name].items()
+                       if cursor_id == self.cursor_id and block_height >= start_height],
+                      key=lambda row: row.block_height)
+
+    async def get_cursor(self, cursor_id=None):
+        if cursor_id is None:
+            cursor_id = self.cursor_id
+        return self.select_by_id(self.cursor, cursor_id)
+
+    async def get_cursors(self):
+        return self.select_rows(self.cursor, lambda row: True)
+
+    async def get_latest_transaction_height(self):
+        return max((row["block_height"] for row in self.rows[self.transaction.name].values()),
+                   default=None)
+
+    async def get_event_by_block_height(self, block_height):
+        return [event for event in self.events if event.block_height == block_height]
+
+    async def get_event_by_block_range(self, start_height, end_height):
+        return [event for event in self.events
+                if start_height <= event.block_height <= end_height]
+
+    async def get_event_by_id(self, event_id):
+        return [event for event in self.events if event.id == event_id]
+
+    async def get_tokens(self, after_id=None, limit=10000):
+        return self.select_page(self.token, after_id, limit)
+
+    async def get_balances(self, after_id=None, limit=10000):
+        return self.select_page(self.balance, after_id, limit)
+
+    async def get_pools(self, after_key=None, limit=10000):
+        return self.select_page(self.pool, after_key, limit)
+
+    async def get_token_by_id(self, token_id):
+        rows = self.select_by_id(self.token, token_id)
+        return self.merge_by_id(self.unit_of_work, "token", token_id, rows)
+
+    async def get_balance_by_id(self, id):
+        rows = self.select_by_id(self.balance, id)
+        return self.merge_by_id(self.unit_of_work, "balance", id, rows)
+
+    async def get_transaction_by_id(self, id, block_height=None):
+        unit_of_work = self.unit_of_work
+        if unit_of_work is not None:
+            found, transaction = unit_of_work.transaction.lookup(id)
+            if found:
+                return [transaction] if transaction is not None else []
+
+        rows = (await self.get_transactions_by_ids([id], [block_height]))
+        return self.merge_by_id(unit_of_work, "transaction", id, rows)
+
+    async def get_transactions_by_ids(self, ids, block_heights=None, chunk_size=10000):
+        # like postgres, a row is only found in the partition of the height given
+        rows = self.rows[self.transaction.name]
+        if block_heights is None:
+            block_heights = [None] * len(ids)
+        return [Record(copy.deepcopy(rows[row_id])) for row_id, block_height in zip(ids, block_heights)
+                if row_id in rows and block_height in (None, rows[row_id]["block_height"])]
+
+    def save_token_info(self, value):
+        if self.unit_of_work is not None:
+            return super().save_token_info(value)
+        self.insert_row(self.token, value)
+        return done()
+
+    def update_token_info(self, token_id, value):
+        if self.unit_of_work is not None:
+            return super().update_token_info(token_id, value)
+        self.update_row(self.token, token_id, value)
+        return done()
+
+    def save_balance_info(self, value):
+        if self.unit_of_work is not None:
+            return super().save_balance_info(value)
+        self.insert_row(self.balance, value)
+        return done()
+
+    def update_balance_info(self, balance_id, value):
+        if self.unit_of_work is not None:
+            return super().update_balance_info(balance_id, value)
+        self.update_row(self.balance, balance_id, value)
+        return done()
+
+    def save_transaction_info(self, value):
+        if self.unit_of_work is not None:
+            return super().save_transaction_info(value)
+        self.insert_row(self.transaction, value)
+        return done()
+
+    def update_transaction_info(self, transaction_id, value, block_height=None):
+        if self.unit_of_work is not None:
+            return super().update_transaction_info(transaction_id, value, block_height)
+        row = self.rows[self.transaction.name].get(transaction_id)
+        if row is not None and block_height in (None, row["block_height"]):
+            self.update_row(self.transaction, transaction_id, value)
+        return done()
+
+    async def commit_unit_of_work(self, unit_of_work=None):
+        if unit_of_work is None:
+            unit_of_work = self.detach_unit_of_work()
+        if unit_of_work is None:
+            return True
+
+        for buffer in unit_of_work.tables():
+            rows = self.rows[buffer.table.name]
+            for row in buffer.new_rows():
+                if row["id"] not in rows:
+                    rows[row["id"]] = Record(copy.deepcopy(row))
+            for columns, changed_rows in buffer.changed_rows().items():
+                for row in changed_rows:
+                    if row["id"] not in rows:
+                        rows[row["id"]] = Record(copy.deepcopy(row))
+                        continue
+                    rows[row["id"]].update(
+                        {column: copy.deepcopy(row[column]) for column in columns})
+            for row_id, values in buffer.blind.items():
+                self.update_row(buffer.table, row_id, values)
+
+        pools = self.rows[self.pool.name]
+        for key in unit_of_work.pool.deleted:
+            pools.pop(key, None)
+        for key, row in unit_of_work.pool.rows.items():
+            pools[key] = Record(copy.deepcopy(row))
+
+        if unit_of_work.end_height is not None:
+            cursors = self.rows[self.cursor.name]
+            cursor = cursors.get(self.cursor_id)
+            event_id = unit_of_work.last_event_id
+            if event_id is None and cursor is not None:
+                event_id = cursor["event_id"]
+            cursors[self.cursor_id] = Record(
+                id=self.cursor_id, block_height=unit_of_work.end_height, event_id=event_id)
+
+        if unit_of_work.undo:
+            undo_rows = self.rows[self.undo.name]
+            for undo in unit_of_work.undo:
+                undo_rows[(self.cursor_id, undo.block_height)] = Record(
+                    block_height=undo.block_height, block_hash=undo.block_hash,
+                    undo=copy.deepcopy(undo.to_json()))
+            for key in [key for key in undo_rows if key[0] == self.cursor_id and
+                        key[1] <= unit_of_work.end_height - self.undo_depth]:
+                del undo_rows[key]
+        self.finish_committing(unit_of_work)
+        return True
+
+    async def rollback_blocks(self, fork_height):
+        undo_rows = self.rows[self.undo.name]
+        keys = sorted([key for key in undo_rows
+                       if key[0] == self.cursor_id and key[1] >= fork_height], reverse=True)
+        cursor = self.rows[self.cursor.name].get(self.cursor_id)
+        if cursor is not None and \
+                not {key[1] for key in keys}.issuperset(range(fork_height, cursor["block_height"] + 1)):
+            self.logger.error(
+                f"rollback to block {fork_height} error: undo log does not reach back to it")
+            return False
+
+        for key in keys:
+            undo = undo_rows.pop(key)["undo"]
+            for table, images in [(self.token, undo["token"]), (self.balance, undo["balance"])]:
+                rows = self.rows[table.name]
+                for row_id, image in images.items():
+                    rows.pop(row_id, None)
+                    if image is not None:
+                        rows[row_id] = Record(copy.deepcopy(image))
+            for balance_id, kind, seq, image in undo["pool"]:
+                self.rows[self.pool.name].pop((balance_id, kind, seq), None)
+                if image is not None:
+                    self.insert_pool_row(image)
+            for transaction_id, values in undo["transaction"].items():
+                self.update_row(self.transaction, int(transaction_id), values)
+            for transaction_id in undo["inserted"]:
+                self.rows[self.transaction.name].pop(transaction_id, None)
+
+        if cursor is not None:
+            cursor["block_height"] = fork_height - 1
+            cursor["event_id"] = None
+        return True
+
+
+class MemoryRedisHelper:
+    """
+    The RedisHelper methods the indexer uses, kept in a dict.
+    """
+
+    def __init__(self, logger, db_version="A", current_block=None):
+        self.logger = logger
+        self.db_version = db_version
+        self.current_block = current_block
+        self.shard_heights = {}
+        self.committed_height = None
+
+    async def close(self):
+        pass
+
+    async def get_current_block_from_redis(self):
+        return self.current_block
+
+    async def set_shard_height(self, shard_id, block_height):
+        self.shard_heights[shard_id] = str(block_height)
+        return True
+
+    async def get_shard_heights(self):
+        return dict(self.shard_heights)
+
+    async def set_committed_height(self, block_height):
+        self.committed_height = block_height
+        return True
+
+    async def subscribe_current_block(self, configure=False):
+        return None
+
+    async def del_shard_heights(self):
+        self.shard_heights.clear()
+        self.committed_height = None
+        return True
@@ -0,0 +1,96 @@
+"""
+Versioned schema migrations. The tables were created with primary keys
+only, a migration adds the indexes later lookups need to tables that may
+already be large and live, so they are built CONCURRENTLY and writes go on
+meanwhile. The versions applied are recorded in indexer_schema_{db_version}.
+
+Migrations only ever add, a new index is a new migration rather than a
+change to an applied one.
+"""
+
+
+class Migration:
+
+    def __init__(self, version, description, indexes):
+        self.version = version
+        self.description = description
+        # index names, `{v}` is the db version
+        self.indexes = indexes
+
+    def index_names(self, db_version):
+        return [name.format(v=db_version) for name in self.indexes]
+
+
+MIGRATIONS = [
+    Migration(1, "indexes of the lookups by inscription number, block height, address and token", [
+        "token_{v}_inscription_number",
+        "balance_{v}_inscription_number",
+        "event_block_height_id",
+        "transaction_{v}_block_height",
+        "transaction_{v}_from",
+        "transaction_{v}_to",
+        "transaction_{v}_token_id",
+        "pool_{v}_nonce",
+        "pool_{v}_inscription_id",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def required_indexes(db_version):
+    return [name for migration in MIGRATIONS for name in migration.index_names(db_version)]
+
+
+async def apply_migrations(pgsql, logger):
+    """
+    Apply the migrations missing in the schema table, in order. An index
+    of an applied migration is built again when it is missing or invalid.
+    """
+    if await pgsql.ensure_schema_table() is False:
+        return False
+    applied = await pgsql.get_schema_versions()
+    if applied is None:
+        return False
+
+    for migration in MIGRATIONS:
+        names = migration.index_names(pgsql.db_version)
+        indexes = await pgsql.get_indexes(names)
+        if indexes is None:
+            return False
+        for name in names:
+            if indexes.get(name) is True:
+                continue
+            logger.info(f"migration {migration.version}: create index {name}")
+            if await pgsql.create_index(pgsql.get_index(name)) is False:
+                return False
+        if migration.version not in applied:
+            if await pgsql.save_schema_version(migration.version, migration.description) is False:
+                return False
+            logger.info(f"migration {migration.version} applied: {migration.description}")
+    return True
+
+
+async def check_schema(pgsql, logger):
+    """
+    Warn about the migrations not applied and the required indexes missing
+    or invalid, the indexer still runs without them, only slower. Returns
+    the names of the indexes missing, None when they could not be read.
+    """
+    if await pgsql.ensure_schema_table() is False:
+        return None
+    applied = await pgsql.get_schema_versions()
+    names = required_indexes(pgsql.db_version)
+    indexes = await pgsql.get_indexes(names)
+    if applied is None or indexes is None:
+        return None
+
+    pending = [migration.version for migration in MIGRATIONS if migration.version not in applied]
+    if pending:
+        logger.warning(
+            f"schema version {max(applied, default=0)} is behind {SCHEMA_VERSION}, migrations {pending} not applied, run src/utils/migrate.py")
+    missing = [name for name in names if indexes.get(name) is not True]
+    for name in missing:
+        state = "invalid" if name in indexes else "missing"
+        logger.warning(f"index {name} is {state}, run src/utils/migrate.py to build it")
+    return missing
@@ -1,13 +1,39 @@
+import io
+import os
+import sys
+import time
 import asyncio
 import sqlalchemy as sa
-from sqlalchemy.sql.ddl import CreateTable
+from sqlalchemy.sql.ddl import CreateTable, CreateIndex
 from sqlalchemy.dialects.postgresql import ENUM, JSON, ARRAY
 from sqlalchemy.dialects.postgresql import insert
 from aiopg.sa import create_engine
 from environs import Env
 
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
 
-class PgsqlHelper:
+from src.dbs.unit_of_work import UnitOfWork, done  # noqa
+from src.dbs.row_loader import RowLoader  # noqa
+from src.dbs.statement_cache import StatementCache, CachedStatement  # noqa
+from src.dbs.storage import Storage  # noqa
+from src.metrics import metrics, timed_call  # noqa
+from src.utils.amount import Units  # noqa
+
+
+def copy_value(value):
+    if value is None:
+        return "\\N"
+    if value is True:
+        return "t"
+    if value is False:
+        return "f"
+    if isinstance(value, int):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class PgsqlHelper(Storage):
 
     def __init__(self, logger, db_version="A") -> None:
         self.logger = logger
@@ -15,6 +41,26 @@ class PgsqlHelper:
         metadata = sa.MetaData()
         self.semaphore = asyncio.Semaphore(100)
 
+        # writes are buffered here while a unit of work is open
+        self.unit_of_work = None
+        # the unit of work being committed in the background, still visible to reads
+        self.committing_unit_of_work = None
+        self.multi_row_size = 500
+        # statements compiled once per shape, see statement_cache.py
+        self.statements = StatementCache()
+        if not self.statements.enabled:
+            self.logger.warning(f"statement cache disabled, unsupported versions: {self.statements.unsupported}")
+        # reads of transactions by id, batched per turn of the event loop
+        self.transaction_loader = RowLoader(self.get_transactions_by_ids)
+        # a bulk rebuild writes unlogged tables without secondary indexes and
+        # inserts the new rows with COPY, see `finish_bulk_load`
+        self.bulk = False
+        self.sync_url = None
+        self.sync_engine = None
+        # undo records of the blocks handled, see undo_log.py
+        self.undo_log = None
+        self.undo_depth = 100
+
         self.inscription = sa.Table(
             "inscription",
             metadata,
@@ -47,6 +93,7 @@ class PgsqlHelper:
             sa.Column("value", sa.BigInteger),
             sa.Column("content", JSON),
             sa.Column("spent", sa.Boolean),
+            sa.Index("event_block_height_id", "block_height", "id", postgresql_concurrently=True),
         )
 
         self.token = sa.Table(
@@ -57,8 +104,9 @@ class PgsqlHelper:
             sa.Column("tick", sa.String),
             sa.Column("tick_id", sa.String),
             sa.Column("name", sa.String),
-            sa.Column("max", sa.String),
-            sa.Column("lim", sa.String),
+            # amounts are integers of 10**-18 units, see src/utils/amount.py
+            sa.Column("max", Units),
+            sa.Column("lim", Units),
             sa.Column("dec", sa.Integer),
             sa.Column("ug", sa.Boolean),
             sa.Column("wp", sa.Boolean),
@@ -70,7 +118,7 @@ class PgsqlHelper:
             sa.Column("deployer", sa.String(255)),
             sa.Column("deploy_time", sa.BigInteger),
 
-            sa.Column("minted", sa.String),
+            sa.Column("minted", Units),
             sa.Column("start_number", sa.BigInteger),
             sa.Column("end_number", sa.BigInteger),
             sa.Column("start_time", sa.BigInteger),
@@ -79,6 +127,8 @@ class PgsqlHelper:
 
             sa.Column("upgrade_pending", ARRAY(JSON), default=[]),
             sa.Column("upgrade_history", ARRAY(JSON), default=[]),
+            sa.Index(f"token_{db_version}_inscription_number", "inscription_number", "tick",
+                     postgresql_concurrently=True),
         )
 
         self.balance = sa.Table(
@@ -91,35 +141,100 @@ class PgsqlHelper:
             sa.Column("tick_id", sa.String, default=""),
             sa.Column("inscription_id", sa.String(255)),
             sa.Column("inscription_number", sa.BigInteger),
-            sa.Column("balance", sa.String, default=0),
-            sa.Column("available_balance", sa.String, default=0),
-            sa.Column("pending_send_pool", ARRAY(JSON), default=[]),
-            sa.Column("available_send_pool", ARRAY(JSON), default=[]),
-            sa.Column("sent_send_pool", ARRAY(JSON), default=[]),
-            sa.Column("received_send_pool", ARRAY(JSON), default=[]),
-            sa.Column("received_mint_pool", ARRAY(JSON), default=[]),
+            sa.Column("balance", Units, default=0),
+            sa.Column("available_balance", Units, default=0),
+            sa.Index(f"balance_{db_version}_inscription_number", "inscription_number", "tick", "address",
+                     postgresql_concurrently=True),
+        )
+
+        # the items of the send and mint pools of the balances, one row each,
+        # `kind` is the pool, `seq` their order in it. An inscription may have
+        # several items in a pool, a pending send transferred twice is sent twice
+        self.pool = sa.Table(
+            f"pool_{db_version}",
+            metadata,
+            sa.Column("balance_id", sa.String, primary_key=True),
+            sa.Column("kind", sa.String, primary_key=True),
+            sa.Column("seq", sa.BigInteger, primary_key=True),
+            sa.Column("inscription_id", sa.String(255)),
+            sa.Column("transaction_id", sa.BigInteger),
+            # the block of the transaction, it is read from that partition alone
+            sa.Column("block_height", sa.BigInteger),
+            # a nonce may not fit a bigint
+            sa.Column("nonce", Units),
+            sa.Column("amt", Units),
+            sa.Index(f"pool_{db_version}_nonce", "balance_id", "kind", "nonce",
+                     postgresql_concurrently=True),
+            sa.Index(f"pool_{db_version}_inscription_id", "inscription_id",
+                     postgresql_concurrently=True),
         )
 
+        # range partitioned by block_height, a partition per `transaction_partition_size`
+        # blocks, so the key includes block_height. Tables created before are not
+        # partitioned and keyed by id alone, see `load_transaction_layout`
+        self.transaction_partition_size = 10000
+        self.transaction_partitioned = False
+        # the lower bounds of the partitions known to exist
+        self.transaction_partitions = set()
         self.transaction = sa.Table(
             f"transaction_{db_version}",
             metadata,
             # event id
             sa.Column("id", sa.BigInteger, primary_key=True),
-            sa.Column("block_height", sa.BigInteger),
+            sa.Column("block_height", sa.BigInteger, primary_key=True),
             sa.Column("inscription_id", sa.String(255)),
             sa.Column("inscription_number", sa.BigInteger),
             sa.Column("method", ENUM("inscribe-mint", "inscribe-send", "inscribe-remaining",
                                      "inscribe-cancel", "inscribe-upgrade", "inscribe-deploy",
                                      "transfer-upgrade", "transfer", name=f"transaction_enum_{db_version}")),
             sa.Column("token_id", sa.String),
-            sa.Column("quantity", sa.String),
+            sa.Column("quantity", Units),
             sa.Column("from", sa.String(255)),
             sa.Column("to", sa.String(255)),
             sa.Column("time", sa.String(65)),
             sa.Column("valid", sa.Boolean),
             sa.Column("invalid_reason", sa.String),
+            sa.Index(f"transaction_{db_version}_block_height", "block_height",
+                     postgresql_concurrently=True),
+            sa.Index(f"transaction_{db_version}_from", "from", postgresql_concurrently=True),
+            sa.Index(f"transaction_{db_version}_to", "to", postgresql_concurrently=True),
+            sa.Index(f"transaction_{db_version}_token_id", "token_id", postgresql_concurrently=True),
+            postgresql_partition_by="RANGE (block_height)",
         )
 
+        # the last block committed, written in the same transaction as the block
+        self.cursor_id = "indexer"
+        self.cursor = sa.Table(
+            f"indexer_cursor_{db_version}",
+            metadata,
+            sa.Column("id", sa.String, primary_key=True),
+            sa.Column("block_height", sa.BigInteger),
+            sa.Column("event_id", sa.BigInteger),
+        )
+
+        # the undo records of the last `undo_depth` blocks committed, per cursor
+        self.undo = sa.Table(
+            f"indexer_undo_{db_version}",
+            metadata,
+            sa.Column("id", sa.String, primary_key=True),
+            sa.Column("block_height", sa.BigInteger, primary_key=True),
+            sa.Column("block_hash", sa.String),
+            sa.Column("undo", JSON),
+        )
+
+        # the schema migrations applied, see migrations.py
+        self.schema = sa.Table(
+            f"indexer_schema_{db_version}",
+            metadata,
+            sa.Column("version", sa.Integer, primary_key=True),
+            sa.Column("description", sa.String),
+            sa.Column("applied_time", sa.BigInteger),
+        )
+
+    def query(self, call):
+        # a round trip, counted and timed in metrics.py
+        return timed_call(self.semaphore, "pgsql", call)
+
     async def init(self):
         env = Env()
         env.read_env()
@@ -130,16 +245,90 @@ class PgsqlHelper:
             database=env.str("ORC_PGSQL_DB"),
             host=env.str("ORC_PGSQL_HOST"),
         )
+        self.sync_url = sa.engine.URL.create(
+            "postgresql+psycopg2",
+            username=env.str("ORC_PGSQL_USER"),
+            password=env.str("ORC_PGSQL_PASSWD"),
+            database=env.str("ORC_PGSQL_DB"),
+            host=env.str("ORC_PGSQL_HOST"),
+        )
+        self.transaction_partition_size = env.int(
+            "ORC_TRANSACTION_PARTITION_SIZE", self.transaction_partition_size)
+        await self.load_transaction_layout()
+        await self.load_bulk_mode()
 
     async def close(self):
+        self.logger.info(f"statement cache: {self.statements.stats()}")
         self.engine.close()
         await self.engine.wait_closed()
+        if self.sync_engine is not None:
+            self.sync_engine.dispose()
+
+    def get_sync_engine(self):
+        # aiopg can not run COPY, bulk commits go through psycopg2 in a thread
+        if self.sync_engine is None:
+            self.sync_engine = sa.create_engine(self.sync_url, pool_size=1, max_overflow=0)
+        return self.sync_engine
+
+    async def setup_table(self, conn, table):
+        """
+        Create the indexes of a table just created, or in bulk mode make it
+        unlogged and leave them to `finish_bulk_load`.
+        """
+        if not self.bulk:
+            for index in table.indexes:
+                await conn.execute(self.index_ddl(index))
+        elif table is not self.transaction:
+            # a partitioned table has no storage, its partitions are created unlogged
+            await conn.execute(f'ALTER TABLE "{table.name}" SET UNLOGGED')
+
+    def bulk_tables(self):
+        return [self.token, self.balance, self.pool, self.transaction, self.cursor, self.undo]
+
+    async def load_bulk_mode(self):
+        # a bulk rebuild not finished yet left the token table unlogged
+        try:
+            async with self.engine.acquire() as conn:
+                persistence = await conn.scalar(sa.text(
+                    "SELECT relpersistence FROM pg_class WHERE oid = to_regclass(:name)").bindparams(
+                    name=f'"{self.token.name}"'))
+            self.bulk = persistence == "u"
+            return True
+        except Exception as e:
+            self.logger.error(f"load bulk mode error: {e}")
+            return False
+
+    async def finish_bulk_load(self):
+        """
+        End a bulk rebuild: build the indexes left out in parallel, then make
+        the tables logged, which writes them to the WAL once.
+        """
+        async def build_index(index):
+            async with self.engine.acquire() as conn:
+                await conn.execute(self.index_ddl(index))
+
+        try:
+            start = time.time()
+            await asyncio.gather(*[build_index(index)
+                                   for table in self.bulk_tables() for index in table.indexes])
+            async with self.engine.acquire() as conn:
+                names = [table.name for table in self.bulk_tables() if table is not self.transaction]
+                names.extend(await self.get_partitions(conn, self.transaction.name) or [])
+                for name in names:
+                    await conn.execute(f'ALTER TABLE "{name}" SET LOGGED')
+            self.bulk = False
+            self.logger.info(f"finish bulk load successfully, cost: {time.time()-start} s")
+            return True
+        except Exception as e:
+            self.logger.error(f"finish bulk load error: {e}")
+            return False
 
     async def create_token_table(self):
         try:
             async with self.engine.acquire() as conn:
                 await conn.execute(f"DROP TABLE IF EXISTS token_{self.db_version} CASCADE")
                 await conn.execute(CreateTable(self.token))
+                await self.setup_table(conn, self.token)
             return True
         except Exception as e:
             self.logger.error(f"create token table error: {e}")
@@ -150,11 +339,23 @@ class PgsqlHelper:
             async with self.engine.acquire() as conn:
                 await conn.execute(f"DROP TABLE IF EXISTS balance_{self.db_version} CASCADE")
                 await conn.execute(CreateTable(self.balance))
+                await self.setup_table(conn, self.balance)
             return True
         except Exception as e:
             self.logger.error(f"create balance table error: {e}")
             return False
 
+    async def create_pool_table(self):
+        try:
+            async with self.engine.acquire() as conn:
+                await conn.execute(f"DROP TABLE IF EXISTS pool_{self.db_version} CASCADE")
+                await conn.execute(CreateTable(self.pool))
+                await self.setup_table(conn, self.pool)
+            return True
+        except Exception as e:
+            self.logger.error(f"create pool table error: {e}")
+            return False
+
     async def create_transaction_table(self):
         try:
             async with self.engine.acquire() as conn:
@@ -162,161 +363,987 @@ class PgsqlHelper:
                 await conn.execute(f"DROP TYPE IF EXISTS transaction_enum_{self.db_version} CASCADE")
                 await conn.execute(f"CREATE TYPE transaction_enum_{self.db_version} AS ENUM ('inscribe-mint', 'inscribe-send','inscribe-cancel', 'inscribe-remaining', 'transfer', 'inscribe-upgrade', 'inscribe-deploy','transfer-upgrade')")
                 await conn.execute(CreateTable(self.transaction))
+                # created on the empty parent, every partition gets them when created
+                await self.setup_table(conn, self.transaction)
+            self.transaction_partitioned = True
+            self.transaction_partitions = set()
             return True
         except Exception as e:
             self.logger.error(f"create transaction table error: {e}")
             return False
 
-    async def get_event_by_block_height(self, block_height):
-        async with self.semaphore:
+    async def load_transaction_layout(self):
+        # whether the transaction table is partitioned, and its partitions
+        try:
+            async with self.engine.acquire() as conn:
+                partitions = await self.get_partitions(conn, self.transaction.name)
+            self.transaction_partitioned = partitions is not None
+            self.transaction_partitions = set()
+            for partition in partitions or []:
+                lower = partition.rsplit("_p", 1)[-1]
+                if lower.isdigit():
+                    self.transaction_partitions.add(int(lower))
+            return True
+        except Exception as e:
+            self.logger.error(f"load transaction layout error: {e}")
+            return False
+
+    async def get_partitions(self, conn, table_name):
+        # the partition names of a partitioned table, None when it is not partitioned
+        partitioned = await conn.scalar(sa.text(
+            "SELECT count(*) FROM pg_partitioned_table WHERE partrelid = to_regclass(:name)").bindparams(
+            name=f'"{table_name}"'))
+        if not partitioned:
+            return None
+        result = await conn.execute(sa.text(
+            "SELECT c.relname AS name FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:name) ORDER BY c.relname").bindparams(name=f'"{table_name}"'))
+        return [row.name for row in await result.fetchall()]
+
+    def transaction_partition_name(self, lower):
+        return f"{self.transaction.name}_p{lower}"
+
+    async def ensure_transaction_partitions(self, block_heights):
+        """
+        Create the partitions the transactions of `block_heights` go to, and
+        the one after the highest so the next blocks find theirs ready.
+        """
+        if not self.transaction_partitioned or not block_heights:
+            return True
+        size = self.transaction_partition_size
+        lowers = {block_height // size * size for block_height in block_heights}
+        lowers.add(max(lowers) + size)
+        missing = sorted(lowers - self.transaction_partitions)
+        if not missing:
+            return True
+        try:
+            async with self.engine.acquire() as conn:
+                for lower in missing:
+                    await conn.execute(
+                        f'CREATE {"UNLOGGED " if self.bulk else ""}TABLE IF NOT EXISTS "{self.transaction_partition_name(lower)}" '
+                        f'PARTITION OF "{self.transaction.name}" FOR VALUES FROM ({lower}) TO ({lower + size})')
+                    self.transaction_partitions.add(lower)
+                    self.logger.info(
+                        f"create transaction partition {self.transaction_partition_name(lower)}, blocks [{lower}, {lower + size})")
+            return True
+        except Exception as e:
+            self.logger.error(f"ensure transaction partitions error: {e}")
+            return False
+
+    def transaction_key(self):
+        # the columns an upsert of transactions conflicts on
+        if self.transaction_partitioned:
+            return [self.transaction.c.id, self.transaction.c.block_height]
+        return [self.transaction.c.id]
+
+    async def create_cursor_table(self):
+        try:
+            async with self.engine.acquire() as conn:
+                await conn.execute(f"DROP TABLE IF EXISTS indexer_cursor_{self.db_version} CASCADE")
+                await conn.execute(CreateTable(self.cursor))
+                await self.setup_table(conn, self.cursor)
+            return True
+        except Exception as e:
+            self.logger.error(f"create cursor table error: {e}")
+            return False
+
+    async def ensure_pool_columns(self):
+        """
+        Add block_height, which came after the pool table, NULL in the items
+        added before. A pool table keyed by inscription_id kept one item per
+        inscription and lost the repeated sends, it can not be repaired, the
+        indexer refuses to start on it.
+        """
+        try:
+            async with self.engine.acquire() as conn:
+                result = await conn.execute(sa.text(
+                    "SELECT a.attname AS name FROM pg_index i JOIN pg_attribute a "
+                    "ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+                    "WHERE i.indrelid = to_regclass(:name) AND i.indisprimary").bindparams(
+                    name=f'"{self.pool.name}"'))
+                keys = {row.name for row in await result.fetchall()}
+                if keys and keys != {"balance_id", "kind", "seq"}:
+                    self.logger.error(f"pool table {self.pool.name} is keyed by {', '.join(sorted(keys))} and "
+                                      f"lost the repeated sends, rebuild it with -c")
+                    return False
+                await conn.execute(
+                    f'ALTER TABLE IF EXISTS "{self.pool.name}" ADD COLUMN IF NOT EXISTS block_height BIGINT')
+            return True
+        except Exception as e:
+            self.logger.error(f"ensure pool columns error: {e}")
+            return False
+
+    async def check_amount_columns(self):
+        """
+        The amounts are NUMERIC columns of units. Tables created before kept
+        them as strings of whole tokens, which `Units` would misread as units,
+        the indexer refuses to start on them.
+        """
+        columns = {(table.name, column.name) for table in [self.token, self.balance, self.pool, self.transaction]
+                   for column in table.columns if isinstance(column.type, Units)}
+        try:
+            async with self.engine.acquire() as conn:
+                result = await conn.execute(sa.text(
+                    "SELECT table_name, column_name, data_type FROM information_schema.columns "
+                    "WHERE table_schema = current_schema() AND table_name = ANY(:names)").bindparams(
+                    names=sorted({table_name for table_name, _ in columns})))
+                wrong = [row for row in await result.fetchall()
+                         if (row.table_name, row.column_name) in columns and row.data_type != "numeric"]
+            for row in wrong:
+                self.logger.error(f"column {row.column_name} of {row.table_name} is {row.data_type}, "
+                                  f"amounts are stored as NUMERIC units, rebuild with -c")
+            return not wrong
+        except Exception as e:
+            self.logger.error(f"check amount columns error: {e}")
+            return False
+
+    async def ensure_cursor_table(self):
+        try:
+            async with self.engine.acquire() as conn:
+                await conn.execute(CreateTable(self.cursor, if_not_exists=True))
+            return True
+        except Exception as e:
+            self.logger.error(f"ensure cursor table error: {e}")
+            return False
+
+    async def create_undo_table(self):
+        try:
+            async with self.engine.acquire() as conn:
+                await conn.execute(f"DROP TABLE IF EXISTS indexer_undo_{self.db_version} CASCADE")
+                await conn.execute(CreateTable(self.undo))
+                await self.setup_table(conn, self.undo)
+            return True
+        except Exception as e:
+            self.logger.error(f"create undo table error: {e}")
+            return False
+
+    async def ensure_undo_table(self):
+        try:
+            async with self.engine.acquire() as conn:
+                await conn.execute(CreateTable(self.undo, if_not_exists=True))
+            return True
+        except Exception as e:
+            self.logger.error(f"ensure undo table error: {e}")
+            return False
+
+    async def ensure_schema_table(self):
+        try:
+            async with self.engine.acquire() as conn:
+                await conn.execute(CreateTable(self.schema, if_not_exists=True))
+            return True
+        except Exception as e:
+            self.logger.error(f"ensure schema table error: {e}")
+            return False
+
+    async def get_schema_versions(self):
+        try:
+            async with self.engine.acquire() as conn:
+                result = await conn.execute(sa.select(self.schema.c.version))
+                return {row.version for row in await result.fetchall()}
+        except Exception as e:
+            self.logger.error(f"get schema versions error: {e}")
+            return None
+
+    async def save_schema_version(self, version, description):
+        try:
+            async with self.engine.acquire() as conn:
+                await conn.execute(insert(self.schema).values(
+                    version=version, description=description,
+                    applied_time=int(time.time())).on_conflict_do_nothing())
+            return True
+        except Exception as e:
+            self.logger.error(f"save schema version error: {e}")
+            return False
+
+    def get_index(self, name):
+        for table in [self.event, self.token, self.balance, self.pool, self.transaction]:
+            for index in table.indexes:
+                if index.name == name:
+                    return index
+        return None
+
+    async def get_indexes(self, names):
+        """
+        {name: valid} of the indexes among `names` that exist. An index is
+        left invalid when its CREATE INDEX CONCURRENTLY failed.
+        """
+        try:
+            async with self.engine.acquire() as conn:
+                query = sa.text(
+                    "SELECT c.relname AS name, i.indisvalid AS valid FROM pg_index i "
+                    "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = ANY(:names)")
+                result = await conn.execute(query.bindparams(names=list(names)))
+                return {row.name: row.valid for row in await result.fetchall()}
+        except Exception as e:
+            self.logger.error(f"get indexes error: {e}")
+            return None
+
+    def index_ddl(self, index, table_name=None, name=None, only=False, concurrently=False):
+        columns = ", ".join(f'"{column.name}"' for column in index.columns)
+        return f'CREATE {"UNIQUE " if index.unique else ""}INDEX {"CONCURRENTLY " if concurrently else ""}' \
+            f'IF NOT EXISTS "{name or index.name}" ON {"ONLY " if only else ""}"{table_name or index.table.name}" ({columns})'
+
+    async def create_index(self, index):
+        # build a missing or invalid index, CONCURRENTLY so the writes go on meanwhile
+        try:
+            async with self.engine.acquire() as conn:
+                partitions = await self.get_partitions(conn, index.table.name)
+                if partitions is None:
+                    await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"')
+                    await conn.execute(CreateIndex(index, if_not_exists=True))
+                    return True
+
+                # a partitioned table can not be indexed CONCURRENTLY, the index is created
+                # on the parent only, built on every partition and attached to it
+                await conn.execute(f'DROP INDEX IF EXISTS "{index.name}"')
+                await conn.execute(self.index_ddl(index, only=True))
+                suffix = index.name[len(index.table.name):]
+                for partition in partitions:
+                    await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{partition}{suffix}"')
+                    await conn.execute(self.index_ddl(
+                        index, partition, f"{partition}{suffix}", concurrently=True))
+                    await conn.execute(
+                        f'ALTER INDEX "{index.name}" ATTACH PARTITION "{partition}{suffix}"')
+            return True
+        except Exception as e:
+            self.logger.error(f"create index {index.name} error: {e}")
+            return False
+
+    async def transaction_table_exists(self):
+        # whether the transaction table exists, None on error
+        try:
+            async with self.engine.acquire() as conn:
+                return await conn.scalar(sa.text("SELECT to_regclass(:name) IS NOT NULL").bindparams(
+                    name=f'"{self.transaction.name}"'))
+        except Exception as e:
+            self.logger.error(f"check transaction table error: {e}")
+            return None
+
+    async def prune_transactions(self, block_height):
+        # delete the transactions of the blocks after `block_height`
+        try:
+            async with self.engine.acquire() as conn:
+                await conn.execute(self.transaction.delete().where(
+                    self.transaction.c.block_height > block_height))
+            return True
+        except Exception as e:
+            self.logger.error(f"prune transactions error: {e}")
+            return False
+
+    async def restore_state(self, tokens, balances, pools, transactions, block_height, event_id=None):
+        """
+        Bulk load the rows of a snapshot and set the cursor to its height, in
+        one transaction. The token, balance and pool tables are expected empty.
+        """
+        if await self.ensure_transaction_partitions(
+                {transaction["block_height"] for transaction in transactions} | {block_height}) is False:
+            return False
+        try:
+            async with self.engine.acquire() as conn:
+                async with conn.begin():
+                    for table, rows in [(self.token, tokens), (self.balance, balances), (self.pool, pools)]:
+                        for chunk in self.chunk_rows(rows):
+                            await conn.execute(insert(table).values(chunk))
+                    for chunk in self.chunk_rows(transactions):
+                        await conn.execute(
+                            insert(self.transaction).values(chunk).on_conflict_do_nothing())
+                    statement = insert(self.cursor).values(
+                        id=self.cursor_id, block_height=block_height, event_id=event_id)
+                    await conn.execute(statement.on_conflict_do_update(
+                        index_elements=[self.cursor.c.id],
+                        set_={"block_height": statement.excluded.block_height,
+                              "event_id": statement.excluded.event_id}))
+            return True
+        except Exception as e:
+            self.logger.error(f"restore state error: {e}")
+            return False
+
+    async def get_block_hashes(self, start_height):
+        async with self.query("get_block_hashes"):
             try:
                 async with self.engine.acquire() as conn:
-                    query = self.event.select().where(self.event.c.block_height ==
-                                                      block_height).order_by(self.event.c.id)
+                    query = sa.select(self.undo.c.block_height, self.undo.c.block_hash).where(
+                        self.undo.c.id == self.cursor_id).where(
+                        self.undo.c.block_height >= start_height).order_by(self.undo.c.block_height)
                     result = await conn.execute(query)
                     return await result.fetchall()
+            except Exception as e:
+                self.logger.error(f"get block hashes error: {e}")
+                return None
+
+    async def get_cursor(self, cursor_id=None):
+        if cursor_id is None:
+            cursor_id = self.cursor_id
+        async with self.query("get_cursor"):
+            try:
+                async with self.engine.acquire() as conn:
+                    result = await self.statements.execute(conn, CachedStatement(
+                        ("get_cursor",), lambda: self.cursor.select().where(
+                            self.cursor.c.id == sa.bindparam("id")), {"id": cursor_id}))
+                    return await result.fetchall()
+            except Exception as e:
+                self.logger.error(f"get cursor error: {e}")
+                return None
+
+    async def get_cursors(self):
+        async with self.query("get_cursors"):
+            try:
+                async with self.engine.acquire() as conn:
+                    result = await conn.execute(self.cursor.select())
+                    return await result.fetchall()
+            except Exception as e:
+                self.logger.error(f"get cursors error: {e}")
+                return None
+
+    async def get_latest_transaction_height(self):
+        async with self.query("get_latest_transaction_height"):
+            try:
+                async with self.engine.acquire() as conn:
+                    query = sa.select(sa.func.max(self.transaction.c.block_height))
+                    return await conn.scalar(query)
+            except Exception as e:
+                self.logger.error(f"get latest transaction height error: {e}")
+                return False
+
+    async def create_event_notify_trigger(self, channel):
+        # notify `channel` after every statement inserting into the event table
+        try:
+            async with self.engine.acquire() as conn:
+                await conn.execute(f"""
+                    CREATE OR REPLACE FUNCTION notify_{channel}() RETURNS trigger AS $$
+                    BEGIN
+                        PERFORM pg_notify('{channel}', '');
+                        RETURN NULL;
+                    END;
+                    $$ LANGUAGE plpgsql""")
+                await conn.execute(f"DROP TRIGGER IF EXISTS {channel}_trigger ON event")
+                await conn.execute(
+                    f"CREATE TRIGGER {channel}_trigger AFTER INSERT ON event FOR EACH STATEMENT EXECUTE PROCEDURE notify_{channel}()")
+            return True
+        except Exception as e:
+            self.logger.error(f"create event notify trigger error: {e}")
+            return False
+
+    async def listen(self, channel):
+        # the returned connection stays out of the pool until `unlisten`
+        try:
+            conn = await self.engine.acquire()
+            await conn.execute(f"LISTEN {channel}")
+            return conn
+        except Exception as e:
+            self.logger.error(f"listen {channel} error: {e}")
+            return None
+
+    async def unlisten(self, conn):
+        try:
+            await conn.execute("UNLISTEN *")
+        except Exception as e:
+            self.logger.error(f"unlisten error: {e}")
+        await self.engine.release(conn)
+
+    async def get_event_by_block_height(self, block_height):
+        async with self.query("get_event_by_block_height"):
+            try:
+                async with self.engine.acquire() as conn:
+                    result = await self.statements.execute(conn, CachedStatement(
+                        ("get_event_by_block_height",), lambda: self.event.select().where(
+                            self.event.c.block_height == sa.bindparam("block_height")).order_by(
+                            self.event.c.id), {"block_height": block_height}))
+                    return await result.fetchall()
             except Exception as e:
                 self.logger.error(f"get event by block height error: {e}")
                 return None
 
+    async def get_event_by_block_range(self, start_height, end_height):
+        async with self.query("get_event_by_block_range"):
+            try:
+                async with self.engine.acquire() as conn:
+                    result = await self.statements.execute(conn, CachedStatement(
+                        ("get_event_by_block_range",), lambda: self.event.select().where(
+                            self.event.c.block_height >= sa.bindparam("start_height")).where(
+                            self.event.c.block_height <= sa.bindparam("end_height")).order_by(
+                            self.event.c.block_height, self.event.c.id),
+                        {"start_height": start_height, "end_height": end_height}))
+                    return await result.fetchall()
+            except Exception as e:
+                self.logger.error(f"get event by block range error: {e}")
+                return None
+
     async def get_event_by_id(self, event_id):
-        async with self.semaphore:
+        async with self.query("get_event_by_id"):
             try:
                 async with self.engine.acquire() as conn:
-                    query = self.event.select().where(self.event.c.id == event_id)
-                    result = await conn.execute(query)
+                    result = await self.statements.execute(conn, CachedStatement(
+                        ("get_event_by_id",), lambda: self.event.select().where(
+                            self.event.c.id == sa.bindparam("id")), {"id": event_id}))
                     return await result.fetchall()
             except Exception as e:
                 self.logger.error(f"get event by id error: {e}")
                 return None
 
     async def get_token_by_id(self, token_id):
-        async with self.semaphore:
+        unit_of_work = self.unit_of_work
+        if unit_of_work is not None:
+            found, token = unit_of_work.token.lookup(token_id)
+            if found:
+                return [token] if token is not None else []
+
+        async with self.query("get_token_by_id"):
             try:
                 async with self.engine.acquire() as conn:
-                    query = self.token.select().where(self.token.c.id == token_id)
-                    result = await conn.execute(query)
+                    result = await self.statements.execute(conn, CachedStatement(
+                        ("get_token_by_id",), lambda: self.token.select().where(
+                            self.token.c.id == sa.bindparam("id")), {"id": token_id}))
                     token = await result.fetchall()
-                    return token
+                    return self.merge_by_id(unit_of_work, "token", token_id, token)
             except Exception as e:
                 self.logger.error(f"is token exist error: {e}")
                 return None
 
     async def get_token_by_inscription_number(self, inscription_number, tick):
-        async with self.semaphore:
+        unit_of_work = self.unit_of_work
+        async with self.query("get_token_by_inscription_number"):
             try:
                 async with self.engine.acquire() as conn:
-                    query = self.token.select().where(
-                        self.token.c.inscription_number == inscription_number).where(self.token.c.tick == tick)
-                    result = await conn.execute(query)
+                    result = await self.statements.execute(conn, CachedStatement(
+                        ("get_token_by_inscription_number",), lambda: self.token.select().where(
+                            self.token.c.inscription_number == sa.bindparam("inscription_number")).where(
+                            self.token.c.tick == sa.bindparam("tick")),
+                        {"inscription_number": inscription_number, "tick": tick}))
                     token = await result.fetchall()
-                    return token
+                    if unit_of_work is None:
+                        return token
+                    return unit_of_work.token.merge(
+                        token, lambda row: row.inscription_number == inscription_number and row.tick == tick)
             except Exception as e:
                 self.logger.error(
                     f"get token by inscription number failed: {e}")
                 return None
 
-    async def save_token_info(self, value):
-        async with self.semaphore:
+    async def get_tokens(self, after_id=None, limit=10000):
+        async with self.query("get_tokens"):
             try:
                 async with self.engine.acquire() as conn:
-                    await conn.execute(insert(self.token).values(value).on_conflict_do_nothing())
-                return True
+                    query = self.token.select()
+                    if after_id is not None:
+                        query = query.where(self.token.c.id > after_id)
+                    query = query.order_by(self.token.c.id).limit(limit)
+                    result = await conn.execute(query)
+                    return await result.fetchall()
             except Exception as e:
-                self.logger.error(f"save token info error: {e}")
-                return False
+                self.logger.error(f"get tokens error: {e}")
+                return None
 
-    async def update_token_info(self, token_id, value):
-        async with self.semaphore:
-            try:
-                async with self.engine.acquire() as conn:
-                    await conn.execute(self.token.update().where(self.token.c.id == token_id).values(value))
-                return True
-            except Exception as e:
-                self.logger.error(f"update token info error: {e}")
-                return False
+    def save_token_info(self, value):
+        if self.unit_of_work is not None:
+            self.unit_of_work.token.save(value)
+            return done()
+        return self.execute(insert(self.token).values(value).on_conflict_do_nothing(), "save token info")
+
+    def update_token_info(self, token_id, value):
+        if self.unit_of_work is not None:
+            self.unit_of_work.token.update(token_id, value)
+            return done()
+        return self.execute(self.token.update().where(self.token.c.id == token_id).values(value), "update token info")
 
     async def get_balance_by_id(self, id):
-        async with self.semaphore:
+        unit_of_work = self.unit_of_work
+        if unit_of_work is not None:
+            found, balance = unit_of_work.balance.lookup(id)
+            if found:
+                return [balance] if balance is not None else []
+
+        async with self.query("get_balance_by_id"):
             try:
                 async with self.engine.acquire() as conn:
-                    query = self.balance.select().where(
-                        self.balance.c.id == id)
-                    result = await conn.execute(query)
+                    result = await self.statements.execute(conn, CachedStatement(
+                        ("get_balance_by_id",), lambda: self.balance.select().where(
+                            self.balance.c.id == sa.bindparam("id")), {"id": id}))
                     balance = await result.fetchall()
-                    return balance
+                    return self.merge_by_id(unit_of_work, "balance", id, balance)
             except Exception as e:
                 self.logger.error(f"get balance by id error: {e}")
                 return None
 
     async def get_balance_by_inscription_number(self, inscription_number, tick, address):
-        async with self.semaphore:
+        unit_of_work = self.unit_of_work
+        async with self.query("get_balance_by_inscription_number"):
             try:
                 async with self.engine.acquire() as conn:
-                    query = self.balance.select().where(
-                        self.balance.c.inscription_number == inscription_number).where(
-                        self.balance.c.tick == tick).where(
-                        self.balance.c.address == address)
-                    result = await conn.execute(query)
+                    result = await self.statements.execute(conn, CachedStatement(
+                        ("get_balance_by_inscription_number",), lambda: self.balance.select().where(
+                            self.balance.c.inscription_number == sa.bindparam("inscription_number")).where(
+                            self.balance.c.tick == sa.bindparam("tick")).where(
+                            self.balance.c.address == sa.bindparam("address")),
+                        {"inscription_number": inscription_number, "tick": tick, "address": address}))
                     balance = await result.fetchall()
-                    return balance
+                    if unit_of_work is None:
+                        return balance
+                    return unit_of_work.balance.merge(
+                        balance, lambda row: row.inscription_number == inscription_number and
+                        row.tick == tick and row.address == address)
             except Exception as e:
                 self.logger.error(
                     f"get balance by inscription number failed: {e}")
                 return None
 
-    async def save_balance_info(self, value):
-        async with self.semaphore:
+    async def get_balances(self, after_id=None, limit=10000):
+        async with self.query("get_balances"):
             try:
                 async with self.engine.acquire() as conn:
-                    await conn.execute(insert(self.balance).values(value).on_conflict_do_nothing())
-                return True
+                    query = self.balance.select()
+                    if after_id is not None:
+                        query = query.where(self.balance.c.id > after_id)
+                    query = query.order_by(self.balance.c.id).limit(limit)
+                    result = await conn.execute(query)
+                    return await result.fetchall()
             except Exception as e:
-                self.logger.error(f"save balance info error: {e}")
-                return False
+                self.logger.error(f"get balances error: {e}")
+                return None
 
-    async def update_balance_info(self, balance_id, value):
-        async with self.semaphore:
+    async def get_pools(self, after_key=None, limit=10000):
+        # pool items in key order, after the (balance_id, kind, seq) `after_key`
+        async with self.query("get_pools"):
             try:
                 async with self.engine.acquire() as conn:
-                    await conn.execute(self.balance.update().where(self.balance.c.id == balance_id).values(value))
-                return True
+                    key = sa.tuple_(self.pool.c.balance_id, self.pool.c.kind, self.pool.c.seq)
+                    query = self.pool.select()
+                    if after_key is not None:
+                        query = query.where(key > sa.tuple_(*after_key))
+                    query = query.order_by(
+                        self.pool.c.balance_id, self.pool.c.kind, self.pool.c.seq).limit(limit)
+                    result = await conn.execute(query)
+                    return await result.fetchall()
             except Exception as e:
-                self.logger.error(f"update balance info error: {e}")
-                return False
+                self.logger.error(f"get pools error: {e}")
+                return None
+
+    def save_balance_info(self, value):
+        if self.unit_of_work is not None:
+            self.unit_of_work.balance.save(value)
+            return done()
+        return self.execute(insert(self.balance).values(value).on_conflict_do_nothing(), "save balance info")
+
+    def update_balance_info(self, balance_id, value):
+        if self.unit_of_work is not None:
+            self.unit_of_work.balance.update(balance_id, value)
+            return done()
+        return self.execute(self.balance.update().where(self.balance.c.id == balance_id).values(value), "update balance info")
+
+    def save_transaction_info(self, value):
+        metrics.count_transaction(value)
+        if self.unit_of_work is not None:
+            undo = self.undo_log.block() if self.undo_log is not None else None
+            if undo is not None:
+                undo.inserted.add(value["id"])
+            self.unit_of_work.transaction.save(value)
+            return done()
+        return self.insert_transaction(value)
+
+    async def insert_transaction(self, value):
+        if await self.ensure_transaction_partitions({value["block_height"]}) is False:
+            return False
+        return await self.execute(insert(self.transaction).values(value).on_conflict_do_nothing(), "save transaction info")
+
+    def update_transaction_info(self, transaction_id, value, block_height=None):
+        metrics.count_transaction_update(value)
+        if self.unit_of_work is not None:
+            # the processors read the row first, it is upserted by its full key
+            self.record_transaction_update(transaction_id, value)
+            self.unit_of_work.transaction.update(transaction_id, value)
+            return done()
+        statement = self.transaction.update().where(self.transaction.c.id == transaction_id)
+        if block_height is not None:
+            # by id alone every partition is searched
+            statement = statement.where(self.transaction.c.block_height == block_height)
+        return self.execute(statement.values(value), "update transaction info")
+
+    async def get_transaction_by_id(self, id, block_height=None):
+        unit_of_work = self.unit_of_work
+        if unit_of_work is not None:
+            found, transaction = unit_of_work.transaction.lookup(id)
+            if found:
+                return [transaction] if transaction is not None else []
+
+            # the row may be written by the unit of work being committed
+            committing = self.committing_unit_of_work
+            if committing is not None:
+                found, transaction = committing.transaction.peek(id)
+                if found:
+                    return self.merge_by_id(unit_of_work, "transaction", id,
+                                            [transaction] if transaction is not None else [])
+
+        # read with the ids the other events ask for meanwhile
+        transaction = await self.transaction_loader.load(id, block_height)
+        if transaction is None:
+            return None
+        return self.merge_by_id(unit_of_work, "transaction", id, transaction)
+
+    async def load_transactions(self, ids, block_heights=None):
+        """
+        `get_transaction_by_id` of every id, in order, those missing in the
+        unit of work are read with one query. The rows read stay in the unit
+        of work for the next blocks it holds.
+        """
+        if block_heights is None:
+            block_heights = [None] * len(ids)
+        return await asyncio.gather(*[self.get_transaction_by_id(row_id, block_height)
+                                      for row_id, block_height in zip(ids, block_heights)])
+
+    def record_transaction_update(self, transaction_id, value):
+        # keep the values the block being handled first overwrites
+        undo = self.undo_log.block() if self.undo_log is not None else None
+        if undo is None or transaction_id in undo.inserted:
+            return
+        found, transaction = self.unit_of_work.transaction.lookup(transaction_id)
+        if not found or transaction is None:
+            return
+        undo.transaction_heights[transaction_id] = transaction["block_height"]
+        old_values = undo.transactions.setdefault(transaction_id, {})
+        for key in value:
+            old_values.setdefault(key, transaction[key])
+
+    def transactions_by_ids(self, ids, block_heights=None):
+        """
+        The select of the transactions of `ids`. A partition is only searched
+        when one of `block_heights` is in its range, by id alone all are.
+        """
+        if block_heights is None:
+            # one statement whatever the number of ids
+            return CachedStatement(
+                ("get_transactions_by_ids",), lambda: self.transaction.select().where(
+                    self.transaction.c.id == sa.any_(sa.bindparam("ids", type_=ARRAY(sa.BigInteger)))),
+                {"ids": list(ids)})
+        return CachedStatement(
+            ("get_transactions_by_ids_and_heights",), lambda: self.transaction.select().where(
+                self.transaction.c.id == sa.any_(sa.bindparam("ids", type_=ARRAY(sa.BigInteger))),
+                self.transaction.c.block_height == sa.any_(
+                    sa.bindparam("block_heights", type_=ARRAY(sa.BigInteger)))),
+            {"ids": list(ids), "block_heights": sorted(set(block_heights))})
+
+    async def get_transactions_by_ids(self, ids, block_heights=None, chunk_size=10000):
+        # the ids whose block height is known, None when it is not, are read apart
+        if block_heights is None:
+            block_heights = [None] * len(ids)
+        known = [(row_id, block_height) for row_id, block_height in zip(ids, block_heights)
+                 if block_height is not None]
+        unknown = [row_id for row_id, block_height in zip(ids, block_heights) if block_height is None]
+        statements = []
+        for i in range(0, len(known), chunk_size):
+            chunk = known[i:i + chunk_size]
+            statements.append(self.transactions_by_ids(
+                [row_id for row_id, _ in chunk], [block_height for _, block_height in chunk]))
+        for i in range(0, len(unknown), chunk_size):
+            statements.append(self.transactions_by_ids(unknown[i:i + chunk_size]))
 
-    async def save_transaction_info(self, value):
-        async with self.semaphore:
+        async with self.query("get_transactions_by_ids"):
             try:
+                transactions = []
                 async with self.engine.acquire() as conn:
-                    await conn.execute(insert(self.transaction).values(value).on_conflict_do_nothing())
+                    for statement in statements:
+                        result = await self.statements.execute(conn, statement)
+                        transactions.extend(await result.fetchall())
+                return transactions
+            except Exception as e:
+                self.logger.error(f"get transactions by ids error: {e}")
+                return None
+
+    async def execute(self, statement, action):
+        async with self.query(action.replace(" ", "_")):
+            try:
+                async with self.engine.acquire() as conn:
+                    await conn.execute(statement)
                 return True
             except Exception as e:
-                self.logger.error(f"save transaction info error: {e}")
+                self.logger.error(f"{action} error: {e}")
+                return False
+
+    def merge_by_id(self, unit_of_work, table_name, row_id, rows):
+        # overlay the pending writes on a row just read by id
+        if unit_of_work is None:
+            return rows
+        buffer = getattr(unit_of_work, table_name)
+        row = buffer.load(row_id, rows[0] if rows else None)
+        return [row] if row is not None else []
+
+    def begin_unit_of_work(self):
+        """
+        Start buffering token, balance and transaction writes. Reads through
+        this helper see the buffered writes until the unit of work is committed.
+        """
+        if self.unit_of_work is None:
+            self.unit_of_work = UnitOfWork(
+                self.token, self.balance, self.transaction, self.pool)
+        return self.unit_of_work
+
+    def rollback_unit_of_work(self):
+        self.unit_of_work = None
+
+    def detach_unit_of_work(self):
+        # stop buffering into the open unit of work and hand it over for commit,
+        # reads see it from now on, not only once its commit got to the db
+        unit_of_work, self.unit_of_work = self.unit_of_work, None
+        if unit_of_work is not None:
+            self.committing_unit_of_work = unit_of_work
+        return unit_of_work
+
+    def finish_committing(self, unit_of_work):
+        # the next unit of work may be committing already
+        if self.committing_unit_of_work is unit_of_work:
+            self.committing_unit_of_work = None
+
+    async def commit_unit_of_work(self, unit_of_work=None):
+        """
+        Apply a unit of work in one transaction. Without argument the open unit
+        of work is committed. A detached unit of work stays visible to
+        `get_transaction_by_id` while it is being committed.
+        """
+        if unit_of_work is None:
+            unit_of_work = self.detach_unit_of_work()
+        if unit_of_work is None:
+            return True
+
+        self.committing_unit_of_work = unit_of_work
+        try:
+            if await self.ensure_transaction_partitions(
+                    {row["block_height"] for row in unit_of_work.transaction.new_rows()}) is False:
                 return False
+            if self.bulk and await self.commit_bulk(unit_of_work):
+                return True
+
+            statements = self.unit_of_work_statements(unit_of_work)
+            async with self.query("commit_unit_of_work"):
+                try:
+                    async with self.engine.acquire() as conn:
+                        async with conn.begin():
+                            for statement in statements:
+                                await self.run(conn, statement)
+                    return True
+                except Exception as e:
+                    self.logger.error(f"commit unit of work error: {e}")
+                    return False
+        finally:
+            self.finish_committing(unit_of_work)
 
-    async def update_transaction_info(self, transaction_id, value):
-        async with self.semaphore:
+    async def commit_bulk(self, unit_of_work):
+        """
+        Commit a unit of work on a psycopg2 connection, the new balance and
+        transaction rows with COPY. A rebuild only inserts rows that do not
+        exist, if one does the COPY fails and False is returned, the caller
+        commits with inserts instead.
+        """
+        copy_tables = [self.balance, self.transaction]
+        copies = [(table, self.copy_data(table, getattr(unit_of_work, name).new_rows()))
+                  for name, table in zip(["balance", "transaction"], copy_tables)]
+        statements = self.unit_of_work_statements(unit_of_work, copy_tables)
+        async with self.query("commit_bulk"):
             try:
-                async with self.engine.acquire() as conn:
-                    await conn.execute(self.transaction.update().where(self.transaction.c.id == transaction_id).values(value))
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, self.execute_bulk, copies, statements)
                 return True
             except Exception as e:
-                self.logger.error(f"update transaction info error: {e}")
+                self.logger.warning(f"bulk commit error: {e}, commit with inserts")
                 return False
 
-    async def get_transaction_by_id(self, id):
-        async with self.semaphore:
+    def execute_bulk(self, copies, statements):
+        # run in a thread, one transaction
+        with self.get_sync_engine().begin() as conn:
+            cursor = conn.connection.cursor()
+            for table, data in copies:
+                if not data:
+                    continue
+                columns = ", ".join(f'"{column.name}"' for column in table.columns)
+                cursor.copy_expert(
+                    f'COPY "{table.name}" ({columns}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')',
+                    io.StringIO(data))
+            for statement in statements:
+                if isinstance(statement, CachedStatement):
+                    conn.execute(statement.build(), statement.params)
+                else:
+                    conn.execute(statement)
+
+    def copy_data(self, table, rows):
+        # csv for COPY, NULL is an unquoted \N so no string is taken for it
+        names = [column.name for column in table.columns]
+        return "".join(",".join(copy_value(row[name]) for name in names) + "\n" for row in rows)
+
+    def unit_of_work_statements(self, unit_of_work, copy_tables=()):
+        """
+        Build the statements of a unit of work: multi-row inserts for new rows
+        and multi-row upserts for changed rows, grouped by changed columns.
+        The new rows of `copy_tables` are left out, they are copied.
+        """
+        statements = []
+        for buffer in unit_of_work.tables():
+            table = buffer.table
+
+            new_rows = buffer.new_rows() if table not in copy_tables else []
+            for rows in self.chunk_rows(new_rows):
+                statements.append(self.insert_rows(table, rows))
+
+            key = self.transaction_key() if table is self.transaction else [table.c.id]
+            for columns, changed_rows in buffer.changed_rows().items():
+                for rows in self.chunk_rows(changed_rows):
+                    statements.append(self.insert_rows(table, rows, key, columns))
+
+            for row_id, values in buffer.blind.items():
+                statements.append(
+                    table.update().where(table.c.id == row_id).values(values))
+
+        statements.extend(self.pool_statements(
+            list(unit_of_work.pool.rows.values()), list(unit_of_work.pool.deleted)))
+
+        if unit_of_work.end_height is not None:
+            statement = insert(self.cursor).values(
+                id=self.cursor_id,
+                block_height=unit_of_work.end_height,
+                event_id=unit_of_work.last_event_id,
+            )
+            statements.append(statement.on_conflict_do_update(
+                index_elements=[self.cursor.c.id],
+                set_={
+                    "block_height": statement.excluded.block_height,
+                    "event_id": sa.func.coalesce(statement.excluded.event_id, self.cursor.c.event_id),
+                }
+            ))
+
+        if unit_of_work.undo:
+            undo_rows = [{
+                "id": self.cursor_id,
+                "block_height": undo.block_height,
+                "block_hash": undo.block_hash,
+                "undo": undo.to_json(),
+            } for undo in unit_of_work.undo]
+            for rows in self.chunk_rows(undo_rows):
+                statements.append(self.insert_rows(
+                    self.undo, rows, [self.undo.c.id, self.undo.c.block_height], ["block_hash", "undo"]))
+            statements.append(self.undo.delete().where(
+                self.undo.c.id == self.cursor_id).where(
+                self.undo.c.block_height <= unit_of_work.end_height - self.undo_depth))
+
+        return statements
+
+    async def rollback_blocks(self, fork_height):
+        """
+        Undo the committed blocks from `fork_height` on in one transaction,
+        latest block first, and move the cursor back before `fork_height`.
+        Return False if the undo table does not reach back to `fork_height`.
+        """
+        async with self.query("rollback_blocks"):
             try:
                 async with self.engine.acquire() as conn:
-                    query = self.transaction.select().where(
-                        self.transaction.c.id == id)
-                    result = await conn.execute(query)
-                    transaction = await result.fetchall()
-                    return transaction
+                    async with conn.begin():
+                        cursor = await conn.scalar(sa.select(self.cursor.c.block_height).where(
+                            self.cursor.c.id == self.cursor_id))
+                        query = self.undo.select().where(
+                            self.undo.c.id == self.cursor_id).where(
+                            self.undo.c.block_height >= fork_height).order_by(
+                            self.undo.c.block_height.desc())
+                        result = await conn.execute(query)
+                        undo_rows = await result.fetchall()
+                        heights = {row.block_height for row in undo_rows}
+                        if cursor is not None and \
+                                not heights.issuperset(range(fork_height, cursor + 1)):
+                            self.logger.error(
+                                f"rollback to block {fork_height} error: undo log does not reach back to it")
+                            return False
+
+                        for row in undo_rows:
+                            for statement in self.undo_statements(row.undo, row.block_height):
+                                await self.run(conn, statement)
+                        await conn.execute(self.undo.delete().where(
+                            self.undo.c.id == self.cursor_id).where(
+                            self.undo.c.block_height >= fork_height))
+                        await conn.execute(self.cursor.update().where(
+                            self.cursor.c.id == self.cursor_id).values(
+                            block_height=fork_height - 1, event_id=None))
+                return True
             except Exception as e:
-                self.logger.error(f"get transaction by id error: {e}")
-                return None
+                self.logger.error(f"rollback to block {fork_height} error: {e}")
+                return False
+
+    def pool_statements(self, rows, deleted_keys):
+        # upsert the pool items added and delete the removed ones, by key
+        statements = []
+        key = sa.tuple_(self.pool.c.balance_id, self.pool.c.kind, self.pool.c.seq)
+        for keys in self.chunk_rows(deleted_keys):
+            statements.append(self.pool.delete().where(key.in_(keys)))
+        for chunk in self.chunk_rows(rows):
+            statements.append(self.insert_rows(
+                self.pool, chunk, [self.pool.c.balance_id, self.pool.c.kind, self.pool.c.seq],
+                ["inscription_id", "transaction_id", "block_height", "nonce", "amt"]))
+        return statements
+
+    def undo_statements(self, undo, block_height=None):
+        statements = []
+        for table, images in [(self.token, undo["token"]), (self.balance, undo["balance"])]:
+            for row_id, image in images.items():
+                if image is None:
+                    statements.append(table.delete().where(table.c.id == row_id))
+                    continue
+                statement = insert(table).values(image)
+                statements.append(statement.on_conflict_do_update(
+                    index_elements=[table.c.id],
+                    set_={column.name: statement.excluded[column.name]
+                          for column in table.columns if column.name != "id"}
+                ))
+
+        deleted_keys = [(balance_id, kind, seq)
+                        for balance_id, kind, seq, image in undo["pool"] if image is None]
+        images = [image for _, _, _, image in undo["pool"] if image is not None]
+        statements.extend(self.pool_statements(images, deleted_keys))
+
+        # undo records written before the heights were kept update by id alone
+        heights = undo.get("transaction_height", {})
+        for transaction_id, values in undo["transaction"].items():
+            statement = self.transaction.update().where(self.transaction.c.id == int(transaction_id))
+            if heights.get(transaction_id) is not None:
+                statement = statement.where(self.transaction.c.block_height == heights[transaction_id])
+            statements.append(statement.values(values))
+        if undo["inserted"]:
+            statement = self.transaction.delete().where(self.transaction.c.id.in_(undo["inserted"]))
+            if block_height is not None:
+                # the block inserted them, only its partition is scanned
+                statement = statement.where(self.transaction.c.block_height == block_height)
+            statements.append(statement)
+        return statements
+
+    def insert_rows(self, table, rows, key=None, columns=None):
+        """
+        A multi-row insert of complete rows, ON CONFLICT DO NOTHING, or DO
+        UPDATE `columns` on conflict of the `key` columns. Compiled once per
+        table, number of rows and columns.
+        """
+        columns_by_name = {column.name: column for column in table.columns}
+        names = list(columns_by_name)
+        count = len(rows)
+        key_names = tuple(column.name for column in key) if key is not None else ()
+        columns = tuple(sorted(columns)) if columns is not None else None
+
+        def build():
+            # typed, only the first row would get the column types otherwise
+            statement = insert(table).values([
+                {name: sa.bindparam(f"{name}_{i}", type_=columns_by_name[name].type) for name in names}
+                for i in range(count)])
+            if columns is None:
+                return statement.on_conflict_do_nothing()
+            return statement.on_conflict_do_update(
+                index_elements=[table.c[name] for name in key_names],
+                set_={column: statement.excluded[column] for column in columns})
+
+        params = {f"{name}_{i}": row[name] for i, row in enumerate(rows) for name in names}
+        kind = "insert" if columns is None else "upsert"
+        return CachedStatement((f"{kind}_{table.name}", count, key_names, columns), build, params)
+
+    async def run(self, conn, statement):
+        # execute a statement, cached statements through the statement cache
+        if isinstance(statement, CachedStatement):
+            return await self.statements.execute(conn, statement)
+        return await conn.execute(statement)
+
+    def chunk_rows(self, rows):
+        for i in range(0, len(rows), self.multi_row_size):
+            yield rows[i:i + self.multi_row_size]
 
 
 if __name__ == "__main__":
@@ -1,7 +1,14 @@
+import os
+import sys
 import asyncio
 import aioredis
 from environs import Env
 
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
+
+from src.metrics import timed_call  # noqa
+
 
 class RedisHelper:
 
@@ -22,13 +29,21 @@ class RedisHelper:
 
         self.redis_key_output = "event_output"
         self.redis_key_current_block = "current_block"
+        # no longer written, the indexer resumes from its cursor in postgres
         self.redis_key_handled_event = f"indexer_handled_event_{db_version}"
+        # heights committed by each shard and by all of them, see sharding.py
+        self.redis_key_shard_height = f"indexer_shard_height_{db_version}"
+        self.redis_key_committed_height = f"indexer_committed_height_{db_version}"
+
+    def query(self, call):
+        # a round trip, counted and timed in metrics.py
+        return timed_call(self.semaphore, "redis", call)
 
     async def close(self):
         await self.pool.disconnect()
 
     async def get_output_from_redis(self, output_id):
-        async with self.semaphore:
+        async with self.query("get_output_from_redis"):
             try:
                 return await self.redis.hget(self.redis_key_output, output_id)
             except Exception as e:
@@ -36,32 +51,107 @@ class RedisHelper:
                 return False
 
     async def get_current_block_from_redis(self):
-        async with self.semaphore:
+        async with self.query("get_current_block_from_redis"):
             try:
                 return await self.redis.get(self.redis_key_current_block)
             except Exception as e:
                 self.logger.error(f"get current block from redis error: {e}")
                 return False
 
-    async def set_handled_event(self, event_id):
-        async with self.semaphore:
+    async def set_shard_height(self, shard_id, block_height):
+        async with self.query("set_shard_height"):
+            try:
+                await self.redis.hset(self.redis_key_shard_height, shard_id, block_height)
+                return True
+            except Exception as e:
+                self.logger.error(f"set shard height error: {e}")
+                return False
+
+    async def get_shard_heights(self):
+        async with self.query("get_shard_heights"):
+            try:
+                return await self.redis.hgetall(self.redis_key_shard_height)
+            except Exception as e:
+                self.logger.error(f"get shard heights error: {e}")
+                return None
+
+    async def set_committed_height(self, block_height):
+        async with self.query("set_committed_height"):
+            try:
+                await self.redis.set(self.redis_key_committed_height, block_height)
+                return True
+            except Exception as e:
+                self.logger.error(f"set committed height error: {e}")
+                return False
+
+    async def missing_keyspace_flags(self):
+        # the flags of keyspace notifications for string commands not set, None on error
+        async with self.query("missing_keyspace_flags"):
             try:
-                await self.redis.hset(self.redis_key_handled_event, event_id, "")
+                config = await self.redis.config_get("notify-keyspace-events")
+                flags = config.get("notify-keyspace-events", "")
+                missing = "K" if "K" not in flags else ""
+                if "$" not in flags and "A" not in flags:
+                    missing += "$"
+                return flags, missing
+            except Exception as e:
+                self.logger.warning(f"get keyspace notifications error: {e}")
+                return None
+
+    async def enable_keyspace_notifications(self, configure=False):
+        """
+        Whether the keyspace notifications of `current_block` are sent. The
+        setting is server wide, it is only changed with `configure`, adding
+        the missing flags to the others.
+        """
+        found = await self.missing_keyspace_flags()
+        if found is None:
+            return False
+        flags, missing = found
+        if not missing:
+            return True
+        if not configure:
+            self.logger.warning(
+                f"redis notify-keyspace-events lacks \"{missing}\", only the {self.redis_key_current_block} channel "
+                f"and polling wake the indexer, set it or run with --redis_notify_config")
+            return False
+        async with self.query("enable_keyspace_notifications"):
+            try:
+                await self.redis.config_set("notify-keyspace-events", flags + missing)
                 return True
             except Exception as e:
-                self.logger.error(f"set handled event error: {e}")
+                self.logger.warning(
+                    f"enable keyspace notifications error: {e}")
                 return False
 
-    async def is_event_exists(self, event_id):
-        async with self.semaphore:
+    async def subscribe_current_block(self, configure=False):
+        """
+        Subscribe to the changes of `current_block`: its keyspace notifications
+        and the `current_block` channel, for producers that publish to it.
+        Polling stays the fallback when the keyspace notifications are off.
+        """
+        await self.enable_keyspace_notifications(configure)
+        try:
+            db = self.pool.connection_kwargs.get("db", 0)
+            pubsub = self.redis.pubsub()
+            await pubsub.subscribe(
+                f"__keyspace@{db}__:{self.redis_key_current_block}",
+                self.redis_key_current_block)
+            return pubsub
+        except Exception as e:
+            self.logger.error(f"subscribe current block error: {e}")
+            return None
+
+    async def del_shard_heights(self):
+        async with self.query("del_shard_heights"):
             try:
-                return await self.redis.hexists(self.redis_key_handled_event, event_id)
+                return await self.redis.delete(self.redis_key_shard_height, self.redis_key_committed_height)
             except Exception as e:
-                self.logger.error(f"query exist of handled event error: {e}")
+                self.logger.error(f"del shard heights error: {e}")
                 return False
 
     async def del_handled_event_db(self):
-        async with self.semaphore:
+        async with self.query("del_handled_event_db"):
             try:
                 return await self.redis.delete(self.redis_key_handled_event)
             except Exception as e:
@@ -0,0 +1,70 @@
+import os
+import sys
+import asyncio
+
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
+
+from src.tracer import EventTrace, current_trace  # noqa
+
+
+class RowLoader:
+    """
+    Coalesces the reads by id of a table: the ids requested during one turn
+    of the event loop are read together by `read_rows(ids, block_heights)`,
+    one query for all the events running concurrently. `read_rows` returns
+    the rows found, None on error. The block height of an id is None when a
+    requester does not know it.
+
+    The one round trip is recorded in the trace of every event waiting on it,
+    as shared, rather than in the trace of the first one only.
+    """
+
+    def __init__(self, read_rows):
+        self.read_rows = read_rows
+        # id -> future of [row] or [], None on error
+        self.pending = {}
+        # id -> block height of the pending ids
+        self.block_heights = {}
+        # traces of the events waiting on the pending ids
+        self.traces = set()
+
+    def load(self, row_id, block_height=None):
+        trace = current_trace.get()
+        if trace is not None:
+            self.traces.add(trace)
+        future = self.pending.get(row_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            if not self.pending:
+                loop.call_soon(self.dispatch)
+            future = self.pending[row_id] = loop.create_future()
+            self.block_heights[row_id] = block_height
+        elif self.block_heights[row_id] != block_height:
+            self.block_heights[row_id] = None
+        return future
+
+    def dispatch(self):
+        pending, self.pending = self.pending, {}
+        traces, self.traces = self.traces, set()
+        block_heights, self.block_heights = self.block_heights, {}
+        asyncio.ensure_future(self.fetch(pending, block_heights, traces))
+
+    async def fetch(self, pending, block_heights, traces):
+        # the task runs in the context of the first event, record in a trace of its own
+        shared = EventTrace(None, None)
+        current_trace.set(shared)
+        try:
+            rows = await self.read_rows(list(pending), [block_heights[row_id] for row_id in pending])
+        except Exception:
+            rows = None
+        for trace in traces:
+            trace.record_shared(shared, len(traces))
+        rows_by_id = {row.id: row for row in rows} if rows is not None else None
+        for row_id, future in pending.items():
+            if future.done():
+                continue
+            if rows_by_id is None:
+                future.set_result(None)
+            else:
+                future.set_result([rows_by_id[row_id]] if row_id in rows_by_id else [])
@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import sqlite3
+
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
+
+from src.dbs.memory_helper import MemoryPgsqlHelper  # noqa
+from src.dbs.unit_of_work import Record  # noqa
+
+
+def encode_key(key):
+    # tuple keys of the pool and undo tables are stored as json lists
+    return json.dumps(list(key) if isinstance(key, tuple) else key)
+
+
+def decode_key(text):
+    key = json.loads(text)
+    return tuple(key) if isinstance(key, list) else key
+
+
+class SqlitePgsqlHelper(MemoryPgsqlHelper):
+    """
+    MemoryPgsqlHelper written through to a SQLite file, so a replay or a dry
+    run can stop and resume without postgres. The tables are read into the
+    dicts at init, the rows every commit, rollback or direct write touched
+    are written back in one SQLite transaction. Rows are stored as json,
+    amounts do not fit SQLite integers.
+    """
+
+    def __init__(self, logger, db_version="A", path="orc20.sqlite", events=None):
+        super().__init__(logger, db_version, events)
+        self.path = path
+        self.conn = None
+        # table name -> keys of the rows to write back
+        self.touched = {name: set() for name in self.rows}
+
+    async def init(self):
+        if self.conn is not None:
+            return
+        self.conn = sqlite3.connect(self.path)
+        with self.conn:
+            for name, rows in self.rows.items():
+                self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{name}" (key TEXT PRIMARY KEY, row TEXT)')
+                for key, row in self.conn.execute(f'SELECT key, row FROM "{name}"'):
+                    rows[decode_key(key)] = Record(json.loads(row))
+
+    async def close(self):
+        if self.conn is None:
+            return
+        self.save()
+        self.conn.close()
+        self.conn = None
+
+    def touch(self, table_name, keys):
+        self.touched[table_name].update(keys)
+
+    def save(self):
+        # write the touched rows back, a row gone is deleted
+        try:
+            with self.conn:
+                for name, keys in self.touched.items():
+                    rows = self.rows[name]
+                    for key in keys:
+                        row = rows.get(key)
+                        if row is None:
+                            self.conn.execute(f'DELETE FROM "{name}" WHERE key = ?', (encode_key(key),))
+                        else:
+                            self.conn.execute(f'INSERT OR REPLACE INTO "{name}" (key, row) VALUES (?, ?)',
+                                              (encode_key(key), json.dumps(row)))
+            for keys in self.touched.values():
+                keys.clear()
+            return True
+        except Exception as e:
+            self.logger.error(f"save sqlite {self.path} error: {e}")
+            return False
+
+    def clear_table(self, table):
+        self.touched[table.name].clear()
+        with self.conn:
+            self.conn.execute(f'DELETE FROM "{table.name}"')
+        return True
+
+    def insert_row(self, table, value):
+        super().insert_row(table, value)
+        self.touch(table.name, [value["id"]])
+
+    def insert_pool_row(self, value):
+        super().insert_pool_row(value)
+        self.touch(self.pool.name, [(value["balance_id"], value["kind"], value["seq"])])
+
+    def update_row(self, table, row_id, values):
+        super().update_row(table, row_id, values)
+        self.touch(table.name, [row_id])
+
+    async def create_token_table(self):
+        await super().create_token_table()
+        return self.clear_table(self.token)
+
+    async def create_balance_table(self):
+        await super().create_balance_table()
+        return self.clear_table(self.balance)
+
+    async def create_pool_table(self):
+        await super().create_pool_table()
+        return self.clear_table(self.pool)
+
+    async def create_transaction_table(self):
+        await super().create_transaction_table()
+        return self.clear_table(self.transaction)
+
+    async def create_cursor_table(self):
+        await super().create_cursor_table()
+        return self.clear_table(self.cursor)
+
+    async def create_undo_table(self):
+        await super().create_undo_table()
+        return self.clear_table(self.undo)
+
+    async def commit_unit_of_work(self, unit_of_work=None):
+        if unit_of_work is None:
+            unit_of_work = self.detach_unit_of_work()
+        if unit_of_work is None:
+            return True
+
+        for buffer in unit_of_work.tables():
+            self.touch(buffer.table.name, [row["id"] for row in buffer.new_rows()])
+            self.touch(buffer.table.name, buffer.dirty)
+            self.touch(buffer.table.name, buffer.blind)
+        self.touch(self.pool.name, unit_of_work.pool.rows)
+        self.touch(self.pool.name, unit_of_work.pool.deleted)
+        self.touch(self.cursor.name, [self.cursor_id])
+        # the undo records added and the ones pruned
+        undo_keys = set(self.rows[self.undo.name])
+        self.touch(self.undo.name, [(self.cursor_id, undo.block_height) for undo in unit_of_work.undo])
+
+        await super().commit_unit_of_work(unit_of_work)
+        self.touch(self.undo.name, undo_keys - set(self.rows[self.undo.name]))
+        return self.save()
+
+    async def rollback_blocks(self, fork_height):
+        undo_rows = self.rows[self.undo.name]
+        keys = [key for key in undo_rows if key[0] == self.cursor_id and key[1] >= fork_height]
+        for key in keys:
+            undo = undo_rows[key]["undo"]
+            self.touch(self.token.name, undo["token"])
+            self.touch(self.balance.name, undo["balance"])
+            self.touch(self.pool.name, [tuple(item[:3]) for item in undo["pool"]])
+            self.touch(self.transaction.name, [int(row_id) for row_id in undo["transaction"]])
+            self.touch(self.transaction.name, undo["inserted"])
+        self.touch(self.undo.name, keys)
+        self.touch(self.cursor.name, [self.cursor_id])
+
+        if await super().rollback_blocks(fork_height) is False:
+            return False
+        return self.save()
@@ -0,0 +1,355 @@
+import os
+import sys
+
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
+
+from src.dbs.unit_of_work import Record, coerce_value, complete_row  # noqa
+
+POOL_KINDS = ["pending_send_pool", "available_send_pool", "sent_send_pool",
+              "received_send_pool", "received_mint_pool"]
+
+
+class Pool:
+    """
+    The items of one pool of a balance by seq, in the order they were added,
+    and the seqs of the items of every inscription id and every nonce. An
+    inscription may have several items, a pending send transferred twice
+    is sent twice, lookups give the first one.
+    """
+    __slots__ = ("items", "inscriptions", "nonces")
+
+    def __init__(self):
+        self.items = {}
+        self.inscriptions = {}
+        self.nonces = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        # over a copy, the pool may change while it is walked
+        return iter(list(self.items.values()))
+
+    def __contains__(self, inscription_id):
+        return inscription_id in self.inscriptions
+
+    def get(self, inscription_id):
+        seqs = self.inscriptions.get(inscription_id)
+        if not seqs:
+            return None
+        return self.items[next(iter(seqs))]
+
+    def first_by_nonce(self, nonce):
+        try:
+            seqs = self.nonces.get(nonce)
+        except TypeError:
+            # an unhashable nonce of a cancel never matches
+            return None
+        if not seqs:
+            return None
+        return self.items[next(iter(seqs))]
+
+    def next_seq(self):
+        # the items are kept in seq order
+        if not self.items:
+            return 1
+        return next(reversed(self.items.values()))["seq"] + 1
+
+    def add(self, item):
+        self.items[item["seq"]] = item
+        self.inscriptions.setdefault(item["inscription_id"], {})[item["seq"]] = None
+        if item["nonce"] is not None:
+            self.nonces.setdefault(item["nonce"], {})[item["seq"]] = None
+
+    def remove(self, seq):
+        item = self.items.pop(seq, None)
+        if item is None:
+            return None
+        for index, key in [(self.inscriptions, item["inscription_id"]), (self.nonces, item["nonce"])]:
+            if key is None:
+                continue
+            seqs = index[key]
+            del seqs[seq]
+            if not seqs:
+                del index[key]
+        return item
+
+    def sort(self):
+        items = sorted(self.items.values(), key=lambda item: item["seq"])
+        self.items = {}
+        self.inscriptions = {}
+        self.nonces = {}
+        for item in items:
+            self.add(item)
+
+
+class StateStore:
+    """
+    Authoritative in-memory copy of the token, balance and pool tables.
+
+    Processors read rows from the store and change them in place through
+    `update_token` / `update_balance`. Changed rows are only marked dirty, they
+    are written to postgres when the indexer flushes a unit of work, so several
+    changes to one row collapse into a single write.
+
+    The send and mint pools of a balance are `Pool`s, changed one item at a
+    time through `add_to_pool` / `remove_from_pool`, and only the items added
+    or removed are written. Pool items and the upgrade lists items are never
+    changed in place, processors replace them with a changed copy.
+
+    `row_filter` keeps only some of the rows when loading, a shard only holds
+    the tokens it owns. With an `undo_log`, the first time a block reads or
+    writes a row the row is copied into the undo record of the block.
+    """
+
+    def __init__(self, token_table, balance_table, pool_table, page_size=10000, row_filter=None):
+        self.token_table = token_table
+        self.balance_table = balance_table
+        self.pool_table = pool_table
+        self.page_size = page_size
+        self.row_filter = row_filter
+        self.undo_log = None
+
+        self.tokens = {}
+        self.balances = {}
+        # balance id -> kind -> Pool
+        self.pools = {}
+        # (inscription_number, tick) -> token id
+        self.token_by_inscription_number = {}
+
+        self.new_tokens = set()
+        self.new_balances = set()
+        self.dirty_tokens = {}
+        self.dirty_balances = {}
+        # (balance_id, kind, seq) of the pool items added or removed
+        self.dirty_pool_items = set()
+
+    def clear(self):
+        self.tokens.clear()
+        self.balances.clear()
+        self.pools.clear()
+        self.token_by_inscription_number.clear()
+        self.new_tokens.clear()
+        self.new_balances.clear()
+        self.dirty_tokens.clear()
+        self.dirty_balances.clear()
+        self.dirty_pool_items.clear()
+
+    async def load(self, pgsql):
+        # read the whole token and balance tables, page by page
+        self.clear()
+
+        for fetch, rows, add in [(pgsql.get_tokens, self.tokens, self.index_token),
+                                 (pgsql.get_balances, self.balances, None)]:
+            last_id = None
+            while True:
+                page = await fetch(last_id, self.page_size)
+                if page is None:
+                    return False
+                for row in page:
+                    if self.row_filter is not None and not self.row_filter(row):
+                        continue
+                    row = Record(row)
+                    rows[row.id] = row
+                    if add is not None:
+                        add(row)
+                if len(page) < self.page_size:
+                    break
+                last_id = page[-1].id
+
+        last_key = None
+        while True:
+            page = await pgsql.get_pools(last_key, self.page_size)
+            if page is None:
+                return False
+            for row in page:
+                if self.row_filter is not None and row.balance_id not in self.balances:
+                    continue
+                self.pool(row.balance_id, row.kind).add(Record(row))
+            if len(page) < self.page_size:
+                break
+            last_key = (page[-1].balance_id, page[-1].kind, page[-1].seq)
+
+        return True
+
+    def index_token(self, token):
+        key = (token.inscription_number, token.tick)
+        self.token_by_inscription_number.setdefault(key, token.id)
+
+    def unindex_token(self, token):
+        key = (token.inscription_number, token.tick)
+        if self.token_by_inscription_number.get(key) == token.id:
+            del self.token_by_inscription_number[key]
+
+    def record(self, name, rows, row_id):
+        # keep the row as it was before the block being handled first touched it
+        undo = self.undo_log.block() if self.undo_log is not None else None
+        if undo is None:
+            return
+        images = getattr(undo, name)
+        if row_id not in images:
+            row = rows.get(row_id)
+            images[row_id] = self.snapshot(row) if row is not None else None
+
+    def get_token(self, token_id):
+        self.record("tokens", self.tokens, token_id)
+        return self.tokens.get(token_id)
+
+    def get_token_by_inscription_number(self, inscription_number, tick):
+        token_id = self.token_by_inscription_number.get(
+            (inscription_number, tick))
+        if token_id is None:
+            return None
+        self.record("tokens", self.tokens, token_id)
+        return self.tokens[token_id]
+
+    def save_token(self, value):
+        # same semantic as INSERT ... ON CONFLICT DO NOTHING
+        self.record("tokens", self.tokens, value["id"])
+        if value["id"] in self.tokens:
+            return
+        token = complete_row(self.token_table.columns, value)
+        self.tokens[token.id] = token
+        self.new_tokens.add(token.id)
+        self.index_token(token)
+
+    def update_token(self, token_id, values):
+        self.record("tokens", self.tokens, token_id)
+        token = self.tokens.get(token_id)
+        if token is None:
+            return
+        self.apply(self.token_table, token, values)
+        if token_id not in self.new_tokens:
+            self.dirty_tokens.setdefault(token_id, set()).update(values.keys())
+
+    def get_balance(self, balance_id):
+        self.record("balances", self.balances, balance_id)
+        return self.balances.get(balance_id)
+
+    def save_balance(self, value):
+        # same semantic as INSERT ... ON CONFLICT DO NOTHING
+        self.record("balances", self.balances, value["id"])
+        if value["id"] in self.balances:
+            return
+        balance = complete_row(self.balance_table.columns, value)
+        self.balances[balance.id] = balance
+        self.new_balances.add(balance.id)
+
+    def update_balance(self, balance_id, values):
+        self.record("balances", self.balances, balance_id)
+        balance = self.balances.get(balance_id)
+        if balance is None:
+            return
+        self.apply(self.balance_table, balance, values)
+        if balance_id not in self.new_balances:
+            self.dirty_balances.setdefault(
+                balance_id, set()).update(values.keys())
+
+    def pool(self, balance_id, kind):
+        pools = self.pools.setdefault(balance_id, {})
+        pool = pools.get(kind)
+        if pool is None:
+            pool = pools[kind] = Pool()
+        return pool
+
+    def get_pool(self, balance_id, kind):
+        # read only, change it with add_to_pool / remove_from_pool / clear_pool
+        pool = self.pools.get(balance_id, {}).get(kind)
+        return pool if pool is not None else Pool()
+
+    def record_pool_item(self, key):
+        undo = self.undo_log.block() if self.undo_log is not None else None
+        if undo is not None and key not in undo.pools:
+            balance_id, kind, seq = key
+            undo.pools[key] = self.get_pool(balance_id, kind).items.get(seq)
+
+    def add_to_pool(self, balance_id, kind, item):
+        # append `item` to a pool, after the items of the same inscription if any
+        pool = self.pool(balance_id, kind)
+        seq = pool.next_seq()
+        key = (balance_id, kind, seq)
+        self.record_pool_item(key)
+        pool.add(complete_row(self.pool_table.columns, dict(
+            item, balance_id=balance_id, kind=kind, seq=seq)))
+        self.dirty_pool_items.add(key)
+
+    def remove_from_pool(self, balance_id, kind, item):
+        # remove `item`, an item of the pool, by its seq
+        key = (balance_id, kind, item["seq"])
+        self.record_pool_item(key)
+        item = self.get_pool(balance_id, kind).remove(item["seq"])
+        if item is not None:
+            self.dirty_pool_items.add(key)
+        return item
+
+    def clear_pool(self, balance_id, kind):
+        for item in self.get_pool(balance_id, kind):
+            self.remove_from_pool(balance_id, kind, item)
+
+    def pool_rows(self):
+        return [item for pools in self.pools.values()
+                for pool in pools.values() for item in pool.items.values()]
+
+    def apply(self, table, row, values):
+        for key, value in values.items():
+            row[key] = coerce_value(table.columns[key], value)
+
+    def snapshot(self, row):
+        # copy the row and its lists, the items are never changed in place
+        return Record({key: list(value) if isinstance(value, list) else value
+                       for key, value in row.items()})
+
+    def restore(self, undo):
+        """
+        Put back the rows of an undo record. Records must be restored latest
+        block first, and only once everything changed has been flushed.
+        """
+        for token_id, image in undo.tokens.items():
+            token = self.tokens.pop(token_id, None)
+            if token is not None:
+                self.unindex_token(token)
+            if image is not None:
+                token = self.tokens[token_id] = self.snapshot(image)
+                self.index_token(token)
+
+        for balance_id, image in undo.balances.items():
+            self.balances.pop(balance_id, None)
+            if image is not None:
+                self.balances[balance_id] = self.snapshot(image)
+
+        pools = set()
+        for (balance_id, kind, seq), image in undo.pools.items():
+            pool = self.pool(balance_id, kind)
+            pool.remove(seq)
+            if image is not None:
+                pool.add(image)
+                pools.add(pool)
+        # put the items back at their place
+        for pool in pools:
+            pool.sort()
+
+    def flush_into(self, unit_of_work):
+        """
+        Move the rows changed since the last flush into `unit_of_work`. The
+        copies are taken now, so the store can keep changing while the unit of
+        work is written in the background.
+        """
+        for rows, new, dirty, buffer in [
+                (self.tokens, self.new_tokens, self.dirty_tokens, unit_of_work.token),
+                (self.balances, self.new_balances, self.dirty_balances, unit_of_work.balance)]:
+            for row_id in new:
+                buffer.stage(self.snapshot(rows[row_id]))
+            for row_id, columns in dirty.items():
+                buffer.stage(self.snapshot(rows[row_id]), columns)
+            new.clear()
+            dirty.clear()
+
+        for key in self.dirty_pool_items:
+            balance_id, kind, seq = key
+            unit_of_work.pool.stage(key, self.get_pool(balance_id, kind).items.get(seq))
+        self.dirty_pool_items.clear()
+
+    def dirty_count(self):
+        return len(self.new_tokens) + len(self.new_balances) + \
+            len(self.dirty_tokens) + len(self.dirty_balances) + len(self.dirty_pool_items)
@@ -0,0 +1,125 @@
+"""
+Statements compiled once per shape. Building and compiling a SQLAlchemy
+construct takes about 0.3 ms for a select by id and 70 ms for an insert of
+500 rows, on the event loop thread. A shape is built once with named bind
+parameters, compiled, and executed again with the values of every call.
+
+psycopg2 has no server-side prepared statements, the SQL text is still
+sent with every call, only the compilation is saved.
+
+Executing a compiled statement repeats what `SAConnection.execute` of
+aiopg does, with private parts of aiopg and SQLAlchemy. They were checked
+against aiopg 1.4 and SQLAlchemy 1.4 only, with other versions the cache
+is disabled and the statements are built and executed by aiopg.
+"""
+import os
+import sys
+from collections import OrderedDict
+import aiopg
+import sqlalchemy
+from aiopg.sa.result import ResultProxy
+
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
+
+from src.metrics import metrics  # noqa
+
+
+# the versions the private parts used below were checked against
+SUPPORTED_VERSIONS = {"aiopg": "1.4.", "SQLAlchemy": "1.4."}
+
+
+def unsupported_versions():
+    # name -> version of the packages not in SUPPORTED_VERSIONS
+    versions = {"aiopg": aiopg.__version__, "SQLAlchemy": sqlalchemy.__version__}
+    return {name: version for name, version in versions.items()
+            if not version.startswith(SUPPORTED_VERSIONS[name])}
+
+
+class CachedStatement:
+    """
+    A statement of a cached shape: `key` names the shape, `build()` makes
+    it with the bind parameters `params` gives values to.
+    """
+    __slots__ = ("key", "build", "params")
+
+    def __init__(self, key, build, params):
+        self.key = key
+        self.build = build
+        self.params = params
+
+
+class CompiledStatement:
+    __slots__ = ("sql", "compiled", "processors", "result_map")
+
+    def __init__(self, statement, dialect):
+        compiled = statement.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+        self.sql = str(compiled)
+        self.compiled = compiled
+        self.processors = compiled._bind_processors
+        # the result columns, for the types of the values read
+        self.result_map = compiled._result_columns
+
+    def parameters(self, params):
+        values = self.compiled.construct_params(params)
+        for key, processor in self.processors.items():
+            if key in values:
+                values[key] = processor(values[key])
+        return values
+
+
+class StatementCache:
+    """
+    LRU of the compiled statements by shape, up to `max_entries` shapes.
+    Lookups are counted in `hits` and `misses` and in the metrics by name,
+    the first item of the key. The cache is disabled, `enabled` False, when
+    aiopg or SQLAlchemy is not a supported version.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.unsupported = unsupported_versions()
+        self.enabled = not self.unsupported
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, statement, dialect):
+        entries = self.entries
+        compiled = entries.get(statement.key)
+        if compiled is not None:
+            entries.move_to_end(statement.key)
+            self.hits += 1
+            metrics.statement_cache.inc(statement.key[0], "hit")
+            return compiled
+
+        self.misses += 1
+        metrics.statement_cache.inc(statement.key[0], "miss")
+        compiled = entries[statement.key] = CompiledStatement(statement.build(), dialect)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        metrics.statement_cache_entries.set(len(entries))
+        return compiled
+
+    async def execute(self, conn, statement):
+        """
+        Execute a CachedStatement on an aiopg.sa connection, the result reads
+        like the one of `conn.execute`.
+        """
+        if not self.enabled:
+            return await conn.execute(statement.build(), statement.params)
+        dialect = conn._dialect
+        compiled = self.get(statement, dialect)
+        cursor = await conn._open_cursor()
+        await cursor.execute(compiled.sql, compiled.parameters(statement.params))
+        return ResultProxy(conn, cursor, dialect, compiled.result_map)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
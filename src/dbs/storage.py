@@ -0,0 +1,154 @@
+"""
+The storage the indexer and the processors run on. PgsqlHelper keeps the
+tables in postgres, MemoryPgsqlHelper in dicts and SqlitePgsqlHelper in
+dicts written through to a SQLite file, `Indexer` takes any of them.
+"""
+from abc import ABC, abstractmethod
+
+
+class Storage(ABC):
+    """
+    The operations the processors and the indexer use. Besides them an
+    implementation has the sa.Table definitions `token`, `balance`, `pool`
+    and `transaction`, `db_version`, `cursor_id`, `undo_log` and `undo_depth`,
+    and `listen` and `unlisten` when blocks are notified through postgres.
+
+    A backend missing one of the abstract operations can not be created.
+    Reads return the rows, None on error. Writes return an awaitable of
+    True, or False on error, a write buffered in the unit of work is done
+    already.
+    """
+
+    # a bulk rebuild is going on, see PgsqlHelper.finish_bulk_load
+    bulk = False
+
+    @abstractmethod
+    async def init(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def close(self):
+        raise NotImplementedError
+
+    # the processors
+
+    @abstractmethod
+    def save_transaction_info(self, value):
+        raise NotImplementedError
+
+    # the transactions are partitioned by block height, a block height given
+    # with an id limits the search to its partition
+
+    @abstractmethod
+    def update_transaction_info(self, transaction_id, value, block_height=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_transaction_by_id(self, id, block_height=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def load_transactions(self, ids, block_heights=None):
+        # get_transaction_by_id of every id, in order
+        raise NotImplementedError
+
+    # the state store, at startup
+
+    @abstractmethod
+    async def get_tokens(self, after_id=None, limit=10000):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_balances(self, after_id=None, limit=10000):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_pools(self, after_key=None, limit=10000):
+        raise NotImplementedError
+
+    # the indexer
+
+    @abstractmethod
+    async def ensure_cursor_table(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def ensure_undo_table(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def ensure_pool_columns(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def check_amount_columns(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_cursor(self, cursor_id=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_cursors(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_latest_transaction_height(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_block_hashes(self, start_height):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_event_by_block_range(self, start_height, end_height):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_transactions_by_ids(self, ids, block_heights=None, chunk_size=10000):
+        raise NotImplementedError
+
+    @abstractmethod
+    def begin_unit_of_work(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def rollback_unit_of_work(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def detach_unit_of_work(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def commit_unit_of_work(self, unit_of_work=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def rollback_blocks(self, fork_height):
+        raise NotImplementedError
+
+    async def finish_bulk_load(self):
+        return True
+
+    # the schema, see migrations.py
+
+    @abstractmethod
+    async def ensure_schema_table(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_schema_versions(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_schema_version(self, version, description):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_indexes(self, names):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_index(self, index):
+        raise NotImplementedError
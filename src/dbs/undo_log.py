@@ -0,0 +1,81 @@
+import contextvars
+
+# the height of the block whose event is being handled, set per event by the indexer
+current_block_height = contextvars.ContextVar(
+    "current_block_height", default=None)
+
+
+class BlockUndo:
+    """
+    What is needed to undo one block: the token and balance rows and the
+    pool items as they were before the block first touched them (None if the
+    block created them), the old values of the transaction columns it updated
+    with the block heights of those transactions, and the ids of the
+    transactions it inserted.
+    """
+
+    def __init__(self, block_height, block_hash=None):
+        self.block_height = block_height
+        self.block_hash = block_hash
+        self.tokens = {}
+        self.balances = {}
+        # (balance_id, kind, seq) -> item
+        self.pools = {}
+        self.transactions = {}
+        self.transaction_heights = {}
+        self.inserted = set()
+
+    def to_json(self):
+        return {
+            "token": self.tokens,
+            "balance": self.balances,
+            "pool": [list(key) + [image] for key, image in self.pools.items()],
+            "transaction": {str(row_id): values for row_id, values in self.transactions.items()},
+            "transaction_height": {str(row_id): block_height
+                                   for row_id, block_height in self.transaction_heights.items()},
+            "inserted": sorted(self.inserted),
+        }
+
+
+class UndoLog:
+    """
+    The undo records of the last `depth` blocks handled, kept in memory to
+    restore the state store without reading the db. The same records are
+    committed with their block to the undo table, see `PgsqlHelper.rollback_blocks`.
+    """
+
+    def __init__(self, depth=100):
+        self.depth = depth
+        self.blocks = {}
+
+    def block(self):
+        # the undo record of the block being handled, None outside of a block
+        block_height = current_block_height.get()
+        if block_height is None:
+            return None
+        undo = self.blocks.get(block_height)
+        if undo is None:
+            undo = self.blocks[block_height] = BlockUndo(block_height)
+        return undo
+
+    def finish_block(self, block_height, block_hash):
+        undo = self.blocks.get(block_height)
+        if undo is None:
+            undo = self.blocks[block_height] = BlockUndo(block_height)
+        undo.block_hash = block_hash
+
+        for height in [height for height in self.blocks if height <= block_height - self.depth]:
+            del self.blocks[height]
+        return undo
+
+    def covers(self, start_height, end_height):
+        return all(height in self.blocks for height in range(start_height, end_height + 1))
+
+    def pop_from(self, start_height):
+        # remove and return the records from `start_height` on, latest first
+        heights = sorted([height for height in self.blocks if height >= start_height],
+                         reverse=True)
+        return [self.blocks.pop(height) for height in heights]
+
+    def clear(self):
+        self.blocks.clear()
@@ -0,0 +1,264 @@
+import os
+import sys
+import copy
+import asyncio
+import sqlalchemy as sa
+
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
+
+from src.utils.amount import Units  # noqa
+
+
+class Record(dict):
+    """
+    A row held in memory. It supports both `row.column` and `row["column"]`
+    access so processors can use it exactly like a RowProxy from aiopg.
+    """
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+def done(result=True):
+    # an already finished future, so a buffered write can still be awaited or gathered
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(result)
+    return future
+
+
+def coerce_value(column, value):
+    # mimic the cast postgres applies when the value is written to the column
+    if value is None:
+        return None
+    try:
+        if isinstance(column.type, sa.String) and not isinstance(value, str):
+            return str(value)
+        if isinstance(column.type, sa.Integer) and not isinstance(value, int):
+            return int(value)
+        if isinstance(column.type, Units) and not isinstance(value, int):
+            return int(value)
+    except (TypeError, ValueError):
+        return value
+    return value
+
+
+def complete_row(columns, value):
+    # fill the columns missing in `value` with their defaults, like an INSERT does
+    row = Record()
+    for column in columns:
+        # column names are quoted_name, a str subclass slow to copy
+        name = str(column.name)
+        if name in value:
+            row[name] = coerce_value(column, value[name])
+        elif column.default is not None and not callable(column.default.arg):
+            row[name] = coerce_value(
+                column, copy.deepcopy(column.default.arg))
+        else:
+            row[name] = None
+    return row
+
+
+class TableBuffer:
+    """
+    Pending writes of one table. Every row touched in the unit of work is kept
+    in full, so several changes to the same row collapse into a single write.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.columns = table.columns
+
+        self.rows = {}       # id -> Record, rows whose current state is known
+        self.inserted = set()  # ids of rows created in this unit of work
+        self.dirty = {}      # id -> set of changed columns of rows loaded from db
+        self.absent = set()  # ids known not to exist
+        self.pending = {}    # id -> Record, insert if absent, not checked against db yet
+        self.blind = {}      # id -> values, updates of rows not loaded yet
+
+    def complete(self, value):
+        return complete_row(self.columns, copy.deepcopy(value))
+
+    def apply(self, row, values):
+        for key, value in values.items():
+            row[key] = coerce_value(self.columns[key], copy.deepcopy(value))
+
+    def lookup(self, row_id):
+        """
+        Return (True, row) when the current state of the row is known, row is
+        None if it does not exist. Return (False, None) if the db must be read.
+        """
+        if row_id in self.rows:
+            return True, Record(copy.deepcopy(self.rows[row_id]))
+        if row_id in self.absent:
+            return True, None
+        return False, None
+
+    def load(self, row_id, db_row):
+        """
+        Merge a row read from the db (or None) with the pending writes and
+        return the current state of the row.
+        """
+        if row_id in self.rows:
+            return Record(copy.deepcopy(self.rows[row_id]))
+
+        pending = self.pending.pop(row_id, None)
+        if db_row is not None:
+            self.rows[row_id] = Record(db_row)
+        elif pending is not None:
+            self.rows[row_id] = pending
+            self.inserted.add(row_id)
+        else:
+            self.blind.pop(row_id, None)
+            self.absent.add(row_id)
+            return None
+
+        if row_id in self.blind:
+            self.update(row_id, self.blind.pop(row_id))
+        return Record(copy.deepcopy(self.rows[row_id]))
+
+    def save(self, value):
+        # same semantic as INSERT ... ON CONFLICT DO NOTHING
+        row_id = value["id"]
+        if row_id in self.rows or row_id in self.pending:
+            return
+        if row_id in self.absent:
+            self.absent.discard(row_id)
+            self.rows[row_id] = self.complete(value)
+            self.inserted.add(row_id)
+            return
+        self.pending[row_id] = self.complete(value)
+
+    def update(self, row_id, values):
+        # same semantic as UPDATE ... WHERE id = row_id
+        if row_id in self.absent:
+            return
+        if row_id not in self.rows:
+            self.blind.setdefault(row_id, {}).update(copy.deepcopy(values))
+            return
+        self.apply(self.rows[row_id], values)
+        if row_id not in self.inserted:
+            self.dirty.setdefault(row_id, set()).update(values.keys())
+
+    def peek(self, row_id):
+        """
+        Like `lookup`, but rows waiting to be inserted count as present. It is
+        used on a unit of work that is being committed.
+        """
+        if row_id in self.pending:
+            row = Record(copy.deepcopy(self.pending[row_id]))
+            self.apply(row, self.blind.get(row_id, {}))
+            return True, row
+        return self.lookup(row_id)
+
+    def stage(self, row, columns=None):
+        # add a row kept up to date elsewhere, inserted if `columns` is None, else upserted
+        self.rows[row["id"]] = row
+        if columns is None:
+            self.inserted.add(row["id"])
+        else:
+            self.dirty[row["id"]] = set(columns)
+
+    def merge(self, db_rows, predicate):
+        """
+        Overlay the pending writes on the result of a query that does not
+        filter by id. `predicate` tells if a buffered row matches the query.
+        """
+        result = []
+        seen = set()
+        for db_row in db_rows:
+            row = self.load(db_row.id, db_row)
+            seen.add(db_row.id)
+            if row is not None and predicate(row):
+                result.append(row)
+        for row_id in self.inserted:
+            if row_id not in seen and predicate(self.rows[row_id]):
+                result.append(Record(copy.deepcopy(self.rows[row_id])))
+        return result
+
+    def new_rows(self):
+        rows = [self.rows[row_id] for row_id in self.inserted]
+        rows.extend(self.pending.values())
+        return rows
+
+    def changed_rows(self):
+        # group changed rows by the set of changed columns, one upsert per group
+        groups = {}
+        for row_id, columns in self.dirty.items():
+            groups.setdefault(frozenset(columns), []).append(
+                self.rows[row_id])
+        return groups
+
+    def __len__(self):
+        return len(self.inserted) + len(self.pending) + len(self.dirty) + len(self.blind)
+
+
+class PoolBuffer:
+    """
+    Pending writes of the pool table by (balance_id, kind, seq):
+    the items to upsert and the keys of the items to delete.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.rows = {}
+        self.deleted = set()
+
+    def stage(self, key, row):
+        # the item as it is now, None if it was removed
+        if row is None:
+            self.rows.pop(key, None)
+            self.deleted.add(key)
+        else:
+            self.deleted.discard(key)
+            self.rows[key] = row
+
+    def __len__(self):
+        return len(self.rows) + len(self.deleted)
+
+
+class UnitOfWork:
+    """
+    Collects every token, balance, pool and transaction write of one or more
+    blocks, they are applied by `PgsqlHelper.commit_unit_of_work` in one
+    transaction.
+    """
+
+    def __init__(self, token_table, balance_table, transaction_table, pool_table):
+        self.token = TableBuffer(token_table)
+        self.balance = TableBuffer(balance_table)
+        self.transaction = TableBuffer(transaction_table)
+        # pool items are only written through the state store
+        self.pool = PoolBuffer(pool_table)
+
+        self.start_height = None
+        self.end_height = None
+        self.last_event_id = None
+        self.block_count = 0
+        # BlockUndo of every block, committed to the undo table
+        self.undo = []
+        self.created_at = asyncio.get_running_loop().time()
+
+    def tables(self):
+        return [self.token, self.balance, self.transaction]
+
+    def add_block(self, block_height, last_event_id=None, undo=None):
+        if self.start_height is None:
+            self.start_height = block_height
+        self.end_height = block_height
+        if last_event_id is not None:
+            self.last_event_id = last_event_id
+        if undo is not None:
+            self.undo.append(undo)
+        self.block_count += 1
+
+    def age(self):
+        return asyncio.get_running_loop().time() - self.created_at
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables()) + len(self.pool)
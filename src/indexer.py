@@ -10,6 +10,16 @@ sys.path.append(src_path)
 
 from src.dbs.pgsql_helper import PgsqlHelper  # noqa
 from src.dbs.redis_helper import RedisHelper  # noqa
+from src.dbs.state_store import StateStore  # noqa
+from src.dbs.undo_log import UndoLog, current_block_height  # noqa
+from src.dbs.migrations import check_schema, apply_migrations  # noqa
+from src.prefetcher import BlockPrefetcher, block_hash, group_by_height  # noqa
+from src.notifier import BlockNotifier  # noqa
+from src.metrics import metrics, timed_phase, operation_label, processor_label, MetricsServer  # noqa
+from src.tracer import EventTrace, current_trace  # noqa
+from src.snapshot import snapshot_path, dump_snapshot, prune_snapshots, pool_transaction_keys  # noqa
+from src.scheduler import TokenScheduler, resolve_token_key  # noqa
+from src.sharding import shard_of, shard_cursor_id  # noqa
 from src.parsers.operation_parser import *  # noqa
 from src.processors.inscribe_deploy_processor import handle_inscribe_deploy  # noqa
 from src.processors.inscribe_upgrade_processor import handle_inscribe_upgrade  # noqa
@@ -19,15 +29,23 @@ from src.processors.inscribe_send_processor import handle_inscribe_send  # noqa
 from src.processors.transfer_mint_processor import handle_transfer_mint  # noqa
 from src.processors.transfer_send_processor import handle_transfer_send  # noqa
 from src.processors.transfer_upgrade_processor import handle_transfer_upgrade  # noqa
-from src.utils.orc20 import is_orc20  # noqa
 
 
 class Indexer:
-    def __init__(self, db_version="A"):
+    def __init__(self, db_version="A", notify_mode="redis", shard_index=None, shard_count=1,
+                 snapshot_interval=3600, metrics_port=None, trace_threshold_ms=None,
+                 pgsql=None, redis=None, redis_notify_config=False):
         self.set_signal()
 
+        # a shard only indexes the tokens in its hash range, see sharding.py
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        log_name = os.path.basename(__file__).split('.')[0]
+        if self.is_sharded():
+            log_name = f"{log_name}_shard_{shard_index}"
+
         logger.add(
-            f"./logs/{os.path.basename(__file__).split('.')[0]}.log",
+            f"./logs/{log_name}.log",
             level="INFO",
             rotation="500 MB",
             enqueue=True
@@ -37,8 +55,68 @@ class Indexer:
         self.stop_flag = False
         self.orc20_start_height = 787606
 
-        self.pgsql = PgsqlHelper(self.logger, db_version)
-        self.redis = RedisHelper(self.logger, db_version)
+        # when the indexer is more than `catch_up_distance` blocks behind, blocks are
+        # committed in groups of `group_commit_blocks` blocks or `group_commit_ms` ms,
+        # otherwise every block is committed on its own
+        self.catch_up_distance = 6
+        self.group_commit_blocks = 100
+        self.group_commit_ms = 2000
+
+        # a committed unit of work is written in the background while the next blocks are handled
+        self.flush_task = None
+        self.committed_height = None
+
+        # any Storage can be given, see storage.py
+        self.pgsql = pgsql if pgsql is not None else PgsqlHelper(
+            self.logger, db_version)
+        self.redis = redis if redis is not None else RedisHelper(
+            self.logger, db_version)
+        self.state = StateStore(self.pgsql.token, self.pgsql.balance, self.pgsql.pool,
+                                row_filter=self.owns_row if self.is_sharded() else None)
+        if self.is_sharded():
+            self.pgsql.cursor_id = shard_cursor_id(shard_index, shard_count)
+
+        # every block records how to undo it, at the tip the last `reorg_check_depth`
+        # blocks are checked and rolled back from the first one whose hash changed
+        self.reorg_check_depth = 6
+        self.undo_log = UndoLog(self.pgsql.undo_depth)
+        self.state.undo_log = self.undo_log
+        self.pgsql.undo_log = self.undo_log
+
+        # events of different tokens run concurrently, while catching up across
+        # up to `window_blocks` blocks already prefetched
+        self.window_blocks = 10
+        self.scheduler = TokenScheduler(self.handle_event)
+
+        # blocks are fetched and decoded ahead, up to `prefetch_max_events` events,
+        # big contents in `parse_workers` processes (None for one less than the cores,
+        # at most 4; 0 parses inline, as on a single core)
+        self.prefetch_max_events = 100000
+        self.parse_workers = None
+        self.prefetcher = BlockPrefetcher(
+            self.pgsql, self.logger, self.prefetch_max_events, parse_workers=self.parse_workers)
+
+        # write a snapshot of the state every `snapshot_interval` s (None to disable),
+        # keep the latest `snapshot_keep`; a shard only holds part of the state
+        self.db_version = db_version
+        self.snapshot_dir = "./snapshots"
+        self.snapshot_interval = None if self.is_sharded() else snapshot_interval
+        self.snapshot_keep = 2
+        self.snapshot_time = time.time()
+        self.snapshot_task = None
+
+        # wake up on new blocks, poll every 60 s if notifications are missing
+        self.notifier = BlockNotifier(
+            self.logger, self.redis, self.pgsql, notify_mode, poll_interval=60,
+            configure_redis=redis_notify_config)
+
+        # serve the counters of metrics.py on `metrics_port` (None to disable)
+        self.metrics_server = MetricsServer(
+            self.logger, metrics_port) if metrics_port else None
+
+        # in tracing mode the round trips of every event are counted and the
+        # events taking `trace_threshold_ms` ms or more logged with them
+        self.trace_threshold_ms = trace_threshold_ms
 
     def set_signal(self):
         signal.signal(signal.SIGINT, self.stop)
@@ -50,10 +128,47 @@ class Indexer:
             sys.exit(0)
         self.stop_flag = True
 
+    def is_sharded(self):
+        return self.shard_index is not None
+
+    def owns(self, token_key):
+        return not self.is_sharded() or \
+            shard_of(token_key, self.shard_count) == self.shard_index
+
+    def owns_row(self, row):
+        return self.owns(row.tick)
+
     async def init(self):
         await self.pgsql.init()
+        if await self.pgsql.ensure_cursor_table() is False:
+            return False
+        if await self.pgsql.ensure_undo_table() is False:
+            return False
+        if await self.pgsql.ensure_pool_columns() is False:
+            return False
+        if await self.pgsql.check_amount_columns() is False:
+            return False
+        if self.pgsql.bulk:
+            self.logger.info("bulk load, the indexes are built and the tables logged at the tip")
+        else:
+            await check_schema(self.pgsql, self.logger)
+
+        start = time.time()
+        if await self.state.load(self.pgsql) is False:
+            self.logger.error("load token and balance state failed")
+            return False
+        end = time.time()
+        self.logger.info(
+            f"load state successfully, tokens: {len(self.state.tokens)}, balances: {len(self.state.balances)}, cost: {end-start} s")
+        return True
 
     async def close(self):
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.notifier.stop()
+        await self.prefetcher.stop()
+        if self.snapshot_task is not None:
+            await self.snapshot_task
         await self.redis.close()
         await self.pgsql.close()
 
@@ -62,15 +177,15 @@ class Indexer:
         tasks = []
         operation = content["op"].lower()
         if operation == "deploy":
-            tasks = await handle_inscribe_deploy(self.pgsql, event, content)
+            tasks = await handle_inscribe_deploy(self.pgsql, self.state, event, content)
         elif operation == "mint":
-            tasks = await handle_inscribe_mint(self.pgsql, event, content)
+            tasks = await handle_inscribe_mint(self.pgsql, self.state, event, content)
         elif operation == "send" or operation == "transfer":
-            tasks = await handle_inscribe_send(self.pgsql, event, content)
+            tasks = await handle_inscribe_send(self.pgsql, self.state, event, content)
         elif operation == "cancel":
-            tasks = await handle_inscribe_cancel(self.pgsql, event, content)
+            tasks = await handle_inscribe_cancel(self.pgsql, self.state, event, content)
         elif operation == "upgrade":
-            tasks = await handle_inscribe_upgrade(self.pgsql, event, content)
+            tasks = await handle_inscribe_upgrade(self.pgsql, self.state, event, content)
 
         try:
             result = await asyncio.gather(*tasks)
@@ -86,11 +201,11 @@ class Indexer:
         tasks = []
         operation = content["op"].lower()
         if operation == "mint":
-            tasks = await handle_transfer_mint(self.pgsql, event, content)
+            tasks = await handle_transfer_mint(self.pgsql, self.state, event, content)
         elif operation == "send" or operation == "transfer":
-            tasks = await handle_transfer_send(self.pgsql, event, content)
+            tasks = await handle_transfer_send(self.pgsql, self.state, event, content)
         elif operation == "upgrade":
-            tasks = await handle_transfer_upgrade(self.pgsql, event, content)
+            tasks = await handle_transfer_upgrade(self.pgsql, self.state, event, content)
 
         result = await asyncio.gather(*tasks)
         if False in result:
@@ -98,57 +213,350 @@ class Indexer:
 
         return True
 
-    async def handle_block(self, block_height):
+    async def handle_event(self, event, content):
+        current_block_height.set(event.block_height)
+        operation = operation_label(content)
+        metrics.events.inc(event.event, operation)
+        if self.trace_threshold_ms is None:
+            return await self.dispatch_event(event, content)
+
+        trace = EventTrace(event, processor_label(event, content))
+        token = current_trace.set(trace)
+        try:
+            return await self.dispatch_event(event, content)
+        finally:
+            current_trace.reset(token)
+            metrics.event_queries.observe(trace.queries, trace.processor)
+            if trace.finish() * 1000 >= self.trace_threshold_ms:
+                self.logger.warning(f"slow event: {trace.summary()}")
+
+    async def dispatch_event(self, event, content):
+        with timed_phase("processor"):
+            if event.event == "inscribe":
+                return await self.handle_inscribe_event(event, content)
+            if event.event == "transfer":
+                return await self.handle_transfer_event(event, content)
+            return True
+
+    async def handle_block(self, block):
+        return await self.handle_blocks([block])
+
+    async def handle_blocks(self, blocks):
         start = time.time()
-        events = await self.pgsql.get_event_by_block_height(block_height)
-        if not events:
+        event_count = sum(block.event_count for block in blocks)
+        if event_count == 0:
             return True
 
-        for event in events:
+        events = [event for block in blocks for event in block.events
+                  if self.owns(resolve_token_key(event[1]))]
+        if await self.scheduler.run(events) is False:
+            return False
 
-            if await self.redis.is_event_exists(event.id):
-                continue
+        end = time.time()
+        self.logger.info(
+            f"handle block: {self.block_range(blocks)} successfully, events: {event_count}, cost: {end-start} s")
 
-            content = is_orc20(event.content)
-            if content is None:
-                continue
+        return True
 
-            if event.event == "inscribe":
-                success = await self.handle_inscribe_event(event, content)
-                if success is False:
-                    return False
-            elif event.event == "transfer":
-                success = await self.handle_transfer_event(event, content)
-                if success is False:
-                    return False
+    def block_range(self, blocks):
+        start_height, end_height = blocks[0].block_height, blocks[-1].block_height
+        if start_height == end_height:
+            return f"{start_height}"
+        return f"{start_height}-{end_height}"
+
+    def is_group_full(self, unit_of_work):
+        return unit_of_work.block_count >= self.group_commit_blocks or \
+            unit_of_work.age() * 1000 >= self.group_commit_ms
 
-            await self.redis.set_handled_event(event.id)
+    async def commit(self):
+        unit_of_work = self.pgsql.unit_of_work
+        if unit_of_work is None:
+            return True
+
+        # only one unit of work is written at a time, so they reach the db in order
+        if await self.wait_flush() is False:
+            return False
+
+        self.state.flush_into(unit_of_work)
+        self.pgsql.detach_unit_of_work()
+        snapshot = self.copy_snapshot_state()
+        self.flush_task = asyncio.ensure_future(
+            self.flush(unit_of_work, snapshot))
+        return True
+
+    async def flush(self, unit_of_work, snapshot=None):
+        start = time.time()
+        with timed_phase("write"):
+            success = await self.pgsql.commit_unit_of_work(unit_of_work)
+        if success is False:
+            self.logger.error(
+                f"commit blocks: {unit_of_work.start_height}-{unit_of_work.end_height} failed")
+            return False
+        self.committed_height = unit_of_work.end_height
+        metrics.set_heights(committed=self.committed_height)
+        if self.is_sharded():
+            await self.redis.set_shard_height(self.pgsql.cursor_id, self.committed_height)
 
         end = time.time()
         self.logger.info(
-            f"handle block: {block_height} successfully, events: {len(events)}, cost: {end-start} s")
+            f"commit blocks: {unit_of_work.start_height}-{unit_of_work.end_height}, rows: {len(unit_of_work)}, cost: {end-start} s")
 
+        if snapshot is not None:
+            await self.start_snapshot(unit_of_work, *snapshot)
         return True
 
-    async def run(self, start_height=None):
-        await self.init()
+    async def finish_bulk_load(self):
+        if await self.pgsql.finish_bulk_load() is False:
+            self.logger.error("finish bulk load failed, restart to try again")
+            return False
+        return await apply_migrations(self.pgsql, self.logger)
+
+    def copy_snapshot_state(self):
+        """
+        Copy the token, balance and pool state when a snapshot is due, at most
+        one snapshot is written at a time.
+        """
+        if not self.snapshot_interval or \
+                time.time() - self.snapshot_time < self.snapshot_interval:
+            return None
+        if self.snapshot_task is not None and not self.snapshot_task.done():
+            return None
+
+        self.snapshot_time = time.time()
+        tokens = [self.state.snapshot(token) for token in self.state.tokens.values()]
+        balances = [self.state.snapshot(balance) for balance in self.state.balances.values()]
+        # pool items are never changed in place
+        pools = self.state.pool_rows()
+        return tokens, balances, pools
+
+    async def start_snapshot(self, unit_of_work, tokens, balances, pools):
+        # read the transactions of the pools before the next unit of work is written
+        keys = pool_transaction_keys(pools)
+        transactions = await self.pgsql.get_transactions_by_ids(
+            [transaction_id for transaction_id, _ in keys], [block_height for _, block_height in keys])
+        if transactions is None:
+            self.logger.error("read snapshot transactions failed")
+            return
+        transactions = [dict(transaction) for transaction in transactions]
+        self.snapshot_task = asyncio.ensure_future(self.write_snapshot(
+            unit_of_work, tokens, balances, pools, transactions))
+
+    async def write_snapshot(self, unit_of_work, tokens, balances, pools, transactions):
+        start = time.time()
+        block_height = unit_of_work.end_height
+        path = snapshot_path(self.snapshot_dir, self.db_version, block_height)
+        header = {
+            "db_version": self.db_version,
+            "block_height": block_height,
+            "event_id": unit_of_work.last_event_id,
+            "time": int(start),
+        }
+
+        # serialise and compress off the event loop
+        loop = asyncio.get_running_loop()
+        try:
+            tmp_path = await loop.run_in_executor(
+                None, dump_snapshot, path, header, tokens, balances, pools, transactions)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            self.logger.error(f"write snapshot error: {e}")
+            return False
+        prune_snapshots(self.snapshot_dir, self.db_version, self.snapshot_keep)
+
+        end = time.time()
+        self.logger.info(
+            f"write snapshot: {path}, tokens: {len(tokens)}, balances: {len(balances)}, pools: {len(pools)}, transactions: {len(transactions)}, cost: {end-start} s")
+        return True
 
-        current_block_height = start_height if start_height is not None else self.orc20_start_height
+    async def wait_flush(self):
+        if self.flush_task is None:
+            return True
+        flush_task, self.flush_task = self.flush_task, None
+        return await flush_task
+
+    async def recover(self, current_block_height):
+        """
+        The in-memory state is ahead of the db after a failure, reload it and
+        restart from the block after the last committed one.
+        """
+        await self.wait_flush()
+        self.pgsql.rollback_unit_of_work()
+        while not self.stop_flag and await self.state.load(self.pgsql) is False:
+            self.logger.error("reload token and balance state failed")
+            await asyncio.sleep(60)
+
+        if self.committed_height is not None:
+            current_block_height = self.committed_height + 1
+        self.undo_log.pop_from(current_block_height)
+        self.prefetcher.reset(current_block_height)
+        return current_block_height
+
+    async def check_reorg(self):
+        """
+        Compare the hashes of the last committed blocks with their events now,
+        return the first height whose hash changed, None if none did.
+        """
+        start_height = self.committed_height - self.reorg_check_depth + 1
+        block_hashes = await self.pgsql.get_block_hashes(start_height)
+        if not block_hashes:
+            return None
+
+        start_height = block_hashes[0].block_height
+        events = await self.pgsql.get_event_by_block_range(start_height, self.committed_height)
+        if events is None:
+            return None
+
+        block_events = group_by_height(start_height, self.committed_height, events)
+        for row in block_hashes:
+            if row.block_height in block_events and \
+                    block_hash(block_events[row.block_height]) != row.block_hash:
+                return row.block_height
+        return None
+
+    async def rollback(self, fork_height):
+        """
+        Undo the blocks from `fork_height` on, in the db and in memory, and
+        return the height to restart from. Everything handled must be committed.
+        """
+        start = time.time()
+        last_height = self.committed_height
+        if await self.pgsql.rollback_blocks(fork_height) is False:
+            return None
+
+        if self.undo_log.covers(fork_height, last_height):
+            for undo in self.undo_log.pop_from(fork_height):
+                self.state.restore(undo)
+        else:
+            self.undo_log.clear()
+            while not self.stop_flag and await self.state.load(self.pgsql) is False:
+                self.logger.error("reload token and balance state failed")
+                await asyncio.sleep(60)
+
+        self.committed_height = fork_height - 1
+        if self.is_sharded():
+            await self.redis.set_shard_height(self.pgsql.cursor_id, self.committed_height)
+        self.prefetcher.reset(fork_height)
+
+        end = time.time()
+        self.logger.info(
+            f"rollback blocks: {fork_height}-{last_height}, cost: {end-start} s")
+        return fork_height
+
+    async def get_start_height(self, start_height=None):
+        """
+        Resume after the block in the cursor. An explicit start height must
+        be above it, blocks are not deduplicated event by event.
+        """
+        cursors = await self.pgsql.get_cursor()
+        if cursors is None:
+            return None
+
+        if cursors:
+            cursor_height = cursors[0].block_height
+            if start_height is None:
+                return cursor_height + 1
+            if start_height <= cursor_height:
+                self.logger.error(
+                    f"block {cursor_height} is already indexed, clean dbs with -c to index from {start_height}")
+                return None
+            return start_height
+
+        if start_height is not None:
+            return start_height
+
+        if self.is_sharded():
+            # a new shard layout starts from scratch once the dbs are cleaned,
+            # shards of the same layout may have committed already
+            cursors = await self.pgsql.get_cursors()
+            if cursors is None:
+                return None
+            if any(cursor.id.endswith(f"-of-{self.shard_count}") for cursor in cursors):
+                return self.orc20_start_height
+
+        # no cursor, refuse to replay over the data of an older indexer version
+        latest_height = await self.pgsql.get_latest_transaction_height()
+        if latest_height is False:
+            return None
+        if latest_height is not None:
+            self.logger.error(
+                f"transactions are indexed up to block {latest_height} without cursor, clean dbs with -c or set the start height with -s")
+            return None
+        return self.orc20_start_height
+
+    async def run(self, start_height=None):
+        if await self.init() is False:
+            await self.close()
+            return
+
+        current_block_height = await self.get_start_height(start_height)
+        if current_block_height is None:
+            await self.close()
+            return
+        self.logger.info(f"start from block: {current_block_height}")
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        await self.notifier.start()
+        self.committed_height = current_block_height - 1
+        self.prefetcher.reset(current_block_height)
         while not self.stop_flag:
 
             latest_block_height = await self.redis.get_current_block_from_redis()
+            self.prefetcher.extend(int(latest_block_height))
+            metrics.set_heights(current=latest_block_height)
             while not self.stop_flag and \
                     current_block_height <= int(latest_block_height):
 
-                success = await self.handle_block(current_block_height)
+                is_catching_up = int(latest_block_height) - \
+                    current_block_height >= self.catch_up_distance
+                blocks = [await self.prefetcher.get()]
+                if is_catching_up:
+                    blocks.extend(await self.prefetcher.get_ready(self.window_blocks - 1))
+
+                unit_of_work = self.pgsql.begin_unit_of_work()
+                success = await self.handle_blocks(blocks)
                 if success is False:
                     self.logger.error(
-                        f"handle block: {current_block_height} failed")
+                        f"handle block: {self.block_range(blocks)} failed")
+                    current_block_height = await self.recover(current_block_height)
+                    break
+                for block in blocks:
+                    unit_of_work.add_block(
+                        block.block_height, block.last_event_id,
+                        self.undo_log.finish_block(block.block_height, block.block_hash))
+                current_block_height = blocks[-1].block_height + 1
+                metrics.set_heights(processed=blocks[-1].block_height)
+
+                # group commit while catching up, commit every block at the tip
+                is_catching_up = int(latest_block_height) - \
+                    current_block_height >= self.catch_up_distance
+                if is_catching_up and not self.is_group_full(unit_of_work):
+                    continue
+
+                if await self.commit() is False:
+                    current_block_height = await self.recover(current_block_height)
+                    break
+
+            # commit the rest of the group and wait for it before waiting for new blocks
+            if await self.commit() is False or await self.wait_flush() is False:
+                current_block_height = await self.recover(current_block_height)
+                continue
+
+            # a bulk rebuild ends once it caught up
+            if self.pgsql.bulk and await self.finish_bulk_load() is False:
+                break
+
+            fork_height = await self.check_reorg()
+            if fork_height is not None:
+                self.logger.warning(f"reorg detected at block: {fork_height}")
+                current_block_height = await self.rollback(fork_height)
+                if current_block_height is None:
+                    self.logger.error(
+                        f"can not roll back to block {fork_height}, clean dbs with -c to index again")
                     break
-                current_block_height += 1
+                continue
 
             if not self.stop_flag:
-                await asyncio.sleep(60)
+                await self.notifier.wait()
 
         await self.close()
 
@@ -7,7 +7,10 @@ src_path = os.path.dirname(os.path.dirname(__file__))
 sys.path.append(src_path)
 
 from src.utils.clean_db import clean_db  # noqa
+from src.utils.restore_snapshot import restore_snapshot  # noqa
+from src.utils.migrate import migrate  # noqa
 from src.indexer import Indexer  # noqa
+from src.sharding import run_shard, run_coordinator, run_sharded  # noqa
 
 
 def parser() -> argparse.ArgumentParser:
@@ -18,11 +21,45 @@ def parser() -> argparse.ArgumentParser:
                         choices=['A', 'B'], default='A', help='db version')
 
     parser.add_argument('-s', '--start_height', type=int,
-                        default=None, help='start block height')
+                        default=None, help='start block height, resume after the last committed block by default')
 
     parser.add_argument('-c', '--clean_db', action='store_true',
                         help='clean dbs before start')
 
+    parser.add_argument('-b', '--bulk', action='store_true',
+                        help='with -c, rebuild into unlogged tables with COPY, indexes are built at the tip')
+
+    parser.add_argument('-n', '--notify', type=str,
+                        choices=['redis', 'pgsql', 'poll'], default='redis',
+                        help='how to be notified of new blocks, polling is always the fallback')
+
+    parser.add_argument('--redis_notify_config', action='store_true',
+                        help='with --notify redis, set notify-keyspace-events on the redis server if it lacks the flags of string commands, server wide')
+
+    parser.add_argument('-m', '--migrate', action='store_true',
+                        help='apply the schema migrations not applied yet before start')
+
+    parser.add_argument('-r', '--restore', type=str, default=None,
+                        help='restore the state from a snapshot file and resume after its block')
+
+    parser.add_argument('--snapshot_interval', type=int, default=3600,
+                        help='write a snapshot of the state every n seconds, 0 to disable')
+
+    parser.add_argument('--shards', type=int, default=1,
+                        help='split the tokens in shards indexed by one process each')
+
+    parser.add_argument('--shard_index', type=int, default=None,
+                        help='only run this shard, to spread the shards over several nodes')
+
+    parser.add_argument('--coordinator_only', action='store_true',
+                        help='only track the height committed by all shards')
+
+    parser.add_argument('--metrics_port', type=int, default=None,
+                        help='serve prometheus metrics on this port, shard i on port + i')
+
+    parser.add_argument('--trace_events_ms', type=float, default=None,
+                        help='count the queries of every event, log the events taking this many ms or more')
+
     return parser
 
 
@@ -32,14 +69,43 @@ if __name__ == '__main__':
     db_version = args.db_version
     start_height = args.start_height
     is_clean_db = args.clean_db
+    notify_mode = args.notify
+    shard_count = args.shards
+    shard_index = args.shard_index
 
     print(
-        f"db_version: {db_version}, start_height: {start_height}, is_clean_db: {is_clean_db}")
+        f"db_version: {db_version}, start_height: {start_height}, is_clean_db: {is_clean_db}, notify: {notify_mode}, shards: {shard_count}, shard_index: {shard_index}")
+
+    if shard_index is not None and not 0 <= shard_index < shard_count:
+        sys.exit(f"shard_index must be in [0, {shard_count})")
+
+    if args.bulk and not is_clean_db:
+        sys.exit("bulk mode rebuilds from scratch, use it with -c")
 
     if is_clean_db:
-        asyncio.run(clean_db(db_version))
+        asyncio.run(clean_db(db_version, args.bulk))
+
+    if args.migrate and not asyncio.run(migrate(db_version)):
+        sys.exit("migrate failed")
+
+    if args.restore is not None and not asyncio.run(restore_snapshot(args.restore, db_version)):
+        sys.exit(f"restore snapshot {args.restore} failed")
 
-    indexer = Indexer(db_version)
     if start_height is not None:
         start_height = int(start_height)
-    asyncio.run(indexer.run(start_height))
+
+    if args.coordinator_only:
+        run_coordinator(db_version, shard_count)
+    elif shard_index is not None:
+        run_shard(db_version, notify_mode, start_height, shard_index, shard_count,
+                  args.metrics_port, args.trace_events_ms, args.redis_notify_config)
+    elif shard_count > 1:
+        run_sharded(db_version, notify_mode, start_height, shard_count,
+                    args.metrics_port, args.trace_events_ms, args.redis_notify_config)
+    else:
+        indexer = Indexer(db_version, notify_mode,
+                          snapshot_interval=args.snapshot_interval,
+                          metrics_port=args.metrics_port,
+                          trace_threshold_ms=args.trace_events_ms,
+                          redis_notify_config=args.redis_notify_config)
+        asyncio.run(indexer.run(start_height))
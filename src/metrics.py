@@ -0,0 +1,243 @@
+"""
+Counters, gauges and histograms of the indexer in the prometheus text
+format, served over http by `MetricsServer`. Everything is recorded in the
+module level `metrics`, recording is cheap enough for the hot path.
+"""
+import time
+import asyncio
+import contextlib
+from bisect import bisect_left
+from src.tracer import record_query
+
+# seconds, from a cached lookup to a big group commit
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def format_labels(names, values, extra=""):
+    labels = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        # label values -> value
+        self.values = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # [count per bucket, +Inf last, sum]
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(
+                    f"{self.name}_bucket{format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.events = Counter(
+            "indexer_events_total", "orc20 events handled", ["event", "op"])
+        self.transactions = Counter(
+            "indexer_transactions_total", "transactions saved, by method and invalid reason",
+            ["method", "valid", "invalid_reason"])
+        self.transaction_updates = Counter(
+            "indexer_transaction_updates_total", "transactions set valid or invalid later",
+            ["valid", "invalid_reason"])
+        self.parse_cache = Counter(
+            "indexer_parse_cache_total", "parse cache lookups, by parser", ["parser", "result"])
+        self.parse_cache_evictions = Counter(
+            "indexer_parse_cache_evictions_total", "contents evicted from the parse cache")
+        self.parse_cache_entries = Gauge(
+            "indexer_parse_cache_entries", "contents in the parse cache")
+        self.statement_cache = Counter(
+            "indexer_statement_cache_total", "compiled statement lookups, by statement", ["statement", "result"])
+        self.statement_cache_entries = Gauge(
+            "indexer_statement_cache_entries", "statement shapes compiled")
+        self.phase_seconds = Histogram(
+            "indexer_phase_seconds", "time spent in fetch, parse, processor and write", ["phase"])
+        self.call_seconds = Histogram(
+            "indexer_db_call_seconds", "postgres and redis round trips", ["db", "call"])
+        self.event_queries = Histogram(
+            "indexer_event_queries", "round trips per event in tracing mode", ["processor"],
+            buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500))
+        self.semaphore_wait_seconds = Histogram(
+            "indexer_semaphore_wait_seconds", "wait for the connection semaphore", ["db"])
+        self.block_height = Gauge(
+            "indexer_block_height", "processed and committed height, current block in redis", ["kind"])
+        self.lag_blocks = Gauge(
+            "indexer_lag_blocks", "current block in redis minus the processed height")
+
+    def all(self):
+        return [value for value in vars(self).values() if isinstance(value, Metric)]
+
+    def render(self):
+        lines = []
+        for metric in self.all():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def set_heights(self, processed=None, committed=None, current=None):
+        for kind, height in [("processed", processed), ("committed", committed), ("current", current)]:
+            if height is not None:
+                self.block_height.set(int(height), kind)
+        heights = self.block_height.values
+        if ("processed",) in heights and ("current",) in heights:
+            self.lag_blocks.set(heights[("current",)] - heights[("processed",)])
+
+    def count_transaction(self, value):
+        self.transactions.inc(value.get("method"), *validity_labels(value))
+
+    def count_transaction_update(self, value):
+        if "valid" in value:
+            self.transaction_updates.inc(*validity_labels(value))
+
+
+# the ops of the protocol, any other op an inscription carries is counted as "other"
+OPERATIONS = frozenset(["deploy", "mint", "send", "transfer", "cancel", "upgrade"])
+
+
+def operation_label(content):
+    # the op comes from the inscription, anyone can write a new one
+    operation = str(content.get("op")).lower()
+    return operation if operation in OPERATIONS else "other"
+
+
+def processor_label(event, content):
+    # the processor of a trace, a label of event_queries
+    return f"{event.event}-{operation_label(content)}"
+
+
+def validity_labels(value):
+    # drop the inscription ids some reasons end with, labels must stay few
+    if value.get("valid"):
+        return "true", ""
+    return "false", (value.get("invalid_reason") or "").split(":")[0]
+
+
+metrics = Metrics()
+
+
+@contextlib.asynccontextmanager
+async def timed_call(semaphore, db, call):
+    """
+    Count and time one round trip, the wait for `semaphore` apart.
+    """
+    start = time.perf_counter()
+    async with semaphore:
+        acquired = time.perf_counter()
+        metrics.semaphore_wait_seconds.observe(acquired - start, db)
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - acquired
+            metrics.call_seconds.observe(seconds, db, call)
+            record_query(call, seconds)
+
+
+@contextlib.contextmanager
+def timed_phase(phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.phase_seconds.observe(time.perf_counter() - start, phase)
+
+
+class MetricsServer:
+    """
+    Serves `GET /metrics` for prometheus, enough http for a scraper.
+    """
+
+    def __init__(self, logger, port, host="0.0.0.0"):
+        self.logger = logger
+        self.port = port
+        self.host = host
+        self.server = None
+
+    async def start(self):
+        try:
+            self.server = await asyncio.start_server(self.handle, self.host, self.port)
+            self.logger.info(f"serve metrics on {self.host}:{self.port}")
+            return True
+        except Exception as e:
+            self.logger.error(f"start metrics server error: {e}")
+            return False
+
+    async def stop(self):
+        if self.server is None:
+            return
+        self.server.close()
+        await self.server.wait_closed()
+        self.server = None
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 10)
+            while (await asyncio.wait_for(reader.readline(), 10)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", metrics.render()
+            else:
+                status, body = "404 Not Found", "not found\n"
+            body = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except Exception as e:
+            self.logger.warning(f"serve metrics error: {e}")
+        finally:
+            writer.close()
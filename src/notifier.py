@@ -0,0 +1,98 @@
+import asyncio
+
+
+class BlockNotifier:
+    """
+    Wakes the indexer as soon as a new block may be available.
+
+    mode "redis" subscribes to the changes of `current_block`, the keyspace
+    notifications of redis are only configured with `configure_redis`, mode "pgsql"
+    listens to a trigger on the event table and mode "poll" only polls.
+    `wait` always returns after `poll_interval` seconds, so polling stays the
+    fallback if notifications are lost or cannot be set up.
+    """
+
+    def __init__(self, logger, redis, pgsql, mode="redis", poll_interval=60, configure_redis=False):
+        self.logger = logger
+        self.redis = redis
+        self.pgsql = pgsql
+        self.mode = mode
+        self.configure_redis = configure_redis
+        self.poll_interval = poll_interval
+
+        self.pgsql_channel = "event_inserted"
+        # events may land before `current_block` moves, after a pgsql
+        # notification poll every `settle_interval` s for `settle_time` s
+        self.settle_interval = 1
+        self.settle_time = 10
+        self.settle_until = 0
+
+        self.event = asyncio.Event()
+        self.task = None
+
+    async def start(self):
+        if self.mode == "redis":
+            pubsub = await self.redis.subscribe_current_block(self.configure_redis)
+            if pubsub is not None:
+                self.task = asyncio.ensure_future(self.listen_redis(pubsub))
+        elif self.mode == "pgsql":
+            conn = None
+            if await self.pgsql.create_event_notify_trigger(self.pgsql_channel):
+                conn = await self.pgsql.listen(self.pgsql_channel)
+            if conn is not None:
+                self.task = asyncio.ensure_future(self.listen_pgsql(conn))
+
+        if self.mode != "poll" and self.task is None:
+            self.logger.warning(
+                f"{self.mode} block notification is not available, poll every {self.poll_interval} s")
+
+    async def stop(self):
+        if self.task is None:
+            return
+        task, self.task = self.task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def notify(self):
+        self.event.set()
+
+    async def wait(self):
+        # return when notified or after the poll interval
+        timeout = self.poll_interval
+        if asyncio.get_running_loop().time() < self.settle_until:
+            timeout = self.settle_interval
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.event.clear()
+
+    async def listen_redis(self, pubsub):
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self.notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(
+                f"redis block notification error: {e}, fall back to polling")
+        finally:
+            await pubsub.reset()
+
+    async def listen_pgsql(self, conn):
+        try:
+            while True:
+                await conn.connection.notifies.get()
+                self.settle_until = asyncio.get_running_loop().time() + self.settle_time
+                self.notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(
+                f"pgsql block notification error: {e}, fall back to polling")
+        finally:
+            await self.pgsql.unlisten(conn)
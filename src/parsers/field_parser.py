@@ -1,5 +1,12 @@
+import os
+import sys
 import ast
 
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
+
+from src.utils.amount import parse_amount  # noqa
+
 
 def parse_deploy_name(content):
     return content.get("name", "")
@@ -29,14 +36,7 @@ def parse_amt(content):
     if "amt" not in content:
         return None
 
-    amt = str(content["amt"])
-    amt = amt.replace(",", "")
-    try:
-        amt = float(amt)
-        if amt >= 0:
-            return amt
-    except ValueError:
-        return None
+    return parse_amount(content["amt"])
 
 
 def parse_nonce(content):
@@ -114,9 +114,12 @@ def parse_deploy_max(content, dec):
             return str(max)
     except ValueError as e:
         try:
-            max = float(max)
-            if max >= 0 and len(str(content["max"]).split(".")[1]) <= dec:
-                return str(max)
+            # float() decides, the exact decimal is kept, str(float(max)) lost
+            # the digits past 15 significant ones. An infinite max is left out
+            if float(max) >= 0 and len(str(content["max"]).split(".")[1]) <= dec:
+                amount = parse_amount(max)
+                if amount is not None:
+                    return format(amount, "f")
         except ValueError:
             return None
 
@@ -136,8 +139,7 @@ def parse_deploy_lim(content, max, dec):
             return str(lim)
     except ValueError:
         try:
-            lim = float(lim)
-            if lim >= 0 and lim <= float(max) and len(str(content["lim"]).split(".")[1]) <= int(dec):
-                return str(lim)
+            if 0 <= float(lim) <= float(max) and len(str(content["lim"]).split(".")[1]) <= int(dec):
+                return format(parse_amount(lim), "f")
         except ValueError:
             return None
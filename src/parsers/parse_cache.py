@@ -0,0 +1,135 @@
+"""
+During mint storms thousands of inscriptions carry the same content. The
+detection result of a content and the op payloads parsed from it are kept
+in a bounded LRU, shared between the events, so they are read-only.
+"""
+import os
+import sys
+import decimal
+import functools
+from collections import OrderedDict
+
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
+
+from src.utils.orc20 import is_orc20, may_be_orc20  # noqa
+from src.metrics import metrics  # noqa
+
+SCALAR_TYPES = (str, int, float, bool, decimal.Decimal, type(None))
+
+
+def read_only(self, *args, **kwargs):
+    raise TypeError("content is shared by the cache, copy it before changing it")
+
+
+class FrozenContent(dict):
+    """
+    A dict that can not be changed, holding only scalars. `parsed` memoises
+    the op payloads parsed from it.
+    """
+    __slots__ = ("parsed",)
+
+    __setitem__ = __delitem__ = __ior__ = read_only
+    clear = pop = popitem = setdefault = update = read_only
+
+    def __init__(self, value=(), parsed=None):
+        dict.__init__(self, value)
+        self.parsed = parsed if parsed is not None else {}
+
+    def __reduce__(self):
+        # pickled with the payloads, the parse stage sends them from its workers
+        return (FrozenContent, (dict(self), self.parsed))
+
+
+def freeze(value):
+    # None when `value` holds containers, those could still be changed
+    for item in value.values():
+        if not isinstance(item, SCALAR_TYPES):
+            return None
+    return FrozenContent(value)
+
+
+def memoize_parse(parse):
+    """
+    Memoise `parse(content)` on a FrozenContent, other contents are parsed
+    every time. The payload is frozen like the content.
+    """
+    name = parse.__name__
+
+    @functools.wraps(parse)
+    def wrapper(content):
+        if not isinstance(content, FrozenContent):
+            return parse(content)
+        result = content.parsed.get(name)
+        if result is not None:
+            metrics.parse_cache.inc(name, "hit")
+            return result
+
+        metrics.parse_cache.inc(name, "miss")
+        payload, reason = parse(content)
+        if payload is None:
+            result = (None, reason)
+        else:
+            frozen = freeze(payload)
+            if frozen is None:
+                return payload, reason
+            result = (frozen, reason)
+        content.parsed[name] = result
+        return result
+    return wrapper
+
+
+class ParseCache:
+    """
+    LRU of `is_orc20` by content, up to `max_entries` contents of at most
+    `max_content_size` characters. Only orc20 candidates are cached, the
+    others are rejected without parsing anyway.
+    """
+
+    def __init__(self, max_entries=100000, max_content_size=4096):
+        self.max_entries = max_entries
+        self.max_content_size = max_content_size
+        self.entries = OrderedDict()
+
+    def cacheable(self, content_str):
+        return isinstance(content_str, str) and len(content_str) <= self.max_content_size and \
+            may_be_orc20(content_str)
+
+    def get(self, content_str):
+        # (found, content), a dict keyed by the content, its hash is cached on the string
+        entries = self.entries
+        if content_str in entries:
+            entries.move_to_end(content_str)
+            metrics.parse_cache.inc("is_orc20", "hit")
+            return True, entries[content_str]
+        metrics.parse_cache.inc("is_orc20", "miss")
+        return False, None
+
+    def put(self, content_str, content):
+        """
+        Cache `content`, the is_orc20 result of `content_str`, and return
+        the content to use. Contents holding containers are not cached.
+        """
+        if content is not None and type(content) is not FrozenContent:
+            frozen = freeze(content)
+            if frozen is None:
+                return content
+            content = frozen
+        if len(content_str) > self.max_content_size:
+            return content
+
+        entries = self.entries
+        entries[content_str] = content
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            metrics.parse_cache_evictions.inc()
+        metrics.parse_cache_entries.set(len(entries))
+        return content
+
+    def is_orc20(self, content_str):
+        if not self.cacheable(content_str):
+            return is_orc20(content_str)
+        found, content = self.get(content_str)
+        if found:
+            return content
+        return self.put(content_str, is_orc20(content_str))
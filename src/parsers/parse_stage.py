@@ -0,0 +1,133 @@
+"""
+Detects the orc20 contents of a fetched range and parses their op payloads
+in a process pool, so big ranges do not block the event loop. Sending a
+content to a worker and its result back costs about as much as parsing a
+short content, so only contents of `min_content_size` characters or more
+go to the pool, and only when they add up to `min_pool_size` characters.
+"""
+import os
+import sys
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
+
+from src.utils.orc20 import is_orc20, may_be_orc20  # noqa
+from src.parsers.parse_cache import ParseCache, freeze  # noqa
+from src.parsers.operation_parser import (parse_mint_content, parse_send_content,
+                                          parse_cancel_content, parse_upgrade_tick)  # noqa
+
+# the payloads the processors of an op parse from the content first
+OP_PARSERS = {
+    "mint": [parse_mint_content],
+    "send": [parse_send_content],
+    "transfer": [parse_send_content],
+    "cancel": [parse_cancel_content],
+    "upgrade": [parse_upgrade_tick],
+}
+
+
+def parse_contents(contents):
+    """
+    Run in a worker: (index, content) of the orc20 contents among `contents`,
+    frozen with their op payloads memoised when they can be.
+    """
+    parsed_contents = []
+    for index, content_str in enumerate(contents):
+        content = is_orc20(content_str)
+        if content is None:
+            continue
+        frozen = freeze(content)
+        if frozen is not None:
+            content = frozen
+            for parse in OP_PARSERS.get(str(content["op"]).lower(), []):
+                try:
+                    parse(content)
+                except Exception:
+                    # the processor runs it again and fails as before
+                    continue
+        parsed_contents.append((index, content))
+    return parsed_contents
+
+
+class ParseStage:
+
+    def __init__(self, logger, workers=None, min_pool_size=1000000, min_content_size=512,
+                 chunk_size=500):
+        self.logger = logger
+        # leave a core to the event loop, none is left on a single core and
+        # everything is parsed inline
+        if workers is None:
+            workers = min(4, (os.cpu_count() or 1) - 1)
+        self.workers = max(0, workers)
+        self.min_pool_size = min_pool_size
+        self.min_content_size = min_content_size
+        self.chunk_size = chunk_size
+        self.cache = ParseCache()
+        # started on the first big range
+        self.pool = None
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def parse_inline(self, contents):
+        return [self.cache.is_orc20(content_str) for content_str in contents]
+
+    async def parse(self, contents):
+        """
+        The is_orc20 result of every content, in order.
+        """
+        if self.workers <= 0:
+            return self.parse_inline(contents)
+
+        # only the distinct long candidates missing in the cache go to the pool
+        results = [None] * len(contents)
+        pending = {}
+        for index, content_str in enumerate(contents):
+            if not isinstance(content_str, str) or len(content_str) < self.min_content_size or \
+                    not may_be_orc20(content_str):
+                results[index] = self.cache.is_orc20(content_str)
+                continue
+            if content_str not in pending and len(content_str) <= self.cache.max_content_size:
+                found, content = self.cache.get(content_str)
+                if found:
+                    results[index] = content
+                    continue
+            pending.setdefault(content_str, []).append(index)
+
+        candidates = list(pending)
+        if sum(len(content_str) for content_str in candidates) < self.min_pool_size:
+            for content_str in candidates:
+                content = self.cache.put(content_str, is_orc20(content_str))
+                for result_index in pending[content_str]:
+                    results[result_index] = content
+            return results
+
+        chunks = [candidates[i:i + self.chunk_size]
+                  for i in range(0, len(candidates), self.chunk_size)]
+        loop = asyncio.get_running_loop()
+        try:
+            outputs = await asyncio.gather(*[
+                loop.run_in_executor(self.get_pool(), parse_contents, chunk) for chunk in chunks])
+        except Exception as e:
+            self.logger.warning(f"parse in process pool error: {e}, parse inline")
+            self.close()
+            outputs = [parse_contents(chunk) for chunk in chunks]
+
+        for chunk, output in zip(chunks, outputs):
+            parsed_contents = dict(output)
+            for index, content_str in enumerate(chunk):
+                content = self.cache.put(content_str, parsed_contents.get(index))
+                for result_index in pending[content_str]:
+                    results[result_index] = content
+        return results
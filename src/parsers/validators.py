@@ -0,0 +1,171 @@
+"""
+Single-pass validators of the op contents, one per op with the checks of
+its fields inlined in payload order. Each returns the payload, built at
+once when every field is valid, or None and the reason it is invalid.
+
+The checks are those of the parsers in field_parser.py, including the
+exceptions some of them raise, and the first invalid field in payload
+order is the one reported, as operation_parser.py always did. A field
+that may raise is checked before the invalid fields ahead of it are
+reported. `python benchmarks/validators.py` compares them with the parsers.
+"""
+import os
+import re
+import sys
+
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
+
+from src.parsers.field_parser import (parse_cancel_nonce, parse_deploy_dec, parse_deploy_max,
+                                      parse_deploy_lim, parse_v, parse_msg, parse_deploy_ug)  # noqa
+from src.utils.amount import parse_amount  # noqa
+
+OIP3_BLOCK_HEIGHT = 788836
+
+# a list of plain ints, the form of nearly every cancel, read without ast
+NONCE_LIST = re.compile(r"\[ *(?:-?(?:0|[1-9][0-9]*) *(?:, *-?(?:0|[1-9][0-9]*) *)*)?\]")
+
+
+def nonce_list(c):
+    n = c.get("n")
+    if type(n) is str and NONCE_LIST.fullmatch(n):
+        try:
+            return [int(nonce) for nonce in n[1:-1].split(",")]
+        except ValueError:
+            # an empty list, or too many digits for int() where literal_eval fails too
+            pass
+    return parse_cancel_nonce(c)
+
+
+def flag(c, key):
+    value = c.get(key, "true")
+    if value == "true":
+        return True
+    if value == "false":
+        return False
+    return None
+
+
+def validate_deploy(c, block_height, inscription_number):
+    # dec, max and lim may raise, they run before anything is reported
+    dec = 18
+    if "dec" in c:
+        dec = parse_deploy_dec(c)
+    max = parse_deploy_max(c, dec)
+    lim = parse_deploy_lim(c, max, dec)
+
+    if "tick" not in c:
+        return None, "tick is invalid"
+    name = c.get("name", "")
+    if name is None:
+        return None, "name is invalid"
+    v = c.get("v", "")
+    if v is None:
+        return None, "v is invalid"
+    msg = c.get("msg", "")
+    if msg is None:
+        return None, "msg is invalid"
+    ug = flag(c, "ug")
+    if ug is None:
+        return None, "ug is invalid"
+    wp = flag(c, "wp")
+    if wp is None:
+        return None, "wp is invalid"
+    if block_height >= OIP3_BLOCK_HEIGHT:
+        tick_id = str(inscription_number)
+    elif "id" in c:
+        tick_id = str(c["id"]).lower()
+    else:
+        return None, "tick_id is invalid"
+    if dec is None:
+        return None, "dec is invalid"
+    if max is None:
+        return None, "max is invalid"
+    if lim is None:
+        return None, "lim is invalid"
+    return {"tick": str(c["tick"]).lower(), "name": name, "v": v, "msg": msg, "ug": ug, "wp": wp,
+            "tick_id": tick_id, "dec": dec, "max": max, "lim": lim}, None
+
+
+def validate_mint(c):
+    if "tick" not in c:
+        return None, "tick is invalid"
+    if "id" not in c:
+        return None, "tick_id is invalid"
+    amt = parse_amount(c["amt"]) if "amt" in c else None
+    if amt is None:
+        return None, "amt is invalid"
+    msg = c.get("msg", "")
+    if msg is None:
+        return None, "msg is invalid"
+    return {"tick": str(c["tick"]).lower(), "tick_id": str(c["id"]).lower(), "amt": amt, "msg": msg}, None
+
+
+def validate_send(c):
+    # int() of n raises on what is not a str or a number, before anything is reported
+    n = None
+    if "n" in c:
+        try:
+            n = int(c["n"])
+            if n < 0:
+                n = None
+        except ValueError:
+            pass
+
+    if "tick" not in c:
+        return None, "tick is invalid"
+    if "id" not in c:
+        return None, "tick_id is invalid"
+    msg = c.get("msg", "")
+    if msg is None:
+        return None, "msg is invalid"
+    if n is None:
+        return None, "n is invalid"
+    payload = {"tick": str(c["tick"]).lower(), "tick_id": str(c["id"]).lower(), "msg": msg, "n": n}
+    # amt is left out of an inscribe-remaining
+    amt = parse_amount(c["amt"]) if "amt" in c else None
+    if amt is not None:
+        payload["amt"] = amt
+    return payload, None
+
+
+def validate_cancel(c):
+    if "tick" not in c:
+        return None, "tick is invalid"
+    if "id" not in c:
+        return None, "tick_id is invalid"
+    msg = c.get("msg", "")
+    if msg is None:
+        return None, "msg is invalid"
+    n = nonce_list(c) if "n" in c else None
+    if n is None:
+        return None, "n is invalid"
+    return {"tick": str(c["tick"]).lower(), "tick_id": str(c["id"]).lower(), "msg": msg, "n": n}, None
+
+
+def validate_upgrade_tick(c):
+    if "tick" not in c:
+        return None, "tick is invalid"
+    if "id" not in c:
+        return None, "tick_id is invalid"
+    return {"tick": str(c["tick"]).lower(), "tick_id": str(c["id"]).lower()}, None
+
+
+# the fields an upgrade may change, they follow the dec in the order of the content
+UPGRADE_FIELDS = {"dec": parse_deploy_dec, "v": parse_v, "msg": parse_msg, "ug": parse_deploy_ug}
+
+
+def validate_upgrade(c, dec):
+    payload = {"dec": dec}
+    invalid = dec is None
+    for key in c:
+        parse = UPGRADE_FIELDS.get(key)
+        if parse is not None:
+            value = payload[key] = parse(c)
+            invalid = invalid or value is None
+
+    if invalid:
+        for key, value in payload.items():
+            if value is None:
+                return None, f"{key} is invalid"
+    return payload, None
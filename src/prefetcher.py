@@ -0,0 +1,188 @@
+import os
+import sys
+import asyncio
+import hashlib
+from collections import deque
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.parsers.parse_stage import ParseStage  # noqa
+from src.metrics import timed_phase  # noqa
+
+
+def block_hash(events):
+    # the event table has no block hash, a block is identified by its events
+    digest = hashlib.blake2b(digest_size=16)
+    for event in events:
+        digest.update(
+            f"{event.id}|{event.inscription_id}|{event.event}|{event['from']}|{event.to}|{event.value}\n".encode())
+    return digest.hexdigest()
+
+
+def group_by_height(start_height, end_height, events):
+    block_events = {height: []
+                    for height in range(start_height, end_height + 1)}
+    for event in events:
+        block_events[event.block_height].append(event)
+    return block_events
+
+
+class PreparedBlock:
+    """
+    The events of one block, already fetched and decoded.
+    `events` holds (event, content) of the orc20 events in id order,
+    `event_count` is the number of events of the block, orc20 or not,
+    `last_event_id` the id of its last event and `block_hash` the hash of
+    all its events.
+    """
+
+    def __init__(self, block_height, events, event_count, last_event_id=None, block_hash=None):
+        self.block_height = block_height
+        self.events = events
+        self.event_count = event_count
+        self.last_event_id = last_event_id
+        self.block_hash = block_hash
+
+    def size(self):
+        return len(self.events) + 1
+
+
+class BlockPrefetcher:
+    """
+    Fetches the events of a range of heights in one query, decodes them and
+    keeps the prepared blocks in a queue the indexer drains in height order.
+
+    The queue is bounded by the number of prepared events it holds
+    (`max_events`), the range of a query grows while blocks are small and
+    shrinks when they are big, up to `max_range` heights.
+    """
+
+    def __init__(self, pgsql, logger, max_events=100000, max_range=100, parse_workers=None):
+        self.pgsql = pgsql
+        self.logger = logger
+        self.max_events = max_events
+        self.max_range = max_range
+        # identical contents are detected and parsed once, big ranges in a process pool
+        self.parse_stage = ParseStage(logger, parse_workers)
+
+        self.blocks = deque()
+        self.queued_events = 0
+        self.condition = asyncio.Condition()
+        self.task = None
+
+        self.next_height = None
+        self.end_height = None
+
+    def reset(self, start_height):
+        # drop everything prefetched and restart from `start_height`
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.blocks.clear()
+        self.queued_events = 0
+        self.next_height = start_height
+        self.end_height = start_height - 1
+
+    def extend(self, end_height):
+        # prefetch up to `end_height`, the latest block known
+        self.end_height = max(self.end_height, end_height)
+        if self.next_height <= self.end_height and \
+                (self.task is None or self.task.done()):
+            self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            task, self.task = self.task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.parse_stage.close()
+
+    async def get(self):
+        async with self.condition:
+            await self.condition.wait_for(
+                lambda: self.blocks or self.task is None or self.task.done())
+            if not self.blocks:
+                # surface the error of the fetch task
+                if self.task is not None:
+                    self.task.result()
+                raise RuntimeError("no block left to prefetch")
+
+            block = self.blocks.popleft()
+            self.queued_events -= block.size()
+            self.condition.notify_all()
+            return block
+
+    async def get_ready(self, max_blocks):
+        # the blocks already prepared, up to `max_blocks`, without waiting
+        blocks = []
+        async with self.condition:
+            while self.blocks and len(blocks) < max_blocks:
+                block = self.blocks.popleft()
+                self.queued_events -= block.size()
+                blocks.append(block)
+            if blocks:
+                self.condition.notify_all()
+        return blocks
+
+    async def run(self):
+        try:
+            await self.produce()
+        finally:
+            async with self.condition:
+                self.condition.notify_all()
+
+    async def produce(self):
+        range_size = 1
+        while self.next_height <= self.end_height:
+            start_height = self.next_height
+            end_height = min(start_height + range_size - 1, self.end_height)
+
+            with timed_phase("fetch"):
+                events = await self.pgsql.get_event_by_block_range(start_height, end_height)
+            if events is None:
+                self.logger.error(
+                    f"prefetch blocks: {start_height}-{end_height} failed, retry")
+                await asyncio.sleep(1)
+                continue
+
+            with timed_phase("parse"):
+                contents = await self.parse_stage.parse([event.content for event in events])
+                blocks = self.prepare(start_height, end_height, events, contents)
+            for block in blocks:
+                async with self.condition:
+                    await self.condition.wait_for(
+                        lambda: self.queued_events < self.max_events)
+                    self.blocks.append(block)
+                    self.queued_events += block.size()
+                    self.condition.notify_all()
+            self.next_height = end_height + 1
+
+            # aim every query at a quarter of the queue
+            if len(events) < self.max_events // 4:
+                range_size = min(range_size * 2, self.max_range)
+            elif range_size > 1:
+                range_size //= 2
+
+    def prepare(self, start_height, end_height, events, contents=None):
+        # `contents` are the is_orc20 results of `events` if already parsed
+        if contents is None:
+            contents = self.parse_stage.parse_inline([event.content for event in events])
+        parsed = {event.id: content for event, content in zip(events, contents)}
+        block_events = group_by_height(start_height, end_height, events)
+
+        blocks = []
+        for block_height, events in block_events.items():
+            prepared_events = []
+            for event in events:
+                content = parsed[event.id]
+                if content is None:
+                    continue
+                prepared_events.append((event, content))
+            blocks.append(PreparedBlock(
+                block_height, prepared_events, len(events),
+                events[-1].id if events else None, block_hash(events)))
+        return blocks
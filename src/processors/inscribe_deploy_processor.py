@@ -5,26 +5,27 @@ import asyncio
 src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 sys.path.append(src_path)
 
-from src.dbs.pgsql_helper import PgsqlHelper  # noqa
+from src.dbs.storage import Storage  # noqa
+from src.dbs.state_store import StateStore  # noqa
 from src.parsers.operation_parser import parse_deploy_content  # noqa
 from src.processors.common import (genarate_transaction_json,
                                    save_invalid_transaction_task,
                                    generate_balance_json)  # noqa
+from src.utils.amount import to_units  # noqa
 
 
-async def handle_inscribe_deploy(pgsql: PgsqlHelper, event, content):
+async def handle_inscribe_deploy(pgsql: Storage, state: StateStore, event, content):
 
     transaction = genarate_transaction_json(event, "inscribe-deploy")
 
     deploy_content, _ = parse_deploy_content(
         content, event.block_height, event.inscription_number)
     if deploy_content is None:
-        return save_invalid_transaction_task(pgsql, transaction, "invalid deploy content")
+        return save_invalid_transaction_task(pgsql, state, transaction, "invalid deploy content")
 
     token_id = f'{deploy_content["tick"]}-{deploy_content["tick_id"]}'
-    tokens = await pgsql.get_token_by_id(token_id)
-    if tokens:
-        return save_invalid_transaction_task(pgsql, transaction, "token exists")
+    if state.get_token(token_id) is not None:
+        return save_invalid_transaction_task(pgsql, state, transaction, "token exists")
 
     tasks = []
     # save token info
@@ -36,9 +37,9 @@ async def handle_inscribe_deploy(pgsql: PgsqlHelper, event, content):
         "deploy_time": event.time,
     }
     token_info.update(deploy_content)
-    tasks.append(asyncio.ensure_future(
-        pgsql.save_token_info(token_info)
-    ))
+    token_info["max"] = to_units(deploy_content["max"])
+    token_info["lim"] = to_units(deploy_content["lim"])
+    state.save_token(token_info)
 
     # save deploy transaction info
     transaction["token_id"] = token_info["id"]
@@ -50,6 +51,6 @@ async def handle_inscribe_deploy(pgsql: PgsqlHelper, event, content):
     # save user balance info
     balance_id = f"{event.to}-{token_info['id']}"
     balance_json = generate_balance_json(event, token_info, balance_id, 0)
-    tasks.append(asyncio.ensure_future(pgsql.save_balance_info(balance_json)))
+    state.save_balance(balance_json)
 
     return tasks
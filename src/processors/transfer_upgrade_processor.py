@@ -7,7 +7,8 @@ import copy
 src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 sys.path.append(src_path)
 
-from src.dbs.pgsql_helper import PgsqlHelper  # noqa
+from src.dbs.storage import Storage  # noqa
+from src.dbs.state_store import StateStore  # noqa
 from src.parsers.operation_parser import parse_upgrade_tick  # noqa
 from src.processors.common import (genarate_transaction_json,
                                    save_invalid_transaction_task)  # noqa
@@ -16,7 +17,7 @@ from src.processors.common import (genarate_transaction_json,
 UPGRADE_RECEIVER_ADDRESS = "bc1pgha2vs4m4d70aw82qzrhmg98yea4fuxtnf7lpguez3z9cjtukpssrhakhl"
 
 
-async def handle_transfer_upgrade(pgsql: PgsqlHelper, event, content):
+async def handle_transfer_upgrade(pgsql: Storage, state: StateStore, event, content):
 
     tasks = []
 
@@ -24,11 +25,11 @@ async def handle_transfer_upgrade(pgsql: PgsqlHelper, event, content):
 
     upgrade_tick_content, _ = parse_upgrade_tick(content)
     if upgrade_tick_content is None:
-        return save_invalid_transaction_task(pgsql, transaction, "invalid upgrade content")
+        return save_invalid_transaction_task(pgsql, state, transaction, "invalid upgrade content")
 
-    token_info = await query_token_by_tick_and_tick_id(pgsql, upgrade_tick_content["tick"], upgrade_tick_content["tick_id"])
+    token_info = query_token_by_tick_and_tick_id(state, upgrade_tick_content["tick"], upgrade_tick_content["tick_id"])
     if token_info is None:
-        return save_invalid_transaction_task(pgsql, transaction, "token not exists")
+        return save_invalid_transaction_task(pgsql, state, transaction, "token not exists")
 
     upgrade_pending_list = []
     upgrade_transaction = None
@@ -39,12 +40,13 @@ async def handle_transfer_upgrade(pgsql: PgsqlHelper, event, content):
         upgrade_pending_list.append(upgrade_pending)
 
     if upgrade_transaction is None:
-        return save_invalid_transaction_task(pgsql, transaction, "invalid upgrade inscription")
+        return save_invalid_transaction_task(pgsql, state, transaction, "invalid upgrade inscription")
 
     # Only deployer can transfer upgrade inscription to upgrade receiver address
     if event["from"] != token_info.deployer or event["to"] != UPGRADE_RECEIVER_ADDRESS:
-        return save_invalid_transaction_task(pgsql, transaction, "only deployer can transfer upgrade")
+        return save_invalid_transaction_task(pgsql, state, transaction, "only deployer can transfer upgrade")
 
+    upgrade_transaction = dict(upgrade_transaction)
     upgrade_transaction["effective_index"] = event.id
     upgrade_transaction["effective_time"] = event.time
     upgrade_transaction["effective_block_height"] = event.block_height
@@ -57,10 +59,7 @@ async def handle_transfer_upgrade(pgsql: PgsqlHelper, event, content):
     update_content["upgrade_pending"] = upgrade_pending_list
     update_content["upgrade_time"] = event.time
 
-    tasks.append(asyncio.ensure_future(
-        pgsql.update_token_info(
-            token_info.id, update_content)
-    ))
+    state.update_token(token_info.id, update_content)
 
     transaction["token_id"] = token_info["id"]
     transaction["valid"] = True
@@ -0,0 +1,47 @@
+import asyncio
+
+
+def resolve_token_key(content):
+    """
+    The key of the token an event works on. Tokens are looked up by tick and
+    tick id or inscription number, always together with the tick, so events
+    of different ticks never touch the same token, balance or transaction.
+    Events without tick are invalid and only save their own transaction.
+    """
+    if "tick" not in content:
+        return None
+    return str(content["tick"]).lower()
+
+
+class TokenScheduler:
+    """
+    Runs the events of different tokens concurrently. Events of the same token
+    run one after another in the order they are given (event id order), so
+    the result is the same as a serial replay.
+    """
+
+    def __init__(self, handle_event, concurrent=True):
+        self.handle_event = handle_event
+        self.concurrent = concurrent
+
+    def partition(self, events):
+        queues = {}
+        for event, content in events:
+            queues.setdefault(resolve_token_key(content), []).append(
+                (event, content))
+        return queues
+
+    async def run(self, events):
+        if not self.concurrent:
+            return await self.run_queue(events)
+
+        queues = self.partition(events)
+        results = await asyncio.gather(
+            *[self.run_queue(queue) for queue in queues.values()])
+        return False not in results
+
+    async def run_queue(self, events):
+        for event, content in events:
+            if await self.handle_event(event, content) is False:
+                return False
+        return True
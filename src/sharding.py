@@ -0,0 +1,122 @@
+import os
+import sys
+import zlib
+import signal
+import asyncio
+import multiprocessing
+from loguru import logger
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.dbs.redis_helper import RedisHelper  # noqa
+
+
+def shard_of(token_key, shard_count):
+    """
+    The shard owning a token key (see `scheduler.resolve_token_key`). The
+    32 bit crc of the key is split in `shard_count` contiguous ranges, so the
+    result is stable across processes and nodes. Events without tick go to
+    shard 0.
+    """
+    if token_key is None:
+        return 0
+    return (zlib.crc32(token_key.encode()) * shard_count) >> 32
+
+
+def shard_cursor_id(shard_index, shard_count):
+    return f"shard-{shard_index}-of-{shard_count}"
+
+
+class ShardCoordinator:
+    """
+    Tracks the height committed by every shard. Shards report their height
+    to redis after each commit, the coordinator publishes the minimum: the
+    state in postgres is complete up to that block for every token.
+    """
+
+    def __init__(self, logger, redis, shard_count, interval=5):
+        self.logger = logger
+        self.redis = redis
+        self.shard_count = shard_count
+        self.interval = interval
+        self.stop_flag = False
+        self.committed_height = None
+
+    def stop(self, signal_num, frame):
+        self.stop_flag = True
+
+    async def update(self):
+        heights = await self.redis.get_shard_heights()
+        if heights is None:
+            return None
+
+        shard_heights = []
+        for shard_index in range(self.shard_count):
+            height = heights.get(shard_cursor_id(
+                shard_index, self.shard_count))
+            if height is None:
+                # a shard has not committed yet
+                return None
+            shard_heights.append(int(height))
+
+        committed_height = min(shard_heights)
+        if committed_height != self.committed_height:
+            self.committed_height = committed_height
+            await self.redis.set_committed_height(committed_height)
+            self.logger.info(
+                f"shards committed up to block: {committed_height}, shard heights: {shard_heights}")
+        return committed_height
+
+    async def run(self, is_alive=None):
+        while not self.stop_flag:
+            await self.update()
+            if is_alive is not None and not is_alive():
+                break
+            await asyncio.sleep(self.interval)
+        await self.update()
+        await self.redis.close()
+
+
+def run_shard(db_version, notify_mode, start_height, shard_index, shard_count,
+              metrics_port=None, trace_threshold_ms=None, redis_notify_config=False):
+    # entry of a worker process, also used directly on a node running one shard,
+    # shard i serves its metrics on `metrics_port` + i
+    from src.indexer import Indexer
+
+    if metrics_port:
+        metrics_port += shard_index
+    indexer = Indexer(db_version, notify_mode, shard_index, shard_count,
+                      metrics_port=metrics_port, trace_threshold_ms=trace_threshold_ms,
+                      redis_notify_config=redis_notify_config)
+    asyncio.run(indexer.run(start_height))
+
+
+def run_coordinator(db_version, shard_count, is_alive=None):
+    coordinator = ShardCoordinator(
+        logger, RedisHelper(logger, db_version), shard_count)
+    signal.signal(signal.SIGINT, coordinator.stop)
+    signal.signal(signal.SIGTERM, coordinator.stop)
+    asyncio.run(coordinator.run(is_alive))
+
+
+def run_sharded(db_version, notify_mode, start_height, shard_count,
+                metrics_port=None, trace_threshold_ms=None, redis_notify_config=False):
+    """
+    Run `shard_count` worker processes on this machine, every worker applies
+    the events of its own tokens, and coordinate them from this process.
+    """
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=run_shard,
+                               args=(db_version, notify_mode, start_height, shard_index, shard_count,
+                                     metrics_port, trace_threshold_ms, redis_notify_config),
+                               name=f"indexer-shard-{shard_index}")
+               for shard_index in range(shard_count)]
+    for worker in workers:
+        worker.start()
+
+    run_coordinator(db_version, shard_count,
+                    lambda: any(worker.is_alive() for worker in workers))
+
+    for worker in workers:
+        worker.join()
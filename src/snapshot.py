@@ -0,0 +1,100 @@
+import os
+import gzip
+import json
+import hashlib
+
+SNAPSHOT_VERSION = 2
+
+# pools whose transactions the processors read again, a snapshot holds them
+TRANSACTION_POOLS = ["pending_send_pool", "available_send_pool", "sent_send_pool"]
+
+
+def snapshot_path(snapshot_dir, db_version, block_height):
+    return os.path.join(snapshot_dir, f"snapshot_{db_version}_{block_height}.jsonl.gz")
+
+
+def pool_transaction_keys(pools):
+    # (transaction_id, block_height) of the items, the height is None in older ones
+    keys = {}
+    for item in pools:
+        if item["kind"] in TRANSACTION_POOLS:
+            keys[item["transaction_id"]] = item.get("block_height")
+    return sorted(keys.items())
+
+
+def dump_snapshot(path, header, tokens, balances, pools=(), transactions=()):
+    """
+    Write a snapshot to `path`.tmp and return that path, the caller moves it
+    in place. The file is gzipped json lines: the header, one line per row
+    and the sha256 of all of them.
+    """
+    tmp_path = f"{path}.tmp"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    digest = hashlib.sha256()
+    with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+        def write(value):
+            line = json.dumps(value, separators=(",", ":")).encode() + b"\n"
+            digest.update(line)
+            f.write(line)
+
+        write(dict(header, version=SNAPSHOT_VERSION, tokens=len(tokens),
+                   balances=len(balances), pools=len(pools), transactions=len(transactions)))
+        for token in tokens:
+            write(["token", token])
+        for balance in balances:
+            write(["balance", balance])
+        for item in pools:
+            write(["pool", item])
+        for transaction in transactions:
+            write(["transaction", transaction])
+        f.write(json.dumps({"sha256": digest.hexdigest()}).encode() + b"\n")
+    return tmp_path
+
+
+def load_snapshot(path):
+    """
+    Read and verify a snapshot, return (header, tokens, balances, pools,
+    transactions).
+    Raise ValueError if the file is truncated or does not match its checksum.
+    """
+    digest = hashlib.sha256()
+    header = None
+    checksum = None
+    rows = {"token": [], "balance": [], "pool": [], "transaction": []}
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            if checksum is not None:
+                raise ValueError("data after the checksum")
+            value = json.loads(line)
+            if isinstance(value, dict) and "sha256" in value and header is not None:
+                checksum = value["sha256"]
+                continue
+            digest.update(line)
+            if header is None:
+                header = value
+            else:
+                rows[value[0]].append(value[1])
+
+    if header is None or checksum is None:
+        raise ValueError("snapshot is truncated")
+    if checksum != digest.hexdigest():
+        raise ValueError("snapshot checksum mismatch")
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"unknown snapshot version {header.get('version')}")
+    if header["tokens"] != len(rows["token"]) or header["balances"] != len(rows["balance"]) or \
+            header["pools"] != len(rows["pool"]) or header["transactions"] != len(rows["transaction"]):
+        raise ValueError("snapshot row count mismatch")
+    return header, rows["token"], rows["balance"], rows["pool"], rows["transaction"]
+
+
+def prune_snapshots(snapshot_dir, db_version, keep):
+    # remove all but the `keep` latest snapshots of `db_version`
+    prefix = f"snapshot_{db_version}_"
+    heights = []
+    for name in os.listdir(snapshot_dir):
+        if name.startswith(prefix) and name.endswith(".jsonl.gz"):
+            height = name[len(prefix):-len(".jsonl.gz")]
+            if height.isdigit():
+                heights.append(int(height))
+    for height in sorted(heights)[:-keep]:
+        os.remove(snapshot_path(snapshot_dir, db_version, height))
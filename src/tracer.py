@@ -0,0 +1,65 @@
+import time
+from contextvars import ContextVar
+
+# the trace of the event being handled, set by `Indexer.handle_event` in
+# tracing mode, the tasks it starts share it
+current_trace = ContextVar("current_trace", default=None)
+
+
+class EventTrace:
+    """
+    The round trips issued while handling one event: their number, their
+    total time and a count and time per call.
+    """
+
+    def __init__(self, event, processor):
+        self.event = event
+        self.processor = processor
+        self.start = time.perf_counter()
+        self.elapsed = None
+        self.queries = 0
+        self.query_seconds = 0.0
+        # call -> [count, seconds]
+        self.calls = {}
+
+    def record(self, call, seconds):
+        self.queries += 1
+        self.query_seconds += seconds
+        entry = self.calls.get(call)
+        if entry is None:
+            entry = self.calls[call] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+
+    def record_shared(self, shared, events):
+        # the round trips of a read coalesced for `events` events, each of them counts it
+        for call, (count, seconds) in shared.calls.items():
+            self.queries += count
+            self.query_seconds += seconds
+            entry = self.calls.get(f"{call} shared by {events}")
+            if entry is None:
+                entry = self.calls[f"{call} shared by {events}"] = [0, 0.0]
+            entry[0] += count
+            entry[1] += seconds
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.start
+        return self.elapsed
+
+    def breakdown(self):
+        calls = sorted(self.calls.items(), key=lambda item: item[1][1], reverse=True)
+        return ", ".join(f"{call}: {count} in {seconds * 1000:.1f} ms"
+                         for call, (count, seconds) in calls)
+
+    def summary(self):
+        event = self.event
+        return f"event: {event.id}, block: {event.block_height}, processor: {self.processor}, " \
+            f"inscription: {event.inscription_id}, from: {event['from']}, to: {event.to}, " \
+            f"cost: {self.elapsed * 1000:.1f} ms, queries: {self.queries} in {self.query_seconds * 1000:.1f} ms " \
+            f"({self.breakdown()})"
+
+
+def record_query(call, seconds):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.record(call, seconds)
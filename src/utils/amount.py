@@ -0,0 +1,71 @@
+"""
+Token amounts are kept as integers of 10**-18 units, the finest `dec` a
+token may have. Upgrades can change the `dec` of a token, a fixed scale
+keeps the stored amounts valid across them, and integer arithmetic keeps
+them exact where floats lost digits past 15 significant ones.
+"""
+import decimal
+import sqlalchemy as sa
+
+SCALE_DECIMALS = 18
+SCALE = 10 ** SCALE_DECIMALS
+
+
+def parse_amount(value):
+    """
+    The exact Decimal of an amount written in a content, commas removed,
+    None when it is not a finite number >= 0.
+    """
+    value = str(value).replace(",", "")
+    try:
+        # float() decides what is a number, Decimal is laxer with underscores
+        if not 0 <= float(value) < float("inf"):
+            return None
+    except ValueError:
+        return None
+    return decimal.Decimal(value)
+
+
+def to_units(amount):
+    """
+    Scale an amount (a Decimal, or a str or int as written in a content) to
+    units, digits finer than a unit are dropped.
+    """
+    if not isinstance(amount, decimal.Decimal):
+        amount = decimal.Decimal(str(amount).replace(",", ""))
+    sign, digits, exponent = amount.as_tuple()
+    exponent += SCALE_DECIMALS
+    if exponent < -len(digits):
+        return 0
+    units = int("".join(map(str, digits)) or "0")
+    if exponent >= 0:
+        units *= 10 ** exponent
+    else:
+        units //= 10 ** -exponent
+    return -units if sign else units
+
+
+def format_amount(units):
+    # the plain decimal string of `units`, without trailing zeros
+    if units is None:
+        return None
+    amount = decimal.Decimal(int(units)).scaleb(-SCALE_DECIMALS, decimal.Context(prec=200))
+    text = format(amount, "f")
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return text
+
+
+class Units(sa.TypeDecorator):
+    """
+    A NUMERIC column of units, read back as int rather than Decimal so rows
+    compare, hash and serialise like the ones built in memory.
+    """
+    impl = sa.Numeric
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return int(value) if value is not None else None
+
+    def process_result_value(self, value, dialect):
+        return int(value) if value is not None else None
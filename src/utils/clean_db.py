@@ -7,6 +7,7 @@ sys.path.append(src_path)
 
 from src.dbs.redis_helper import RedisHelper  # noqa
 from src.dbs.pgsql_helper import PgsqlHelper  # noqa
+from src.dbs.migrations import apply_migrations  # noqa
 
 
 logger.add(
@@ -17,16 +18,28 @@ logger.add(
 )
 
 
-async def clean_db(db_version="a"):
+async def clean_db(db_version="a", bulk=False):
+    """
+    Recreate the tables empty. With `bulk` they are unlogged and without
+    secondary indexes until the indexer catches up, see `PgsqlHelper.finish_bulk_load`.
+    """
     pgsql = PgsqlHelper(logger, db_version)
     redis = RedisHelper(logger, db_version)
 
     await pgsql.init()
+    pgsql.bulk = bulk
 
     await redis.del_handled_event_db()
+    await redis.del_shard_heights()
     await pgsql.create_token_table()
     await pgsql.create_balance_table()
+    await pgsql.create_pool_table()
     await pgsql.create_transaction_table()
+    await pgsql.create_cursor_table()
+    await pgsql.create_undo_table()
+    # the tables come with their indexes, this records the schema version
+    if not bulk:
+        await apply_migrations(pgsql, logger)
 
     await redis.close()
     await pgsql.close()
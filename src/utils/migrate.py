@@ -0,0 +1,38 @@
+import os
+import sys
+from loguru import logger
+
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
+
+from src.dbs.pgsql_helper import PgsqlHelper  # noqa
+from src.dbs.migrations import apply_migrations  # noqa
+
+
+logger.add(
+    f"./logs/{os.path.basename(__file__).split('.')[0]}.log",
+    level="INFO",
+    rotation="500 MB",
+    enqueue=True
+)
+
+
+async def migrate(db_version="A"):
+    """
+    Apply the schema migrations not applied yet, the indexer may keep
+    running meanwhile.
+    """
+    pgsql = PgsqlHelper(logger, db_version)
+    await pgsql.init()
+
+    success = await apply_migrations(pgsql, logger)
+
+    await pgsql.close()
+    if success:
+        logger.info(f"migrate db version {db_version} successfully")
+    return success
+
+
+if __name__ == '__main__':
+    import asyncio
+    asyncio.run(migrate(sys.argv[1] if len(sys.argv) > 1 else "A"))
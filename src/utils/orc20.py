@@ -1,6 +1,22 @@
 import re
 import simplejson as json
 
+PROTOCOL_PATTERN = re.compile(r"[oO][rR][cC]")
+
+
+def may_be_orc20(content_str):
+    """
+    Whether `content_str` can hold an orc20 object, without parsing it: it
+    has a {, the keys "p" and "op" and the protocol name, unless escapes
+    could hide them.
+    """
+    if "{" not in content_str:
+        return False
+    if "\\" in content_str:
+        return True
+    return '"op"' in content_str and '"p"' in content_str and \
+        PROTOCOL_PATTERN.search(content_str) is not None
+
 
 def is_standardize_orc20(content_str):
     try:
@@ -24,19 +40,38 @@ def is_standardize_orc20(content_str):
         return None
 
 
+def split_objects(content_str):
+    # from every { to the first } after it, left to right, as re.findall(r'\{.*?\}')
+    fragments = []
+    start = content_str.find("{")
+    while start != -1:
+        end = content_str.find("}", start + 1)
+        if end == -1:
+            break
+        fragments.append(content_str[start:end + 1])
+        start = content_str.find("{", end + 1)
+    return fragments
+
+
 def is_orc20(content_str):
 
+    # most inscriptions are not orc20, reject them before any json work
+    if not may_be_orc20(content_str):
+        return None
+
     # check if it is standard json
     content = is_standardize_orc20(content_str)
     if content is not None:
         return content
 
     # check if it is multi json
-    matches = re.findall(r'\{.*?\}', content_str, re.DOTALL)
-    if len(matches) < 2:
+    fragments = split_objects(content_str)
+    if len(fragments) < 2:
         # there are non-standard strings outside the JSON brackets, invalid
         return None
-    for match in matches:
-        content = is_standardize_orc20(match)
+    for fragment in fragments:
+        if not may_be_orc20(fragment):
+            continue
+        content = is_standardize_orc20(fragment)
         if content is not None:
             return content
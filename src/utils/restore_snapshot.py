@@ -0,0 +1,66 @@
+import os
+import sys
+from loguru import logger
+
+src_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(src_path)
+
+from src.dbs.pgsql_helper import PgsqlHelper  # noqa
+from src.snapshot import load_snapshot  # noqa
+
+
+logger.add(
+    f"./logs/{os.path.basename(__file__).split('.')[0]}.log",
+    level="INFO",
+    rotation="500 MB",
+    enqueue=True
+)
+
+
+async def restore_snapshot(path, db_version="A"):
+    """
+    Replace the token, balance and pool tables with a snapshot and move the cursor
+    to its height, the indexer then resumes from the next block.
+    """
+    try:
+        header, tokens, balances, pools, transactions = load_snapshot(path)
+    except (OSError, ValueError) as e:
+        logger.error(f"load snapshot {path} error: {e}")
+        return False
+    if header["db_version"] != db_version:
+        logger.error(
+            f"snapshot {path} is for db version {header['db_version']}, not {db_version}")
+        return False
+
+    pgsql = PgsqlHelper(logger, db_version)
+    await pgsql.init()
+
+    success = await pgsql.create_token_table() and \
+        await pgsql.create_balance_table() and \
+        await pgsql.create_pool_table() and \
+        await pgsql.create_cursor_table() and \
+        await pgsql.create_undo_table()
+    if success:
+        # keep the history of an existing table, recreating it would drop it
+        exists = await pgsql.transaction_table_exists()
+        if exists is None:
+            success = False
+        elif not exists:
+            success = await pgsql.create_transaction_table()
+        elif await pgsql.prune_transactions(header["block_height"]) is False:
+            logger.error(f"prune transactions after {header['block_height']} failed, restore aborted")
+            success = False
+    if success:
+        success = await pgsql.restore_state(
+            tokens, balances, pools, transactions, header["block_height"], header.get("event_id"))
+
+    await pgsql.close()
+    if success:
+        logger.info(
+            f"restore snapshot {path} successfully, block: {header['block_height']}, tokens: {len(tokens)}, balances: {len(balances)}, pools: {len(pools)}")
+    return success
+
+
+if __name__ == '__main__':
+    import asyncio
+    asyncio.run(restore_snapshot(sys.argv[1]))
@@ -0,0 +1,179 @@
+import os
+import sys
+import random
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.utils.amount import parse_amount, to_units  # noqa
+from src.parsers.field_parser import parse_deploy_max, parse_deploy_lim  # noqa
+from tests.test_pool_replay import event, replay, deploy_and_mint, balances  # noqa
+
+
+# parse_amt before the amounts were units, the reference
+
+def old_parse_amt(amt):
+    amt = str(amt).replace(",", "")
+    try:
+        amt = float(amt)
+        if amt >= 0:
+            return amt
+    except ValueError:
+        return None
+
+
+# a float() of these is +inf, the only amounts parsed before and not now
+INFINITE = ["inf", "Inf", "+inf", "INFINITY", "Infinity", " inf\n", "in,f", "1e309", "1e400",
+            "9" * 400, float("inf")]
+AMOUNTS = INFINITE + [
+    "nan", "NaN", "-nan", "-inf", "-Infinity", "-1", "-0", "0", "1", "1.5", "1,000", "1,0,0", "1e3",
+    "1E-3", ".5", "5.", "1_000", "0x10", "", " ", "abc", "1e308", "0.000000000000000001",
+    "1" * 300, 0, 10, -10, 1.5, float("nan"), True, None, [1]]
+
+
+# parse_deploy_max and parse_deploy_lim before the decimals were exact, the reference
+
+def old_parse_deploy_max(content, dec):
+    max = str(content["max"]).replace(",", "")
+    try:
+        if int(max) >= 0:
+            return str(max)
+    except ValueError:
+        try:
+            max = float(max)
+            if max >= 0 and len(str(content["max"]).split(".")[1]) <= dec:
+                return str(max)
+        except ValueError:
+            return None
+
+
+def old_parse_deploy_lim(content, max, dec):
+    lim = str(content["lim"]).replace(",", "")
+    try:
+        lim = int(lim)
+        if lim >= 0 and lim <= int(max):
+            return str(lim)
+    except ValueError:
+        try:
+            lim = float(lim)
+            if lim >= 0 and lim <= float(max) and len(str(content["lim"]).split(".")[1]) <= int(dec):
+                return str(lim)
+        except ValueError:
+            return None
+
+
+def outcome(parse, *args):
+    try:
+        return parse(*args)
+    except (IndexError, TypeError, OverflowError) as e:
+        return type(e)
+
+
+def random_amount(rand):
+    digits = "".join(rand.choice("0123456789,._eE+- ") for _ in range(rand.randint(0, 8)))
+    return rand.choice(["", "-", "+"]) + digits + rand.choice(["", "inf", "nan", "e400"])
+
+
+def test_only_infinite_amounts_change():
+    rand = random.Random(18)
+    for amt in AMOUNTS + [random_amount(rand) for _ in range(50000)]:
+        old, new = old_parse_amt(amt), parse_amount(amt)
+        if old == float("inf"):
+            assert new is None, amt
+            continue
+        assert (new is None) == (old is None), amt
+        if new is not None:
+            # the same number, exact now
+            assert float(new) == old, amt
+            assert to_units(new) >= 0
+    assert all(old_parse_amt(amt) == float("inf") for amt in INFINITE)
+
+
+def transactions(pgsql):
+    return {row["id"]: (row["method"], row["valid"], row["invalid_reason"])
+            for row in pgsql.rows[pgsql.transaction.name].values()}
+
+
+def test_the_inscriptions_of_an_infinite_amount():
+    # an amt that is not a finite number >= 0 is left out, as "abc" or "nan"
+    # always were: a mint is invalid content and a send is an inscribe-remaining
+    pgsql, state = replay(deploy_and_mint() + [
+        event(3, "inscribe", "m", "a", "a", op="mint", id="1", amt="inf"),
+        event(4, "inscribe", "s", "a", "a", op="send", id="1", amt="inf", n="1"),
+        event(5, "inscribe", "t", "a", "a", op="send", id="1", amt="10", n="2"),
+        event(6, "transfer", "t", "a", "b", op="send", id="1", amt="10", n="2"),
+        event(7, "inscribe", "r", "a", "a", op="send", id="1", n="3"),
+    ])
+
+    assert transactions(pgsql) == {
+        1: ("inscribe-deploy", True, "invalid transaction"),
+        2: ("inscribe-mint", True, "invalid transaction"),
+        # before: invalid, "amount > limit"
+        3: ("inscribe-mint", False, "invalid mint content"),
+        # before: a valid inscribe-send of inf, pending
+        4: ("inscribe-remaining", False, "no pending send"),
+        5: ("inscribe-send", True, "invalid transaction"),
+        6: ("transfer", True, "transaction is not completed, wait for remaining inscription to complete"),
+        # before: invalid, "insufficient available balance", the inf pending made
+        # the pending sends invalid and the transfer of t was not credited
+        7: ("inscribe-remaining", True, "invalid transaction"),
+    }
+    # before: {"a": 100, "b": 0}
+    assert balances(state) == {"a": 90, "b": 10}
+
+
+def test_the_same_inscriptions_of_a_finite_amount_keep_their_outcome():
+    # nan and negative amounts never were amounts, these outcomes are those of before
+    pgsql, state = replay(deploy_and_mint() + [
+        event(3, "inscribe", "m", "a", "a", op="mint", id="1", amt="nan"),
+        event(4, "inscribe", "s", "a", "a", op="send", id="1", amt="-1", n="1"),
+        event(5, "inscribe", "t", "a", "a", op="send", id="1", amt="1e2", n="2"),
+        event(6, "inscribe", "r", "a", "a", op="send", id="1", n="3"),
+    ])
+
+    assert transactions(pgsql)[3] == ("inscribe-mint", False, "invalid mint content")
+    assert transactions(pgsql)[4] == ("inscribe-remaining", False, "no pending send")
+    assert transactions(pgsql)[6] == ("inscribe-remaining", True, "invalid transaction")
+    assert balances(state) == {"a": 100}
+
+
+def test_decimal_max_and_lim_are_exact():
+    content = {"max": "123456789012345678.5", "lim": "1,234,567,890,123,456.75", "dec": 18}
+    max = parse_deploy_max(content, 18)
+    lim = parse_deploy_lim(content, max, 18)
+
+    assert (max, lim) == ("123456789012345678.5", "1234567890123456.75")
+    assert to_units(max) == 123456789012345678500000000000000000
+    assert to_units(lim) == 1234567890123456750000000000000000
+    # before: "1.2345678901234568e+17" and "1234567890123456.8"
+    assert to_units(old_parse_deploy_max(content, 18)) == 123456789012345680000000000000000000
+
+
+def test_max_and_lim_accept_what_they_accepted():
+    rand = random.Random(18)
+    for value in AMOUNTS + [random_amount(rand) for _ in range(50000)]:
+        for dec in [0, 2, 18]:
+            content = {"max": value, "lim": value}
+            old, new = outcome(old_parse_deploy_max, content, dec), outcome(parse_deploy_max, content, dec)
+            if old == "inf":
+                # an infinite max is left out as an infinite amt is
+                assert new is None, value
+                continue
+            assert (new is None) == (old is None) and type(new) is type(old), value
+            if isinstance(new, str):
+                assert float(new) == float(old), value
+                assert to_units(new) >= 0
+
+            for max in ["1000", "1000.5", "1.e3", old]:
+                new_max = max if max != old else new
+                if not isinstance(new_max, str):
+                    continue
+                old_lim = outcome(old_parse_deploy_lim, content, max, dec)
+                new_lim = outcome(parse_deploy_lim, content, new_max, dec)
+                if old_lim is IndexError and new_lim is not IndexError and new_max.isdigit():
+                    # an int lim raised when max was a float, it compares with the exact max now
+                    assert new_lim is None or int(new_lim) <= int(new_max), value
+                    continue
+                assert (new_lim is None) == (old_lim is None) and type(new_lim) is type(old_lim), value
+                if isinstance(new_lim, str):
+                    assert float(new_lim) == float(old_lim), value
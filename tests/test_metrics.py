@@ -0,0 +1,29 @@
+import os
+import sys
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.metrics import Metrics, operation_label, processor_label  # noqa
+from src.dbs.unit_of_work import Record  # noqa
+
+
+def test_ops_outside_the_protocol_share_one_label():
+    assert [operation_label({"op": op}) for op in ["MINT", "send", "Upgrade"]] == ["mint", "send", "upgrade"]
+    assert {operation_label({"op": op}) for op in ["mint2", "drop table", "", None, 1]} == {"other"}
+    assert operation_label({}) == "other"
+
+
+def test_made_up_ops_add_no_series():
+    metrics = Metrics()
+    for i in range(1000):
+        metrics.events.inc("inscribe", operation_label({"op": f"op{i}"}))
+    assert metrics.events.values == {("inscribe", "other"): 1000}
+
+
+def test_trace_processors_use_the_bucketed_op():
+    metrics = Metrics()
+    event = Record(event="inscribe")
+    for op in ["send", "Send", "sendd", "x" * 100]:
+        metrics.event_queries.observe(1, processor_label(event, {"op": op}))
+    assert list(metrics.event_queries.values) == [("inscribe-send",), ("inscribe-other",)]
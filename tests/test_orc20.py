@@ -0,0 +1,105 @@
+import os
+import re
+import sys
+import random
+import simplejson as json
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.utils.orc20 import is_orc20, is_standardize_orc20, may_be_orc20, split_objects  # noqa
+
+
+# is_orc20 before the prefilter, the reference
+
+def old_is_orc20(content_str):
+    content = is_standardize_orc20(content_str)
+    if content is not None:
+        return content
+
+    matches = re.findall(r'\{.*?\}', content_str, re.DOTALL)
+    if len(matches) < 2:
+        return None
+    for match in matches:
+        content = is_standardize_orc20(match)
+        if content is not None:
+            return content
+
+
+OBJECTS = [
+    '{"p":"orc-20","op":"mint","tick":"ordi","amt":"1"}',
+    '{"p": "ORC20", "op": "send", "n": "1",}',
+    '{"p":"Orc-20","op":"deploy","tick":"a","max":"21000000"}',
+    '{"p":"brc-20","op":"mint","tick":"ordi","amt":"1"}',
+    '{"p":"orc-21","op":"mint"}',
+    '{"p":"orc","op":"mint"}',
+    '{"p":"orc20x","op":"mint"}',
+    '{"p":1,"op":"mint"}',
+    '{"p":null,"op":"mint"}',
+    '{"p":"orc-20"}',
+    '{"op":"mint","tick":"orc"}',
+    '{"P":"orc-20","op":"mint"}',
+    '{"p":"orc-20","OP":"mint"}',
+    '{"p":"orc-20","op":"mint","meta":{"a":1}}',
+    '{"p":"orc-20","op":{"x":"y"}}',
+    '{"meta":{"p":"orc-20","op":"mint"}}',
+    '{"p":"orc-20","op":"mint","msg":"a } b"}',
+    '{"p":"orc-20","op":"mint","msg":"a { b"}',
+    '{"p":"\\u006frc-20","op":"mint"}',
+    '{"\\u0070":"orc-20","op":"mint"}',
+    '{"p":"orc-20","\\u006fp":"mint"}',
+    '{"p":"orc-20","op":"mint"',
+    '["p","orc-20","op"]',
+    '{}',
+    '{"p":"orc-20" "op":"mint"}',
+]
+NOISE = ["", " ", "\n", "{", "}", "}{", ",", "text", "orc-20", '"p"', '"op"', "\\", "{{", "}}", "[", "]", "\t\n "]
+
+
+def random_content(rand):
+    parts = []
+    for _ in range(rand.randint(0, 4)):
+        parts.append(rand.choice(OBJECTS) if rand.random() < 0.6 else rand.choice(NOISE))
+    content_str = "".join(parts)
+    if content_str and rand.random() < 0.2:
+        # a cut or a brace moved somewhere inside
+        i = rand.randrange(len(content_str))
+        content_str = content_str[:i] + rand.choice(["", "{", "}", " "]) + content_str[i + 1:]
+    return content_str
+
+
+def test_is_orc20_matches_the_old_one():
+    rand = random.Random(14)
+    for _ in range(50000):
+        content_str = random_content(rand)
+        assert json.dumps(is_orc20(content_str)) == json.dumps(old_is_orc20(content_str)), content_str
+
+
+def test_edge_cases_match_the_old_one():
+    contents = OBJECTS + [
+        '{"p":"orc-20","op":"mint"}{"p":"orc-20","op":"send"}',
+        'x{"p":"orc-20","op":"mint"}',
+        '{"p":"orc-20","op":"mint"}}',
+        '{{"p":"orc-20","op":"mint"}',
+        '{"p":"brc-20","op":"mint"} {"p":"orc-20","op":"send"}',
+        '{"a":{"p":"orc-20","op":"mint"}}',
+        '}{"p":"orc-20","op":"mint"}{',
+        '{"p":"orc-20","op":"mint"}\n\n{}',
+    ]
+    for content_str in contents:
+        assert json.dumps(is_orc20(content_str)) == json.dumps(old_is_orc20(content_str)), content_str
+
+
+def test_split_objects_is_the_regex():
+    rand = random.Random(15)
+    for _ in range(20000):
+        content_str = "".join(rand.choice(["{", "}", "a", "\n", '"']) for _ in range(rand.randint(0, 12)))
+        assert split_objects(content_str) == re.findall(r'\{.*?\}', content_str, re.DOTALL)
+
+
+def test_prefilter_only_rejects_what_the_old_one_rejects():
+    rand = random.Random(16)
+    for _ in range(50000):
+        content_str = random_content(rand)
+        if not may_be_orc20(content_str):
+            assert old_is_orc20(content_str) is None, content_str
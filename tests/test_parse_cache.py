@@ -0,0 +1,93 @@
+import os
+import sys
+import random
+import pytest
+import simplejson as json
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.utils.orc20 import is_orc20  # noqa
+from src.parsers.parse_cache import ParseCache, FrozenContent  # noqa
+from src.parsers.operation_parser import (parse_upgrade_tick, parse_mint_content,
+                                          parse_send_content, parse_cancel_content,
+                                          parse_deploy_content, parse_upgrade_content)  # noqa
+
+OPS = ["deploy", "mint", "send", "cancel", "upgrade", "transfer", "other"]
+VALUES = ["", "0", "1", "-1", "18", "1.5", "0.000000000000000001", "1,000", "abc", "ordi",
+          "ORDI", "21000000", "[1, 2]", "[", 0, 1, 1.5, None, True, [1], {"a": 1}]
+KEYS = ["tick", "id", "name", "v", "msg", "ug", "wp", "dec", "max", "lim", "amt", "n"]
+
+
+def random_content_str(rand):
+    content = {"p": "orc-20", "op": rand.choice(OPS)}
+    for key in rand.sample(KEYS, rand.randint(0, len(KEYS))):
+        content[key] = rand.choice(VALUES)
+    return json.dumps(content)
+
+
+def outcome(parse, *args):
+    try:
+        payload, reason = parse(*args)
+    except Exception as e:
+        return type(e), str(e)
+    return (dict(payload) if payload is not None else None), list(payload or []), reason
+
+
+def decisions(content, block_height=788836, inscription_number=10):
+    return [outcome(parse_upgrade_tick, content), outcome(parse_mint_content, content),
+            outcome(parse_send_content, content), outcome(parse_cancel_content, content),
+            outcome(parse_deploy_content, content, block_height, inscription_number),
+            outcome(parse_upgrade_content, content, 18)]
+
+
+def test_cached_contents_give_the_decisions_of_a_parse():
+    rand = random.Random(15)
+    cache = ParseCache(max_entries=50)
+    contents = [random_content_str(rand) for _ in range(200)]
+    frozen = 0
+    for _ in range(5000):
+        content_str = rand.choice(contents)
+        cached = cache.is_orc20(content_str)
+        uncached = is_orc20(content_str)
+        assert cached == uncached
+        frozen += type(cached) is FrozenContent
+        # twice, the second time from the payloads memoised on the content
+        assert decisions(cached) == decisions(uncached), content_str
+        assert decisions(cached) == decisions(uncached), content_str
+    assert frozen > 0
+
+
+def test_cached_contents_and_payloads_are_read_only():
+    cache = ParseCache()
+    content_str = '{"p":"orc-20","op":"mint","tick":"ordi","id":"1","amt":"10"}'
+    content = cache.is_orc20(content_str)
+    payload, _ = parse_mint_content(content)
+    assert type(content) is FrozenContent and type(payload) is FrozenContent
+
+    for shared in [content, payload]:
+        with pytest.raises(TypeError):
+            shared["amt"] = "1000"
+        with pytest.raises(TypeError):
+            del shared["tick"]
+        for change in [lambda d: d.update(amt="1000"), lambda d: d.pop("tick"), lambda d: d.popitem(),
+                       lambda d: d.setdefault("x", 1), lambda d: d.clear()]:
+            with pytest.raises(TypeError):
+                change(shared)
+        with pytest.raises(TypeError):
+            shared |= {"amt": "1000"}
+
+    # a processor changes its own copy, the next event reads the cached values
+    changed = dict(payload, amt=1000)
+    assert changed["amt"] == 1000
+    assert cache.is_orc20(content_str) is content
+    assert parse_mint_content(content)[0]["amt"] == payload["amt"] != 1000
+
+
+def test_contents_holding_containers_are_not_shared():
+    cache = ParseCache()
+    content_str = '{"p":"orc-20","op":"cancel","tick":"ordi","id":"1","n":"[1, 2]","meta":{"a":1}}'
+    content = cache.is_orc20(content_str)
+    assert type(content) is dict
+    content["meta"]["a"] = 2
+    assert cache.is_orc20(content_str)["meta"] == {"a": 1}
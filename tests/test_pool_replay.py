@@ -0,0 +1,107 @@
+import os
+import sys
+import asyncio
+import simplejson as json
+from loguru import logger
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.dbs.memory_helper import MemoryPgsqlHelper  # noqa
+from src.dbs.state_store import StateStore  # noqa
+from src.dbs.unit_of_work import Record  # noqa
+from src.processors.inscribe_deploy_processor import handle_inscribe_deploy  # noqa
+from src.processors.inscribe_mint_processor import handle_inscribe_mint  # noqa
+from src.processors.inscribe_send_processor import handle_inscribe_send  # noqa
+from src.processors.inscribe_cancel_processor import handle_inscribe_cancel  # noqa
+from src.processors.transfer_send_processor import handle_transfer_send  # noqa
+
+HANDLERS = {("inscribe", "deploy"): handle_inscribe_deploy, ("inscribe", "mint"): handle_inscribe_mint,
+            ("inscribe", "send"): handle_inscribe_send, ("inscribe", "cancel"): handle_inscribe_cancel,
+            ("transfer", "send"): handle_transfer_send}
+
+
+def event(event_id, kind, inscription_id, sender, receiver, **content):
+    content = dict({"p": "orc-20", "tick": "ordi"}, **content)
+    return Record({"id": event_id, "block_height": 780000 + event_id, "inscription_id": inscription_id,
+                   "inscription_number": event_id, "event": kind, "from": sender, "to": receiver,
+                   "time": event_id, "content": json.dumps(content)})
+
+
+def replay(events):
+    # the events through the processors, as the indexer dispatches them
+    pgsql = MemoryPgsqlHelper(logger)
+    state = StateStore(pgsql.token, pgsql.balance, pgsql.pool)
+
+    async def run():
+        for item in events:
+            content = json.loads(item.content)
+            tasks = await HANDLERS[(item.event, content["op"])](pgsql, state, item, content)
+            assert False not in await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    return pgsql, state
+
+
+def deploy_and_mint():
+    return [
+        event(1, "inscribe", "d", "a", "a", op="deploy", id="1", max="1000", lim="1000"),
+        event(2, "inscribe", "m", "a", "a", op="mint", id="1", amt="100"),
+    ]
+
+
+def balances(state):
+    # in whole tokens, the token has 18 decimals
+    token_id = next(iter(state.tokens))
+    return {address: int(state.balances[f"{address}-{token_id}"].balance) // 10 ** 18
+            for address in "abc" if f"{address}-{token_id}" in state.balances}
+
+
+def pool_ids(state, address, kind):
+    token_id = next(iter(state.tokens))
+    return [(item.inscription_id, item.transaction_id) for item in state.get_pool(f"{address}-{token_id}", kind)]
+
+
+def test_a_pending_send_transferred_twice_is_sent_twice():
+    # as the pools of lists did: each transfer of the pending send is credited
+    # when the remaining is inscribed, the sender pays both
+    pgsql, state = replay(deploy_and_mint() + [
+        event(3, "inscribe", "s", "a", "a", op="send", id="1", amt="10", n="1"),
+        event(4, "transfer", "s", "a", "b", op="send", id="1", amt="10", n="1"),
+        event(5, "transfer", "s", "a", "c", op="send", id="1", amt="10", n="1"),
+        event(6, "inscribe", "r", "a", "a", op="send", id="1", n="2"),
+    ])
+
+    assert balances(state) == {"a": 80, "b": 10, "c": 10}
+    assert pool_ids(state, "a", "sent_send_pool") == []
+    assert pool_ids(state, "a", "available_send_pool") == [("r", 6)]
+    assert pool_ids(state, "b", "received_send_pool") == [("s", 4)]
+    assert pool_ids(state, "c", "received_send_pool") == [("s", 5)]
+    transactions = pgsql.rows[pgsql.transaction.name]
+    assert [transactions[i]["valid"] for i in [4, 5, 6]] == [True, True, True]
+
+
+def test_both_sends_of_an_inscription_are_kept_until_the_remaining():
+    _, state = replay(deploy_and_mint() + [
+        event(3, "inscribe", "s", "a", "a", op="send", id="1", amt="10", n="1"),
+        event(4, "transfer", "s", "a", "b", op="send", id="1", amt="10", n="1"),
+        event(5, "transfer", "s", "a", "c", op="send", id="1", amt="10", n="1"),
+    ])
+
+    assert pool_ids(state, "a", "sent_send_pool") == [("s", 4), ("s", 5)]
+    assert [item.seq for item in state.get_pool(next(iter(state.balances)), "sent_send_pool")] == [1, 2]
+    assert state.get_pool(next(iter(state.balances)), "sent_send_pool").get("s").transaction_id == 4
+
+
+def test_cancel_removes_the_sends_of_the_nonce():
+    _, state = replay(deploy_and_mint() + [
+        event(3, "inscribe", "s", "a", "a", op="send", id="1", amt="10", n="1"),
+        event(4, "transfer", "s", "a", "b", op="send", id="1", amt="10", n="1"),
+        event(5, "transfer", "s", "a", "c", op="send", id="1", amt="10", n="1"),
+        event(6, "inscribe", "x", "a", "a", op="cancel", id="1", n="[1]"),
+    ])
+
+    # the first item of the nonce in each pool, as list.remove did
+    assert pool_ids(state, "a", "pending_send_pool") == []
+    assert pool_ids(state, "a", "sent_send_pool") == [("s", 5)]
+    assert balances(state)["a"] == 100
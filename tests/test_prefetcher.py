@@ -0,0 +1,120 @@
+import os
+import sys
+import asyncio
+import pytest
+from loguru import logger
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.dbs.memory_helper import MemoryPgsqlHelper  # noqa
+from src.prefetcher import BlockPrefetcher  # noqa
+
+MINT = '{"p":"orc-20","op":"mint","tick":"ordi","id":"1","amt":"1"}'
+
+
+def events(heights, per_block=1, content=MINT):
+    rows = []
+    for block_height in heights:
+        for _ in range(per_block):
+            rows.append({"id": len(rows) + 1, "block_height": block_height, "inscription_id": f"i{len(rows)}",
+                         "event": "inscribe", "from": "a", "to": "b", "value": 0, "content": content})
+    return rows
+
+
+class RangeRecorder(MemoryPgsqlHelper):
+    # the ranges read by the prefetcher
+    def __init__(self, logger, events=None):
+        super().__init__(logger, events=events)
+        self.ranges = []
+
+    async def get_event_by_block_range(self, start_height, end_height):
+        self.ranges.append((start_height, end_height))
+        return await super().get_event_by_block_range(start_height, end_height)
+
+
+def prefetcher(pgsql, **kwargs):
+    return BlockPrefetcher(pgsql, logger, parse_workers=0, **kwargs)
+
+
+def test_range_doubles_while_blocks_are_small_up_to_max_range():
+    pgsql = RangeRecorder(logger, events(range(100, 140)))
+    blocks = prefetcher(pgsql, max_events=1000, max_range=8)
+
+    async def run():
+        blocks.reset(100)
+        blocks.extend(139)
+        return [(await blocks.get()).block_height for _ in range(40)]
+
+    assert asyncio.run(run()) == list(range(100, 140))
+    assert pgsql.ranges == [(100, 100), (101, 102), (103, 106), (107, 114), (115, 122),
+                            (123, 130), (131, 138), (139, 139)]
+
+
+def test_range_halves_when_blocks_are_big():
+    # a quarter of the queue is 2 events, ranges of 2 blocks of 1 event reach it
+    pgsql = RangeRecorder(logger, events(range(100, 110)))
+    blocks = prefetcher(pgsql, max_events=8)
+
+    async def run():
+        blocks.reset(100)
+        blocks.extend(109)
+        return [(await blocks.get()).block_height for _ in range(10)]
+
+    assert asyncio.run(run()) == list(range(100, 110))
+    assert pgsql.ranges == [(100, 100), (101, 102), (103, 103), (104, 105), (106, 106),
+                            (107, 108), (109, 109)]
+
+
+def test_queue_holds_at_most_max_events():
+    # a block of one orc20 event counts 2
+    pgsql = MemoryPgsqlHelper(logger, events=events(range(100, 120)))
+    blocks = prefetcher(pgsql, max_events=6)
+
+    async def run():
+        blocks.reset(100)
+        blocks.extend(119)
+        queued = []
+        for _ in range(20):
+            for _ in range(10):
+                await asyncio.sleep(0)
+            queued.append(blocks.queued_events)
+            await blocks.get()
+        return queued
+
+    queued = asyncio.run(run())
+    assert max(queued) == 6
+    assert all(events <= 6 for events in queued)
+
+
+def test_get_raises_once_every_block_is_read():
+    pgsql = MemoryPgsqlHelper(logger, events=events(range(100, 103), content="text"))
+    blocks = prefetcher(pgsql)
+
+    async def run():
+        blocks.reset(100)
+        blocks.extend(102)
+        read = [await blocks.get() for _ in range(3)]
+        with pytest.raises(RuntimeError, match="no block left"):
+            await blocks.get()
+        return read
+
+    read = asyncio.run(run())
+    assert [(block.block_height, block.events, block.event_count) for block in read] == \
+        [(100, [], 1), (101, [], 1), (102, [], 1)]
+
+
+def test_get_raises_the_error_of_the_fetch():
+    class Failing(MemoryPgsqlHelper):
+        async def get_event_by_block_range(self, start_height, end_height):
+            raise ValueError("connection lost")
+
+    blocks = prefetcher(Failing(logger))
+
+    async def run():
+        blocks.reset(100)
+        blocks.extend(100)
+        with pytest.raises(ValueError, match="connection lost"):
+            await blocks.get()
+
+    asyncio.run(run())
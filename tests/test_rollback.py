@@ -0,0 +1,141 @@
+import os
+import sys
+import copy
+import asyncio
+import simplejson as json
+from loguru import logger
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.dbs.memory_helper import MemoryPgsqlHelper  # noqa
+from src.dbs.state_store import StateStore  # noqa
+from src.dbs.undo_log import UndoLog, current_block_height  # noqa
+from src.dbs.unit_of_work import Record  # noqa
+from src.processors.inscribe_deploy_processor import handle_inscribe_deploy  # noqa
+from src.processors.inscribe_mint_processor import handle_inscribe_mint  # noqa
+from src.processors.inscribe_send_processor import handle_inscribe_send  # noqa
+from src.processors.inscribe_cancel_processor import handle_inscribe_cancel  # noqa
+from src.processors.transfer_mint_processor import handle_transfer_mint  # noqa
+from src.processors.transfer_send_processor import handle_transfer_send  # noqa
+
+HANDLERS = {("inscribe", "deploy"): handle_inscribe_deploy, ("inscribe", "mint"): handle_inscribe_mint,
+            ("inscribe", "send"): handle_inscribe_send, ("inscribe", "cancel"): handle_inscribe_cancel,
+            ("transfer", "mint"): handle_transfer_mint, ("transfer", "send"): handle_transfer_send}
+
+
+def event(event_id, block_height, kind, inscription_id, sender, receiver, **content):
+    content = dict({"p": "orc-20", "tick": "ordi", "id": "1"}, **content)
+    return Record({"id": event_id, "block_height": block_height, "inscription_id": inscription_id,
+                   "inscription_number": event_id, "event": kind, "from": sender, "to": receiver,
+                   "time": event_id, "content": json.dumps(content)})
+
+
+BLOCKS = {
+    100: [event(1, 100, "inscribe", "d", "a", "a", op="deploy", max="1000", lim="1000"),
+          event(2, 100, "inscribe", "m1", "a", "a", op="mint", amt="100")],
+    101: [event(3, 101, "inscribe", "m2", "b", "b", op="mint", amt="50"),
+          event(4, 101, "inscribe", "s1", "a", "a", op="send", amt="10", n="1")],
+    102: [event(5, 102, "transfer", "s1", "a", "b", op="send", amt="10", n="1"),
+          event(6, 102, "transfer", "s1", "a", "c", op="send", amt="10", n="1"),
+          event(7, 102, "transfer", "m2", "b", "c", op="mint", amt="50")],
+    103: [event(8, 103, "inscribe", "r1", "a", "a", op="send", n="2"),
+          event(9, 103, "inscribe", "s2", "b", "b", op="send", amt="5", n="3")],
+    104: [event(10, 104, "inscribe", "x", "b", "b", op="cancel", n="[3]"),
+          event(11, 104, "inscribe", "m3", "c", "c", op="mint", amt="7")],
+    105: [event(12, 105, "transfer", "r1", "a", "c", op="send", n="2")],
+}
+
+
+def new_indexer(undo_depth=100):
+    pgsql = MemoryPgsqlHelper(logger)
+    pgsql.undo_depth = undo_depth
+    state = StateStore(pgsql.token, pgsql.balance, pgsql.pool)
+    undo_log = UndoLog(undo_depth)
+    state.undo_log = pgsql.undo_log = undo_log
+    return pgsql, state, undo_log
+
+
+async def handle_blocks(pgsql, state, undo_log, heights, group_blocks=2):
+    # as the indexer: a unit of work per `group_blocks` blocks, each block records its undo
+    for i in range(0, len(heights), group_blocks):
+        unit_of_work = pgsql.begin_unit_of_work()
+        for block_height in heights[i:i + group_blocks]:
+            token = current_block_height.set(block_height)
+            try:
+                for item in BLOCKS[block_height]:
+                    content = json.loads(item.content)
+                    tasks = await HANDLERS[(item.event, content["op"])](pgsql, state, item, content)
+                    assert False not in await asyncio.gather(*tasks)
+            finally:
+                current_block_height.reset(token)
+            unit_of_work.add_block(block_height, BLOCKS[block_height][-1].id,
+                                   undo_log.finish_block(block_height, f"hash{block_height}"))
+        state.flush_into(unit_of_work)
+        pgsql.detach_unit_of_work()
+        assert await pgsql.commit_unit_of_work(unit_of_work) is True
+
+
+def tables(pgsql):
+    return {table.name: {key: dict(row) for key, row in pgsql.rows[table.name].items()}
+            for table in [pgsql.token, pgsql.balance, pgsql.pool, pgsql.transaction]}
+
+
+def state_rows(state):
+    return ({token_id: dict(row) for token_id, row in state.tokens.items()},
+            {balance_id: dict(row) for balance_id, row in state.balances.items()},
+            [dict(row) for row in state.pool_rows()])
+
+
+def replay_to(end_height):
+    pgsql, state, undo_log = new_indexer()
+    asyncio.run(handle_blocks(pgsql, state, undo_log, list(range(100, end_height + 1))))
+    return pgsql, state
+
+
+def test_rollback_gives_the_state_of_a_replay_to_the_fork():
+    for fork_height in range(101, 106):
+        expected_pgsql, expected_state = replay_to(fork_height - 1)
+        pgsql, state, undo_log = new_indexer()
+
+        async def run():
+            await handle_blocks(pgsql, state, undo_log, list(range(100, 106)))
+            assert await pgsql.rollback_blocks(fork_height) is True
+            assert undo_log.covers(fork_height, 105)
+            for undo in undo_log.pop_from(fork_height):
+                state.restore(undo)
+
+        asyncio.run(run())
+        assert tables(pgsql) == tables(expected_pgsql), fork_height
+        assert state_rows(state) == state_rows(expected_state), fork_height
+        assert pgsql.rows[pgsql.cursor.name][pgsql.cursor_id]["block_height"] == fork_height - 1
+        assert [key[1] for key in pgsql.rows[pgsql.undo.name]] == list(range(100, fork_height))
+
+
+def test_blocks_are_handled_again_after_a_rollback():
+    expected_pgsql, expected_state = replay_to(105)
+    pgsql, state, undo_log = new_indexer()
+
+    async def run():
+        await handle_blocks(pgsql, state, undo_log, list(range(100, 106)))
+        assert await pgsql.rollback_blocks(102) is True
+        for undo in undo_log.pop_from(102):
+            state.restore(undo)
+        await handle_blocks(pgsql, state, undo_log, list(range(102, 106)), group_blocks=3)
+
+    asyncio.run(run())
+    assert tables(pgsql) == tables(expected_pgsql)
+    assert state_rows(state) == state_rows(expected_state)
+
+
+def test_rollback_beyond_the_undo_depth_is_refused():
+    pgsql, state, undo_log = new_indexer(undo_depth=2)
+    asyncio.run(handle_blocks(pgsql, state, undo_log, list(range(100, 106))))
+    before = copy.deepcopy(tables(pgsql))
+
+    assert sorted(undo_log.blocks) == [104, 105]
+    assert [key[1] for key in pgsql.rows[pgsql.undo.name]] == [104, 105]
+    assert undo_log.covers(104, 105) and not undo_log.covers(103, 105)
+    assert asyncio.run(pgsql.rollback_blocks(103)) is False
+    assert tables(pgsql) == before
+    assert pgsql.rows[pgsql.cursor.name][pgsql.cursor_id]["block_height"] == 105
@@ -0,0 +1,54 @@
+import os
+import sys
+import asyncio
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.dbs.row_loader import RowLoader  # noqa
+from src.dbs.unit_of_work import Record  # noqa
+from src.tracer import EventTrace, current_trace, record_query  # noqa
+
+
+def test_coalesced_read_is_recorded_in_every_trace():
+    reads = []
+
+    async def read_rows(ids, block_heights):
+        reads.append(sorted(ids))
+        record_query("get_transactions_by_ids", 0.01)
+        return [Record(id=row_id) for row_id in ids if row_id != 3]
+
+    loader = RowLoader(read_rows)
+
+    async def handle(row_id):
+        trace = EventTrace(None, "inscribe-send")
+        current_trace.set(trace)
+        rows = await loader.load(row_id)
+        return trace, rows
+
+    async def run():
+        return await asyncio.gather(handle(1), handle(2), handle(3))
+
+    results = asyncio.run(run())
+    assert reads == [[1, 2, 3]]
+    assert [rows for _, rows in results] == [[{"id": 1}], [{"id": 2}], []]
+    for trace, _ in results:
+        assert trace.queries == 1
+        assert trace.calls == {"get_transactions_by_ids shared by 3": [1, 0.01]}
+
+
+def test_block_height_is_kept_only_when_every_requester_knows_it():
+    reads = []
+
+    async def read_rows(ids, block_heights):
+        reads.append(dict(zip(ids, block_heights)))
+        return [Record(id=row_id) for row_id in ids]
+
+    loader = RowLoader(read_rows)
+
+    async def run():
+        return await asyncio.gather(loader.load(1, 100), loader.load(1, 100),
+                                    loader.load(2, 100), loader.load(2))
+
+    asyncio.run(run())
+    assert reads == [{1: 100, 2: None}]
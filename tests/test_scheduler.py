@@ -0,0 +1,82 @@
+import os
+import sys
+import random
+import asyncio
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.scheduler import TokenScheduler, resolve_token_key  # noqa
+
+
+def event_list(ticks):
+    return [({"id": event_id}, {"op": "mint", "tick": tick} if tick is not None else {"op": "mint"})
+            for event_id, tick in enumerate(ticks, 1)]
+
+
+def run_events(events, concurrent=True, fail_on=None, seed=0):
+    # each handler yields to the loop a random number of times, as a round trip would
+    rand = random.Random(seed)
+    started, finished = [], []
+
+    async def handle_event(event, content):
+        started.append(event["id"])
+        for _ in range(rand.randint(0, 3)):
+            await asyncio.sleep(0)
+        finished.append((resolve_token_key(content), event["id"]))
+        return event["id"] != fail_on
+
+    result = asyncio.run(TokenScheduler(handle_event, concurrent).run(events))
+    return result, started, finished
+
+
+def by_token(finished):
+    order = {}
+    for key, event_id in finished:
+        order.setdefault(key, []).append(event_id)
+    return order
+
+
+def test_events_of_a_token_run_in_event_order():
+    rand = random.Random(7)
+    ticks = [rand.choice(["ordi", "ORDI", "pepe", "sats", None]) for _ in range(200)]
+    events = event_list(ticks)
+    for seed in range(20):
+        result, _, finished = run_events(events, seed=seed)
+        assert result is True
+        expected = by_token([(resolve_token_key(content), event["id"]) for event, content in events])
+        assert by_token(finished) == expected
+        # tick case is ignored, ORDI and ordi are one token
+        assert set(expected) == {"ordi", "pepe", "sats", None}
+
+
+def test_events_of_different_tokens_overlap():
+    # the event of ordi only finishes once the event of pepe started
+    async def run():
+        pepe_started = asyncio.Event()
+
+        async def handle_event(event, content):
+            if content["tick"] == "pepe":
+                pepe_started.set()
+            else:
+                await asyncio.wait_for(pepe_started.wait(), 1)
+            return True
+
+        return await TokenScheduler(handle_event).run(event_list(["ordi", "pepe"]))
+
+    assert asyncio.run(run()) is True
+
+
+def test_serial_mode_runs_in_event_order():
+    events = event_list(["ordi", "pepe", None, "ordi", "sats"])
+    _, started, finished = run_events(events, concurrent=False)
+    assert started == [1, 2, 3, 4, 5]
+    assert [event_id for _, event_id in finished] == [1, 2, 3, 4, 5]
+
+
+def test_a_failed_event_stops_its_token_only():
+    events = event_list(["ordi", "pepe", "ordi", "pepe", "ordi"])
+    result, started, _ = run_events(events, fail_on=3)
+    assert result is False
+    assert 5 not in started
+    assert {2, 4} <= set(started)
@@ -0,0 +1,87 @@
+import os
+import sys
+import gzip
+import json
+import hashlib
+import pytest
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.snapshot import dump_snapshot, load_snapshot, snapshot_path  # noqa
+
+HEADER = {"db_version": "A", "block_height": 800010, "event_id": 42}
+TOKENS = [{"id": "orcx-1", "max": "21000000", "minted": "1000"}]
+BALANCES = [{"id": "orcx-1-bc1pholder", "balance": "1000"}, {"id": "orcx-1-bc1preceiver", "balance": "0"}]
+POOLS = [{"kind": "pending_send_pool", "token_id": "orcx-1", "seq": 0,
+          "transaction_id": "tx-1", "block_height": 800009}]
+TRANSACTIONS = [{"id": "tx-1", "block_height": 800009, "inscription_id": "i0"}]
+
+
+def dump(tmp_path):
+    path = snapshot_path(str(tmp_path), "A", HEADER["block_height"])
+    os.replace(dump_snapshot(path, HEADER, TOKENS, BALANCES, POOLS, TRANSACTIONS), path)
+    return path
+
+
+def read_lines(path):
+    with gzip.open(path, "rb") as f:
+        return f.readlines()
+
+
+def write_lines(path, lines):
+    with gzip.open(path, "wb") as f:
+        f.writelines(lines)
+
+
+def with_checksum(lines):
+    # the rows followed by a checksum that matches them
+    digest = hashlib.sha256()
+    for line in lines:
+        digest.update(line)
+    return lines + [json.dumps({"sha256": digest.hexdigest()}).encode() + b"\n"]
+
+
+def test_round_trip(tmp_path):
+    header, tokens, balances, pools, transactions = load_snapshot(dump(tmp_path))
+
+    assert {key: header[key] for key in HEADER} == HEADER
+    assert (tokens, balances, pools, transactions) == (TOKENS, BALANCES, POOLS, TRANSACTIONS)
+
+
+def test_a_truncated_snapshot_is_refused(tmp_path):
+    path = dump(tmp_path)
+    write_lines(path, read_lines(path)[:-1])
+
+    with pytest.raises(ValueError, match="truncated"):
+        load_snapshot(path)
+
+
+def test_a_changed_row_is_refused(tmp_path):
+    path = dump(tmp_path)
+    lines = read_lines(path)
+    lines[1] = lines[1].replace(b"21000000", b"42000000")
+    write_lines(path, lines)
+
+    with pytest.raises(ValueError, match="checksum mismatch"):
+        load_snapshot(path)
+
+
+def test_data_after_the_checksum_is_refused(tmp_path):
+    path = dump(tmp_path)
+    lines = read_lines(path)
+    write_lines(path, lines + [lines[1]])
+
+    with pytest.raises(ValueError, match="after the checksum"):
+        load_snapshot(path)
+
+
+def test_an_other_version_is_refused(tmp_path):
+    path = dump(tmp_path)
+    lines = read_lines(path)[:-1]
+    header = json.loads(lines[0])
+    lines[0] = json.dumps(dict(header, version=header["version"] + 1), separators=(",", ":")).encode() + b"\n"
+    write_lines(path, with_checksum(lines))
+
+    with pytest.raises(ValueError, match="version"):
+        load_snapshot(path)
@@ -0,0 +1,143 @@
+import os
+import sys
+import asyncio
+from loguru import logger
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.dbs.memory_helper import MemoryPgsqlHelper  # noqa
+from src.dbs.state_store import StateStore  # noqa
+from src.dbs.undo_log import UndoLog, current_block_height  # noqa
+from src.dbs.unit_of_work import Record, UnitOfWork  # noqa
+
+
+def new_store():
+    pgsql = MemoryPgsqlHelper(logger)
+    state = StateStore(pgsql.token, pgsql.balance, pgsql.pool)
+    state.undo_log = UndoLog()
+    return pgsql, state
+
+
+def token(token_id, minted=0):
+    return {"id": token_id, "tick": "ordi", "tick_id": token_id, "inscription_number": 1,
+            "max": 21000000, "lim": 1000, "dec": 18, "minted": minted}
+
+
+def balance(balance_id, amount=0):
+    return {"id": balance_id, "address": "bc1q", "tick": "ordi", "tick_id": "t1",
+            "balance": amount, "available_balance": amount}
+
+
+def pool_item(inscription_id, nonce):
+    return {"inscription_id": inscription_id, "transaction_id": 1, "nonce": nonce, "amt": 1}
+
+
+def in_block(block_height, handle):
+    # run `handle` as an event of the block, so its first reads are recorded
+    token = current_block_height.set(block_height)
+    try:
+        handle()
+    finally:
+        current_block_height.reset(token)
+
+
+def pool_ids(state, balance_id, kind):
+    return [item.inscription_id for item in state.get_pool(balance_id, kind)]
+
+
+def test_save_then_update_is_one_insert():
+    pgsql, state = new_store()
+
+    async def run():
+        state.save_token(token("t1"))
+        state.update_token("t1", {"minted": 5})
+        state.update_token("t1", {"minted": 7})
+        unit_of_work = UnitOfWork(pgsql.token, pgsql.balance, pgsql.transaction, pgsql.pool)
+        state.flush_into(unit_of_work)
+        return unit_of_work
+
+    unit_of_work = asyncio.run(run())
+    assert [row.minted for row in unit_of_work.token.new_rows()] == [7]
+    assert unit_of_work.token.changed_rows() == {}
+    assert state.dirty_count() == 0
+
+
+def test_update_of_flushed_row_is_one_upsert():
+    pgsql, state = new_store()
+
+    async def run():
+        state.save_token(token("t1"))
+        state.flush_into(UnitOfWork(pgsql.token, pgsql.balance, pgsql.transaction, pgsql.pool))
+        state.update_token("t1", {"minted": 5})
+        state.update_token("t1", {"minted": 7, "end_number": 3})
+        unit_of_work = UnitOfWork(pgsql.token, pgsql.balance, pgsql.transaction, pgsql.pool)
+        state.flush_into(unit_of_work)
+        return unit_of_work
+
+    unit_of_work = asyncio.run(run())
+    assert unit_of_work.token.new_rows() == []
+    groups = unit_of_work.token.changed_rows()
+    assert list(groups) == [frozenset(["minted", "end_number"])]
+    assert [row.minted for row in groups[frozenset(["minted", "end_number"])]] == [7]
+
+
+def test_restore_removes_rows_created_in_the_block():
+    _, state = new_store()
+    state.save_token(token("t0"))
+    state.save_balance(balance("b1", 10))
+
+    def handle():
+        state.save_token(token("t1"))
+        state.save_balance(balance("b2", 3))
+        state.update_balance("b1", {"balance": 7})
+        state.add_to_pool("b1", "pending_send_pool", pool_item("i1", "n1"))
+
+    in_block(100, handle)
+    undo = state.undo_log.finish_block(100, "hash")
+    state.restore(undo)
+
+    assert "t1" not in state.tokens
+    assert state.token_by_inscription_number[(1, "ordi")] == "t0"
+    assert "b2" not in state.balances
+    assert state.balances["b1"].balance == 10
+    assert pool_ids(state, "b1", "pending_send_pool") == []
+    assert state.get_pool("b1", "pending_send_pool").first_by_nonce("n1") is None
+
+
+def test_restore_keeps_the_pool_order():
+    _, state = new_store()
+    state.save_balance(balance("b1"))
+    for inscription_id in ["i1", "i2", "i3"]:
+        state.add_to_pool("b1", "available_send_pool", pool_item(inscription_id, inscription_id))
+
+    def handle():
+        pool = state.get_pool("b1", "available_send_pool")
+        state.remove_from_pool("b1", "available_send_pool", pool.get("i2"))
+        state.remove_from_pool("b1", "available_send_pool", pool.get("i1"))
+        state.add_to_pool("b1", "available_send_pool", pool_item("i4", "i4"))
+        state.add_to_pool("b1", "available_send_pool", pool_item("i1", "i1"))
+
+    in_block(100, handle)
+    assert pool_ids(state, "b1", "available_send_pool") == ["i3", "i4", "i1"]
+
+    state.restore(state.undo_log.finish_block(100, "hash"))
+    pool = state.get_pool("b1", "available_send_pool")
+    assert pool_ids(state, "b1", "available_send_pool") == ["i1", "i2", "i3"]
+    assert [item.seq for item in pool] == [1, 2, 3]
+    assert pool.first_by_nonce("i2").inscription_id == "i2"
+    assert pool.next_seq() == 4
+
+
+def test_load_keeps_the_items_in_seq_order():
+    pgsql, state = new_store()
+    pgsql.insert_row(pgsql.balance, balance("b1"))
+    for seq, inscription_id in [(3, "a"), (1, "c"), (2, "b")]:
+        pgsql.insert_pool_row(dict(pool_item(inscription_id, "n"), balance_id="b1",
+                                   kind="received_send_pool", seq=seq))
+
+    assert asyncio.run(state.load(pgsql)) is True
+    pool = state.get_pool("b1", "received_send_pool")
+    assert pool_ids(state, "b1", "received_send_pool") == ["c", "b", "a"]
+    assert pool.first_by_nonce("n").inscription_id == "c"
+    assert isinstance(pool.get("a"), Record)
@@ -0,0 +1,46 @@
+import os
+import sys
+import asyncio
+import aiopg
+import sqlalchemy as sa
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.dbs.statement_cache import StatementCache, CachedStatement  # noqa
+
+
+TABLE = sa.Table("token_A", sa.MetaData(), sa.Column("id", sa.String(255), primary_key=True))
+
+
+def token_by_id(token_id):
+    return CachedStatement(("get_token_by_id",), lambda: TABLE.select().where(
+        TABLE.c.id == sa.bindparam("id")), {"id": token_id})
+
+
+class Connection:
+    # records what is handed to the public `execute` of aiopg
+    def __init__(self):
+        self.executed = []
+
+    async def execute(self, query, *multiparams):
+        self.executed.append((query, multiparams))
+        return "result"
+
+
+def test_supported_versions_enable_the_cache():
+    assert StatementCache().enabled is True
+
+
+def test_other_versions_execute_through_aiopg(monkeypatch):
+    monkeypatch.setattr(aiopg, "__version__", "1.5.0")
+    cache = StatementCache()
+    assert cache.enabled is False
+    assert cache.unsupported == {"aiopg": "1.5.0"}
+
+    conn = Connection()
+    assert asyncio.run(cache.execute(conn, token_by_id("t1"))) == "result"
+    query, multiparams = conn.executed[0]
+    assert multiparams == ({"id": "t1"},)
+    assert str(query) == str(token_by_id("t1").build())
+    assert cache.stats()["entries"] == 0
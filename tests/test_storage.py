@@ -0,0 +1,146 @@
+import os
+import sys
+import asyncio
+import sqlite3
+import pytest
+from loguru import logger
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.dbs.storage import Storage  # noqa
+from src.dbs.pgsql_helper import PgsqlHelper  # noqa
+from src.dbs.memory_helper import MemoryPgsqlHelper  # noqa
+from src.dbs.sqlite_helper import SqlitePgsqlHelper, decode_key  # noqa
+from src.dbs.state_store import StateStore  # noqa
+from src.dbs.undo_log import BlockUndo, UndoLog  # noqa
+from src.dbs.unit_of_work import Record  # noqa
+from tests.test_rollback import new_indexer, handle_blocks  # noqa
+
+
+def test_a_backend_missing_an_operation_can_not_be_created():
+    class Partial(Storage):
+        async def init(self):
+            return True
+
+    with pytest.raises(TypeError, match="rollback_blocks"):
+        Partial()
+
+
+def test_commit_without_blocks_keeps_the_undo_rows():
+    pgsql = MemoryPgsqlHelper(logger)
+
+    async def run():
+        pgsql.begin_unit_of_work()
+        pgsql.unit_of_work.add_block(100, undo=BlockUndo(100, "hash"))
+        assert await pgsql.commit_unit_of_work() is True
+        # a unit of work of no block, end_height is None
+        pgsql.begin_unit_of_work()
+        return await pgsql.commit_unit_of_work()
+
+    assert asyncio.run(run()) is True
+    assert list(pgsql.rows[pgsql.undo.name]) == [(pgsql.cursor_id, 100)]
+
+
+class Engine:
+    # answers the query of the columns with `columns`
+    def __init__(self, columns):
+        self.columns = columns
+
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query):
+        self.names = query.compile().params["names"]
+        return self
+
+    async def fetchall(self):
+        return [Record(table_name=table_name, column_name=column_name, data_type=data_type)
+                for table_name, column_name, data_type in self.columns]
+
+
+def test_string_amount_columns_refuse_to_start():
+    errors = []
+    pgsql = PgsqlHelper(logger)
+    pgsql.logger = Record(error=errors.append)
+    numeric = [("token_A", "max", "numeric"), ("token_A", "tick", "character varying"),
+               ("pool_A", "amt", "numeric"), ("transaction_A", "quantity", "numeric")]
+
+    pgsql.engine = Engine(numeric + [("balance_A", "balance", "numeric")])
+    assert asyncio.run(pgsql.check_amount_columns()) is True
+    assert pgsql.engine.names == ["balance_A", "pool_A", "token_A", "transaction_A"]
+    assert errors == []
+
+    # a balance table of the string amounts
+    pgsql.engine = Engine(numeric + [("balance_A", "balance", "character varying")])
+    assert asyncio.run(pgsql.check_amount_columns()) is False
+    assert errors == ["column balance of balance_A is character varying, "
+                      "amounts are stored as NUMERIC units, rebuild with -c"]
+
+
+def sqlite_indexer(path, undo_depth):
+    pgsql = SqlitePgsqlHelper(logger, path=path)
+    pgsql.undo_depth = undo_depth
+    state = StateStore(pgsql.token, pgsql.balance, pgsql.pool)
+    state.undo_log = pgsql.undo_log = UndoLog(undo_depth)
+    return pgsql, state, pgsql.undo_log
+
+
+def all_tables(pgsql):
+    return {table.name: {key: dict(row) for key, row in pgsql.rows[table.name].items()}
+            for table in pgsql.bulk_tables()}
+
+
+def file_keys(path, table_name):
+    conn = sqlite3.connect(path)
+    try:
+        return {decode_key(key) for key, in conn.execute(f'SELECT key FROM "{table_name}"')}
+    finally:
+        conn.close()
+
+
+def test_sqlite_backend_keeps_the_tables_of_a_memory_replay(tmp_path):
+    path = str(tmp_path / "orc20.sqlite")
+    heights = list(range(100, 106))
+    expected, state, undo_log = new_indexer(undo_depth=3)
+    asyncio.run(handle_blocks(expected, state, undo_log, heights))
+
+    async def replay():
+        pgsql, state, undo_log = sqlite_indexer(path, 3)
+        await pgsql.init()
+        await handle_blocks(pgsql, state, undo_log, heights)
+        await pgsql.close()
+
+    async def reopen(fork_height=None):
+        pgsql = SqlitePgsqlHelper(logger, path=path)
+        await pgsql.init()
+        if fork_height is not None:
+            assert await pgsql.rollback_blocks(fork_height) is True
+        await pgsql.close()
+        await pgsql.init()
+        return pgsql
+
+    asyncio.run(replay())
+    pgsql = asyncio.run(reopen())
+    assert all_tables(pgsql) == all_tables(expected)
+    assert all(isinstance(key, tuple) for key in pgsql.rows[pgsql.pool.name])
+    # the undo rows of the blocks older than the undo depth were pruned from the file
+    assert file_keys(path, pgsql.undo.name) == {(pgsql.cursor_id, height) for height in [103, 104, 105]}
+    asyncio.run(pgsql.close())
+
+    transactions = file_keys(path, pgsql.transaction.name)
+    assert asyncio.run(expected.rollback_blocks(104)) is True
+    pgsql = asyncio.run(reopen(104))
+    assert all_tables(pgsql) == all_tables(expected)
+    assert file_keys(path, pgsql.undo.name) == {(pgsql.cursor_id, 103)}
+    assert file_keys(path, pgsql.pool.name) == set(expected.rows[expected.pool.name])
+    # the transactions inserted by the rolled back blocks are gone from the file
+    assert file_keys(path, pgsql.transaction.name) == set(expected.rows[expected.transaction.name])
+    assert file_keys(path, pgsql.transaction.name) < transactions
+    asyncio.run(pgsql.close())
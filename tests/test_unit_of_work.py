@@ -0,0 +1,130 @@
+import os
+import sys
+import asyncio
+from loguru import logger
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.dbs.memory_helper import MemoryPgsqlHelper  # noqa
+from src.dbs.pgsql_helper import PgsqlHelper  # noqa
+from src.dbs.row_loader import RowLoader  # noqa
+from src.dbs.unit_of_work import Record, TableBuffer  # noqa
+
+
+def transaction(transaction_id, **values):
+    return dict({"id": transaction_id, "inscription_id": "i1", "block_height": 100,
+                 "method": "inscribe-send", "valid": False}, **values)
+
+
+def test_save_then_update_of_a_row_known_absent_is_one_insert():
+    pgsql = MemoryPgsqlHelper(logger)
+    buffer = TableBuffer(pgsql.transaction)
+    assert buffer.load(1, None) is None
+
+    buffer.save(transaction(1))
+    buffer.update(1, {"valid": True})
+    buffer.update(1, {"invalid_reason": "ok"})
+
+    assert [(row.id, row.valid, row.invalid_reason) for row in buffer.new_rows()] == [(1, True, "ok")]
+    assert buffer.changed_rows() == {}
+    assert len(buffer) == 1
+
+
+def test_update_of_a_pending_row_is_seen_before_the_db_is_read():
+    pgsql = MemoryPgsqlHelper(logger)
+    buffer = TableBuffer(pgsql.transaction)
+    buffer.save(transaction(1))
+    buffer.update(1, {"valid": True})
+
+    found, row = buffer.peek(1)
+    assert found and row.valid is True
+    # the db has no row, the pending insert carries the update
+    row = buffer.load(1, None)
+    assert row.valid is True
+    assert [row.valid for row in buffer.new_rows()] == [True]
+    assert buffer.blind == {}
+
+
+def test_rows_are_keyed_by_plain_str():
+    pgsql = MemoryPgsqlHelper(logger)
+    buffer = TableBuffer(pgsql.transaction)
+    buffer.save(transaction(1))
+    row = buffer.peek(1)[1]
+    assert all(type(key) is str for key in row)
+
+
+def test_commit_writes_the_collapsed_row():
+    pgsql = MemoryPgsqlHelper(logger)
+
+    async def run():
+        pgsql.begin_unit_of_work()
+        await pgsql.save_transaction_info(transaction(1))
+        await pgsql.update_transaction_info(1, {"valid": True})
+        assert await pgsql.commit_unit_of_work() is True
+        return await pgsql.get_transaction_by_id(1)
+
+    rows = asyncio.run(run())
+    assert isinstance(rows[0], Record)
+    assert rows[0].valid is True
+    assert list(pgsql.rows[pgsql.transaction.name]) == [1]
+
+
+class Connection:
+    # records the statements of the commits
+    def __init__(self):
+        self.statements = []
+
+    def acquire(self):
+        return self
+
+    def begin(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, *args):
+        self.statements.append(statement)
+
+
+def test_a_unit_of_work_is_read_while_its_partition_is_created():
+    pgsql = PgsqlHelper(logger)
+    pgsql.engine = Connection()
+    pgsql.statements.enabled = False
+    created = asyncio.Event()
+    loaded = []
+
+    async def ensure_transaction_partitions(block_heights):
+        await created.wait()
+        return True
+
+    async def get_transactions_by_ids(ids, block_heights=None):
+        # the row is not committed yet
+        loaded.extend(ids)
+        return []
+
+    pgsql.ensure_transaction_partitions = ensure_transaction_partitions
+    pgsql.transaction_loader = RowLoader(get_transactions_by_ids)
+
+    async def run():
+        pgsql.begin_unit_of_work()
+        await pgsql.save_transaction_info(transaction(1))
+        committing = asyncio.ensure_future(pgsql.commit_unit_of_work(pgsql.detach_unit_of_work()))
+
+        unit_of_work = pgsql.begin_unit_of_work()
+        assert [row.id for row in await pgsql.get_transaction_by_id(1)] == [1]
+        await pgsql.update_transaction_info(1, {"valid": True})
+        created.set()
+        assert await committing is True
+        return unit_of_work
+
+    unit_of_work = asyncio.run(run())
+    assert loaded == []
+    assert pgsql.committing_unit_of_work is None
+    found, row = unit_of_work.transaction.peek(1)
+    assert found and row.valid is True
+    assert [row.id for rows in unit_of_work.transaction.changed_rows().values() for row in rows] == [1]
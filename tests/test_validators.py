@@ -0,0 +1,155 @@
+import os
+import sys
+import random
+
+src_path = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(src_path)
+
+from src.parsers.field_parser import *  # noqa
+from src.parsers.validators import (validate_deploy, validate_mint, validate_send,
+                                    validate_cancel, validate_upgrade_tick,
+                                    validate_upgrade)  # noqa
+
+
+# the parsers of operation_parser.py before the validators, the reference
+
+def old_upgrade_tick(content):
+    tick_content = {
+        "tick": parse_tick(content),
+        "tick_id": parse_id_except_deploy(content),
+    }
+    for key, value in tick_content.items():
+        if value is None:
+            return None, f"{key} is invalid"
+    return tick_content, None
+
+
+def old_upgrade(content, dec):
+    upgrade_content = {"dec": dec}
+    for key, value in content.items():
+        if key == "dec":
+            upgrade_content[key] = parse_deploy_dec(content)
+            continue
+        if key == "v":
+            upgrade_content[key] = parse_v(content)
+            continue
+        if key == "msg":
+            upgrade_content[key] = parse_msg(content)
+            continue
+        if key == "ug":
+            upgrade_content[key] = parse_deploy_ug(content)
+            continue
+    for key, value in upgrade_content.items():
+        if value is None:
+            return None, f"{key} is invalid"
+    return upgrade_content, None
+
+
+def old_deploy(content, content_block_height, inscription_number):
+    deploy_content = {
+        "tick": parse_tick(content),
+        "name": parse_deploy_name(content),
+        "v": parse_v(content),
+        "msg": parse_msg(content),
+        "ug": parse_deploy_ug(content),
+        "wp": parse_deploy_wp(content),
+        "tick_id": parse_deploy_id(content, content_block_height, inscription_number),
+        "dec": parse_deploy_dec(content),
+    }
+    deploy_content["max"] = parse_deploy_max(content, deploy_content["dec"])
+    deploy_content["lim"] = parse_deploy_lim(
+        content, deploy_content["max"], deploy_content["dec"])
+    for key, value in deploy_content.items():
+        if value is None:
+            return None, f"{key} is invalid"
+    return deploy_content, None
+
+
+def old_mint(content):
+    mint_content = {
+        "tick": parse_tick(content),
+        "tick_id": parse_id_except_deploy(content),
+        "amt": parse_amt(content),
+        "msg": parse_msg(content),
+    }
+    for key, value in mint_content.items():
+        if value is None:
+            return None, f"{key} is invalid"
+    return mint_content, None
+
+
+def old_send(content):
+    send_content = {
+        "tick": parse_tick(content),
+        "tick_id": parse_id_except_deploy(content),
+        "msg": parse_msg(content),
+        "n": parse_nonce(content),
+    }
+    amt = parse_amt(content)
+    if amt is not None:
+        send_content["amt"] = amt
+    for key, value in send_content.items():
+        if value is None:
+            return None, f"{key} is invalid"
+    return send_content, None
+
+
+def old_cancel(content):
+    cancel_content = {
+        "tick": parse_tick(content),
+        "tick_id": parse_id_except_deploy(content),
+        "msg": parse_msg(content),
+        "n": parse_cancel_nonce(content),
+    }
+    for key, value in cancel_content.items():
+        if value is None:
+            return None, f"{key} is invalid"
+    return cancel_content, None
+
+
+KEYS = ["p", "op", "tick", "id", "name", "v", "msg", "ug", "wp", "dec", "max", "lim",
+        "amt", "n"]
+VALUES = ["", "0", "1", "-1", "18", "19", "1.5", "0.000000000000000001", "1,000", "1e3",
+          "abc", "ORDI", "true", "false", "nan", "inf", "[1, 2]", "[", "[-1]", "1.", ".5",
+          "21000000", "1000.12345", 0, 1, -1, 18, 1.5, None, [1], {"a": 1}, True]
+
+
+def random_content(rand):
+    keys = rand.sample(KEYS, rand.randint(0, len(KEYS)))
+    return {key: rand.choice(VALUES) for key in keys}
+
+
+def outcome(parse, *args):
+    # the result with the payload keys in order, or the exception raised
+    try:
+        payload, reason = parse(*args)
+    except Exception as e:
+        return type(e), str(e)
+    return payload, list(payload or []), reason
+
+
+def test_validators_match_the_old_parsers():
+    rand = random.Random(20)
+    for _ in range(20000):
+        content = random_content(rand)
+        for old, new in [(old_upgrade_tick, validate_upgrade_tick), (old_mint, validate_mint),
+                         (old_send, validate_send), (old_cancel, validate_cancel)]:
+            assert outcome(new, content) == outcome(old, content), (old.__name__, content)
+
+        args = (rand.choice([788835, 788836]), rand.randint(0, 10 ** 6))
+        assert outcome(validate_deploy, content, *args) == outcome(old_deploy, content, *args), \
+            content
+        dec = rand.choice([0, 8, 18])
+        assert outcome(validate_upgrade, content, dec) == outcome(old_upgrade, content, dec), \
+            content
+
+
+def test_cancel_nonce_lists_match_the_old_parser():
+    # the lists of plain ints skip literal_eval, anything else goes through it
+    nonces = ["[]", "[ ]", "[0]", "[-0]", "[1, 2]", "[1,2]", "[ 1 , 2 ]", "[1,]", "[007]", "[1_000]",
+              "[+1]", "[- 1]", "[-1, -2]", "[1.5]", "[1e3]", "[1, 'a']", "[[1]]", "[True]", "(1,)",
+              " [1]", "[1] ", "[1]\n", "[\n1]", "[\t1]", "[१]", "[0x1]", "[1 2]", "[,]", "[", "]", "",
+              "[" + "9" * 5000 + "]", "[" + "9" * 4000 + "]", str(list(range(1000))), 1, None, [1]]
+    for n in nonces:
+        content = {"tick": "ordi", "id": "1", "n": n}
+        assert outcome(validate_cancel, content) == outcome(old_cancel, content), n